@@ -90,6 +90,26 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'astrobase.wsgi.application'
 
+# the results of the ephemeris views are cached in memory (least recently used entries are culled),
+# MAX_ENTRIES keeps it small enough for a Raspberry Pi.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'ephemeris': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ephemeris',
+        'TIMEOUT': 24 * 3600,
+        'OPTIONS': {
+            'MAX_ENTRIES': 2000,
+            'CULL_FREQUENCY': 10,
+        },
+    },
+}
+
+# Cache-Control max-age (seconds) of the ephemeris views
+EPHEMERIS_CACHE_MAX_AGE = 3600
+
 REST_FRAMEWORK = {
     # Use Django's standard `django.contrib.auth` permissions,
     # or allow read-only access for unauthenticated users.
@@ -191,6 +211,18 @@ LOGGING = {
             'handlers': ['my_handler','my_file_handler','mail_admins'],
             'level': 'INFO',
         },
+        'transients_app': {
+            'handlers': ['my_handler', 'mail_admins'],
+            'level': 'INFO',
+        },
+        'exoplanets': {
+            'handlers': ['my_handler', 'mail_admins'],
+            'level': 'INFO',
+        },
+        'starcharts_app': {
+            'handlers': ['my_handler', 'mail_admins'],
+            'level': 'INFO',
+        },
         'django': {
             'handlers': ['console', 'mail_admins'],
             'level': 'INFO',
@@ -242,10 +274,46 @@ REPOSITORY_ROOT = '/shared/repository'
 MY_ASTEROIDS_URL = os.path.join(BACKEND_HOST, 'astrobase/repository/asteroids.txt')
 MY_ASTEROIDS_ROOT = "/shared/repository/asteroids.txt"
 
+# the complete MPCORB file (all ~1.3M asteroids) for the vectorized ephemeris,
+# when it is not there, the 1000 asteroids of MY_ASTEROIDS_ROOT are used
+MY_MPCORB_ROOT = "/shared/repository/MPCORB.DAT"
+
+# allowed difference (arcsec) between the vectorized ephemeris and get_asteroid()
+ASTEROID_EPHEMERIS_TOLERANCE = 1.0
+
+# Minor Planet Center web service, can be pointed to a local stand-in to work offline
+MPC_WEBSERVICE_URL = "https://minorplanetcenter.net/web_service/search_orbits"
+MPC_WEBSERVICE_TIMEOUT = 10
+# responses are kept for a week, older ones are served while they are refreshed in the background
+MPC_WEBSERVICE_TTL = 7 * 24 * 3600
+MPC_WEBSERVICE_CACHE_ROOT = "/shared/repository/mpc_webservice"
+
+# local snapshot of the comet elements of the Minor Planet Center (refreshed daily)
+MY_COMETS_ROOT = "/shared/repository/comets.npz"
+
+# precomputed Chebyshev ephemeris of planets, bright moons and asteroids
+MY_EPHEMERIS_GRID_ROOT = "/shared/repository/ephemeris_grid.npz"
+
 #MY_HIPPARCOS_URL = "https://uilennest.net/astrobase/repository/hip_main.dat"
 MY_HIPPARCOS_URL = os.path.join(BACKEND_HOST, 'astrobase/repository/hip_main.dat')
 MY_HIPPARCOS_ROOT = "/shared/repository/hip_main.dat"
 
+# the constellation lines of Stellarium
+MY_CONSTELLATIONS_URL = "https://raw.githubusercontent.com/Stellarium/stellarium/master/skycultures/western_SnT/constellationship.fab"
+MY_CONSTELLATIONS_ROOT = "/shared/repository/constellationship.fab"
+
+# hipparcos and the constellation lines preprocessed into numpy files for the starmaps
+MY_STAR_CATALOG_ROOT = "/shared/repository/star_catalog"
+
+# the rendered starmaps are kept in MEDIA_ROOT/starmaps, the least recently used are removed beyond this size
+STARMAP_CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+# the starmaps are rendered by a pool of background processes, which are replaced after a number of
+# starmaps and cannot use more (virtual) memory than the limit
+STARMAP_RENDER_WORKERS = 1
+STARMAP_RENDER_TASKS_PER_WORKER = 20
+STARMAP_RENDER_MAX_MEMORY_MB = 1024
+
 #MY_EXOPLANETS_URL = "https://uilennest.net/astrobase/repository/exoplanets.csv"
 MY_EXOPLANETS_URL = os.path.join(BACKEND_HOST, 'astrobase/repository/exoplanets.csv')
 MY_EXOPLANETS_ROOT = "/shared/repository/exoplanets.csv"
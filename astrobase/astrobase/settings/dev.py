@@ -34,11 +34,24 @@ LOGOUT_REDIRECT_URL = "http://localhost:3000/astroview/logout"
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
-    }
+    },
+    'ephemeris': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ephemeris',
+        'OPTIONS': {
+            'MAX_ENTRIES': 2000,
+        },
+    },
 }
 
 MY_ASTEROIDS_ROOT = "asteroids.txt"
+MY_MPCORB_ROOT = "MPCORB.DAT"
+MY_COMETS_ROOT = "comets.npz"
+MPC_WEBSERVICE_CACHE_ROOT = "mpc_webservice"
+MY_EPHEMERIS_GRID_ROOT = "ephemeris_grid.npz"
 MY_HIPPARCOS_ROOT = "hip_main.dat"
+MY_CONSTELLATIONS_ROOT = "constellationship.fab"
+MY_STAR_CATALOG_ROOT = "star_catalog"
 MY_EXOPLANETS_ROOT = "exoplanets.csv"
 MY_HYG_ROOT = "hygdata.sqlite3"
 MY_STARLABELS_ROOT = "starlabels.sqlite3"
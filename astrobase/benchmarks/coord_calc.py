@@ -0,0 +1,161 @@
+# compare the numpy CoordCalc with the original per-star implementation (ScalarCoordCalc below),
+# both for speed and for the coordinates they produce:
+#
+#   python manage.py shell -c "from benchmarks.coord_calc import benchmark_coord_calc; benchmark_coord_calc()"
+#
+# ScalarCoordCalc is also the reference of the CoordCalc test in starcharts_app/tests.py
+
+import time
+from math import sin, cos, radians
+from types import SimpleNamespace
+import numpy as np
+
+from starcharts_app.starchart.coord_calc import CoordCalc
+from starcharts_app.starchart.sky_area import ConeToSkyArea
+from starcharts_app.starchart.star_data import StarData, StarDataList
+
+
+class ObjectList:
+    # the original StarDataList: a list of StarData objects
+    def __init__(self, data):
+        self.data = data
+        self.min_x = self.max_x = self.min_y = self.max_y = None
+
+
+class ScalarCoordCalc(CoordCalc):
+    """
+    the original pipeline, which computes every star with math.sin/cos (on ObjectLists)
+    """
+    def _dec_to_angle(self, dec):
+        return radians(dec)
+
+    def _angle_to_xy(self, ra_angle, dec_angle):
+        delta_ra = ra_angle - self.center_ra_angle
+        x = cos(dec_angle) * sin(delta_ra)
+        y = sin(dec_angle) * cos(self.center_dec_angle) - cos(dec_angle) * cos(delta_ra) * sin(self.center_dec_angle)
+        return x,y
+
+    def _populate_angles(self):
+        for star_data in self.star_data_list.data + self.star_label_list.data:
+            star_data.ra_angle  = self._ra_to_angle(star_data.ra)
+            star_data.dec_angle = self._dec_to_angle(star_data.dec)
+
+    def _populate_xy(self):
+        for star_data in self.star_data_list.data + self.star_label_list.data:
+            star_data.x, star_data.y = self._angle_to_xy(star_data.ra_angle, star_data.dec_angle)
+
+    def _offset_and_scale_xy(self):
+        min_x = min([sd.x for sd in self.star_data_list.data])
+        min_y = min([sd.y for sd in self.star_data_list.data])
+        max_x = max([sd.x for sd in self.star_data_list.data])
+        max_y = max([sd.y for sd in self.star_data_list.data])
+
+        self.magnification = self.diagram_size / max(max_x - min_x, max_y - min_y)
+
+        def offset_and_scale_x(x):
+            return (x - min_x) * self.magnification
+
+        def offset_and_scale_y(y):
+            return (y - min_y) * self.magnification
+
+        def offset_and_scale(star_data):
+            star_data.x = offset_and_scale_x(star_data.x)
+            star_data.y = offset_and_scale_y(star_data.y)
+
+        for star_list in (self.star_data_list, self.star_label_list):
+            star_list.min_x = offset_and_scale_x(min_x)
+            star_list.min_y = offset_and_scale_y(min_y)
+            star_list.max_x = offset_and_scale_x(max_x)
+            star_list.max_y = offset_and_scale_y(max_y)
+        self.offset_and_scale_x = offset_and_scale_x
+        self.offset_and_scale_y = offset_and_scale_y
+        list(map(offset_and_scale, self.star_data_list.data))
+        list(map(offset_and_scale, self.star_label_list.data))
+
+    def _rotate_xy(self):
+        def rotate_xy_around_center(star_data):
+            s = sin(radians(-self.starchart.rotation))
+            c = cos(radians(-self.starchart.rotation))
+            ox = self.starchart.display_width/2
+            oy = self.starchart.display_height/2
+
+            star_data.x -= ox
+            star_data.y -= oy
+            star_data.x = c * star_data.x - s * star_data.y
+            star_data.y = s * star_data.x + c * star_data.y
+            star_data.x += ox
+            star_data.y += oy
+        list(map(rotate_xy_around_center, self.star_data_list.data))
+
+    def calc_ra_curve(self, ra, steps):
+        dec_step = (self.area.dec_max - self.area.dec_min) / steps
+        return [self._ra_dec_to_x_y(ra, self.area.dec_min + dec_step * i) for i in range(steps+1)]
+
+    def calc_dec_curve(self, dec, steps):
+        ra_step = (self.area.ra_max - self.area.ra_min) / steps
+        return [self._ra_dec_to_x_y(self.area.ra_min + ra_step * i, dec) for i in range(steps+1)]
+
+
+def _best_time(function, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def benchmark_coord_calc(nr_of_stars=100000, nr_of_labels=1000, rotation=15, repeat=3):
+    """
+    project the same random stars with both implementations, print and return the timings and the
+    largest difference between their coordinates
+    """
+    starchart = SimpleNamespace(diagram_size=500, rotation=rotation, display_width=500, display_height=500)
+    area = ConeToSkyArea(83.8, -5.4, 10, 10, 12)
+
+    rng = np.random.default_rng(42)
+    def random_stars(n):
+        ra = rng.uniform(area.ra_min, area.ra_max, n).tolist()
+        dec = rng.uniform(area.dec_min, area.dec_max, n).tolist()
+        mag = rng.uniform(-1.5, area.mag_min, n).tolist()
+        return [StarData(*star) for star in zip(ra, dec, mag)]
+    stars = random_stars(nr_of_stars)
+    labels = random_stars(nr_of_labels)
+
+    # the numpy version gets its stars as columns, like from query_stars()
+    star_columns = StarDataList(stars)
+    label_columns = StarDataList(labels)
+    def columns(star_data_list):
+        return StarDataList.from_columns(star_data_list.ra, star_data_list.dec, star_data_list.mag,
+                                         star_data_list.label_index, star_data_list.labels)
+
+    def run_scalar():
+        cc = ScalarCoordCalc(starchart, ObjectList([StarData(s.ra, s.dec, s.mag) for s in stars]),
+                             ObjectList([StarData(s.ra, s.dec, s.mag) for s in labels]), None, area)
+        cc.process()
+        return cc, cc.calc_curves()
+
+    def run_numpy():
+        cc = CoordCalc(starchart, columns(star_columns), columns(label_columns), None, area)
+        cc.process()
+        return cc, cc.calc_curves()
+
+    scalar, scalar_curves = run_scalar()
+    vectorized, vectorized_curves = run_numpy()
+
+    difference = max(
+        np.abs(np.array([s.x for s in scalar.star_data_list.data]) - vectorized.star_data_list.x).max(),
+        np.abs(np.array([s.y for s in scalar.star_data_list.data]) - vectorized.star_data_list.y).max(),
+        np.abs(np.array([s.x for s in scalar.star_label_list.data]) - vectorized.star_label_list.x).max(),
+        np.abs(np.array(sum(scalar_curves, [])) - np.array(sum(vectorized_curves, []))).max(),
+    )
+
+    result = {
+        'nr_of_stars': nr_of_stars,
+        'scalar_seconds': _best_time(run_scalar, repeat),
+        'numpy_seconds': _best_time(run_numpy, repeat),
+        'max_difference': float(difference),
+    }
+    print(f"CoordCalc for {nr_of_stars} stars: {result['scalar_seconds'] * 1000:.1f} ms (per star) -> "
+          f"{result['numpy_seconds'] * 1000:.1f} ms (numpy), largest difference {difference:.2e} (diagram units)")
+    return result
@@ -0,0 +1,86 @@
+# Generated by Django 5.0.9 on 2026-10-18 08:51
+
+from django.db import migrations, models
+
+
+def clear_non_numeric_values(apps, schema_editor):
+    # empty strings (and other non-numbers) cannot be converted to a float column
+    Exoplanet = apps.get_model('exoplanets', 'Exoplanet')
+    for exoplanet in Exoplanet.objects.all():
+        changed = False
+        for field in ('sy_dist', 'sy_vmag'):
+            try:
+                float(getattr(exoplanet, field))
+            except (TypeError, ValueError):
+                if getattr(exoplanet, field) is not None:
+                    setattr(exoplanet, field, None)
+                    changed = True
+        if changed:
+            exoplanet.save(update_fields=['sy_dist', 'sy_vmag'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exoplanets', '0008_auto_20210703_1628'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_non_numeric_values, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='exoplanet',
+            name='sy_dist',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='exoplanet',
+            name='sy_vmag',
+            field=models.FloatField(null=True),
+        ),
+        # room for the longer names of the archive, like 'Transiting Exoplanet Survey Satellite (TESS)'
+        migrations.AlterField(
+            model_name='exoplanet',
+            name='pl_name',
+            field=models.CharField(max_length=50, unique=True, verbose_name='Planet Name'),
+        ),
+        migrations.AlterField(
+            model_name='exoplanet',
+            name='hostname',
+            field=models.CharField(max_length=50, null=True, verbose_name='Host Name'),
+        ),
+        migrations.AlterField(
+            model_name='exoplanet',
+            name='hd_name',
+            field=models.CharField(max_length=30, null=True, verbose_name='HD ID'),
+        ),
+        migrations.AlterField(
+            model_name='exoplanet',
+            name='hip_name',
+            field=models.CharField(max_length=30, null=True, verbose_name='HIP ID'),
+        ),
+        migrations.AlterField(
+            model_name='exoplanet',
+            name='tic_name',
+            field=models.CharField(max_length=30, null=True, verbose_name='TESS ID'),
+        ),
+        migrations.AlterField(
+            model_name='exoplanet',
+            name='gaia_name',
+            field=models.CharField(max_length=50, null=True, verbose_name='GAIA ID'),
+        ),
+        migrations.AlterField(
+            model_name='exoplanet',
+            name='disc_facility',
+            field=models.CharField(max_length=100, null=True, verbose_name='Discovery Facility'),
+        ),
+        migrations.AlterField(
+            model_name='exoplanet',
+            name='soltype',
+            field=models.CharField(max_length=50, null=True, verbose_name='Solution Type'),
+        ),
+        migrations.AlterField(
+            model_name='exoplanet',
+            name='st_spectype',
+            field=models.CharField(max_length=30, null=True, verbose_name='Spectral Type'),
+        ),
+    ]
@@ -1,58 +1,110 @@
+import time
+import logging
+import numpy as np
+import pandas as pd
 from django.conf import settings
+from django.db import transaction
 from ..models import Exoplanet
 
+logger = logging.getLogger(__name__)
+
+# the columns of exoplanets.csv (NASA Exoplanet Archive, Planetary Systems table)
+# that are read into the Exoplanet table. The column names are the field names of the model.
+TEXT_COLUMNS = ['pl_name', 'hostname', 'pl_letter', 'hd_name', 'hip_name', 'tic_name', 'gaia_name',
+                'disc_facility', 'soltype', 'pl_rade', 'pl_bmasse', 'st_spectype']
+INTEGER_COLUMNS = ['sy_snum', 'sy_pnum', 'disc_year']
+FLOAT_COLUMNS = ['ra', 'dec', 'sy_dist', 'sy_vmag']
+COLUMNS = TEXT_COLUMNS + INTEGER_COLUMNS + FLOAT_COLUMNS
+
+
+def _max_lengths():
+    return {field.name: field.max_length for field in Exoplanet._meta.get_fields()
+            if getattr(field, 'max_length', None)}
+
+
+def read_exoplanet_chunks(filename, chunk_size=2000):
+    """
+    read the needed columns of exoplanets.csv in chunks,
+    yield (list of Exoplanet objects, rejected counts, truncated counts per column)
+    """
+    max_lengths = _max_lengths()
+    seen = set()
+
+    reader = pd.read_csv(filename, comment='#', usecols=COLUMNS, dtype=str,
+                         keep_default_na=False, chunksize=chunk_size)
+
+    for chunk in reader:
+        rejected = {'not_confirmed': 0, 'duplicate': 0, 'no_coordinates': 0}
+        truncated = {}
+
+        # only read confirmed planets
+        confirmed = chunk['soltype'].str.contains('Confirmed')
+        rejected['not_confirmed'] = int((~confirmed).sum())
+        chunk = chunk[confirmed]
+
+        # values that do not fit in their field are cut off (sqlite never checked max_length,
+        # so the planet was always imported)
+        columns = {}
+        for column in TEXT_COLUMNS:
+            values = chunk[column]
+            too_long = values.str.len() > max_lengths[column]
+            if too_long.any():
+                truncated[column] = int(too_long.sum())
+            columns[column] = values.str.slice(0, max_lengths[column])
+
+        numbers = {column: pd.to_numeric(chunk[column], errors='coerce')
+                   for column in INTEGER_COLUMNS + FLOAT_COLUMNS}
+
+        # the first row of a planet is used, just like when pl_name was 'unique' on save.
+        # A row without coordinates is not imported, so it does not hide a later row of the same planet.
+        names = columns['pl_name']
+        positions = np.arange(len(chunk))
+        has_coordinates = (numbers['ra'].notna() & numbers['dec'].notna()).to_numpy()
+        first = ~names[has_coordinates].duplicated().to_numpy()
+        accepted = has_coordinates & ~names.isin(seen).to_numpy()
+        accepted[has_coordinates] &= first
+
+        accepted_at = pd.Series(positions[accepted], index=names[accepted].to_numpy())
+        duplicate = ~accepted & (names.isin(seen).to_numpy() | (names.map(accepted_at) < positions).to_numpy())
+        rejected['duplicate'] = int(duplicate.sum())
+        rejected['no_coordinates'] = int((~accepted & ~duplicate).sum())
+        seen.update(names[accepted])
+
+        values = {}
+        for column in TEXT_COLUMNS:
+            values[column] = [value or None for value in columns[column][accepted]]
+        for column in INTEGER_COLUMNS:
+            values[column] = [None if pd.isna(value) else int(value) for value in numbers[column][accepted]]
+        for column in FLOAT_COLUMNS:
+            values[column] = [None if pd.isna(value) else float(value) for value in numbers[column][accepted]]
+
+        exoplanets = [Exoplanet(**dict(zip(values, row))) for row in zip(*values.values())]
+
+        yield exoplanets, rejected, truncated
+
+
 def update_exoplanet_table():
+    """
+    read exoplanets.csv into the Exoplanet table.
+    The file is parsed into a staging list first, then the table is replaced in a single transaction
+    with bulk_create, so the table is never empty for the other requests.
+    """
+    start = time.time()
+
+    staging = []
+    rejected = {}
+    truncated = {}
+    for exoplanets, chunk_rejected, chunk_truncated in read_exoplanet_chunks(settings.MY_EXOPLANETS_ROOT):
+        staging.extend(exoplanets)
+        for reason, count in chunk_rejected.items():
+            rejected[reason] = rejected.get(reason, 0) + count
+        for column, count in chunk_truncated.items():
+            truncated[column] = truncated.get(column, 0) + count
+
+    with transaction.atomic():
+        Exoplanet.objects.all().delete()
+        Exoplanet.objects.bulk_create(staging, batch_size=1000)
 
-    # clear asteroid table
-    Exoplanet.objects.all().delete()
-
-    with open(settings.MY_EXOPLANETS_ROOT, "r") as f:
-        line = f.readline()
-
-        while line != '':  # The EOF char is an empty string
-
-            # skip comments
-            if line.startswith('#'):
-                line = f.readline()
-                continue
-
-            # also skip header
-            if line.startswith('rowid'):
-                line = f.readline()
-                continue
-
-            # only read confirmed planets
-            if not 'Confirmed' in line:
-                line = f.readline()
-                continue
-
-            list = line.split(',')
-
-            exoplanet = Exoplanet(
-                pl_name=list[1],
-                hostname=list[2],
-                pl_letter= list[3],
-                hd_name = list[4],
-                hip_name=list[5],
-                tic_name=list[6],
-                gaia_name=list[7],
-                sy_snum=list[9],
-                sy_pnum=list[10],
-                disc_year=list[14],
-                disc_facility=list[18],
-                soltype=list[31],
-                pl_rade=list[42],
-                pl_bmasse=list[50],
-                st_spectype=list[154],
-                ra=list[202],
-                dec=list[204],
-                sy_dist=list[218],
-                sy_vmag=list[227],
-            )
-
-            try:
-                exoplanet.save()
-                print(list[0], list[1])
-            except:
-                pass
-            line = f.readline()
\ No newline at end of file
+    duration = time.time() - start
+    logger.info(f'{len(staging)} exoplanets loaded in {duration:.1f}s, rejected: {rejected}, truncated: {truncated}')
+    return len(staging), rejected, truncated
@@ -1,3 +1,85 @@
-from django.test import TestCase
+import os
+import tempfile
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+
+from .models import Exoplanet
+from .services import algorithms
+
+HEADER = 'pl_name,hostname,pl_letter,hd_name,hip_name,tic_name,gaia_name,sy_snum,sy_pnum,disc_year,' \
+         'disc_facility,soltype,pl_rade,pl_bmasse,ra,dec,sy_dist,sy_vmag,st_spectype,extra_column\n'
+
+ROWS = [
+    # a TESS discovery, the facility is longer than the old max_length of 30
+    'TOI-700 d,TOI-700,d,,,TIC 150428135,Gaia DR2 5284517766615492736,1,4,2020,'
+    'Transiting Exoplanet Survey Satellite (TESS),Published Confirmed,1.14,1.72,97.09,-65.58,31.12,13.15,M2 V,x\n',
+    # an OGLE host with a name longer than the old max_length of 15
+    'OGLE-2019-BLG-0468L b,OGLE-2019-BLG-0468L,b,,,,,1,2,2022,OGLE,Published Confirmed,,,268.1,-29.7,,,,x\n',
+    # the second row of a planet is a duplicate
+    'TOI-700 d,TOI-700,d,,,,,1,4,2020,TESS,Published Confirmed,,,97.09,-65.58,,,,x\n',
+    'K2-18 b,K2-18,b,,,,,1,2,2015,K2,Planetary Candidate,,,172.56,7.59,,,,x\n',
+    'No Coordinates b,No Coordinates,b,,,,,1,1,2015,K2,Published Confirmed,,,,,,,,x\n',
+    # a value that is too long even for the wider field is cut off, the planet is still imported
+    'Long Facility b,Long Facility,b,,,,,1,1,2015,' + 'F' * 120 + ',Published Confirmed,,,10,20,null,,,x\n',
+]
+
+
+@override_settings(MY_EXOPLANETS_ROOT=os.path.join(tempfile.gettempdir(), 'test_exoplanets.csv'))
+class ExoplanetImportTest(TestCase):
+
+    def setUp(self):
+        from django.conf import settings
+        with open(settings.MY_EXOPLANETS_ROOT, 'w') as f:
+            f.write('# NASA Exoplanet Archive\n' + HEADER + ''.join(ROWS))
+
+    def tearDown(self):
+        from django.conf import settings
+        os.remove(settings.MY_EXOPLANETS_ROOT)
+
+    def test_read_chunks(self):
+        from django.conf import settings
+        exoplanets, rejected, truncated = [], {}, {}
+        # chunks of 2 rows, a duplicate must also be found across chunks
+        for chunk, chunk_rejected, chunk_truncated in algorithms.read_exoplanet_chunks(settings.MY_EXOPLANETS_ROOT, 2):
+            exoplanets.extend(chunk)
+            for reason, count in chunk_rejected.items():
+                rejected[reason] = rejected.get(reason, 0) + count
+            truncated.update(chunk_truncated)
+
+        self.assertEqual([e.pl_name for e in exoplanets], ['TOI-700 d', 'OGLE-2019-BLG-0468L b', 'Long Facility b'])
+        self.assertEqual(rejected, {'not_confirmed': 1, 'duplicate': 1, 'no_coordinates': 1})
+        self.assertEqual(truncated, {'disc_facility': 1})
+
+        toi, ogle, long_facility = exoplanets
+        self.assertEqual(toi.disc_facility, 'Transiting Exoplanet Survey Satellite (TESS)')
+        self.assertEqual(toi.sy_vmag, 13.15)
+        self.assertEqual(toi.disc_year, 2020)
+        self.assertEqual(ogle.hostname, 'OGLE-2019-BLG-0468L')
+        self.assertIsNone(ogle.sy_dist)
+        self.assertIsNone(ogle.hd_name)
+        self.assertEqual(long_facility.disc_facility, 'F' * 100)
+        self.assertIsNone(long_facility.sy_dist)
+
+    def test_update_replaces_table(self):
+        Exoplanet.objects.create(pl_name='old planet', ra=1, dec=2)
+
+        count, rejected, truncated = algorithms.update_exoplanet_table()
+
+        self.assertEqual(count, 3)
+        self.assertEqual(sorted(Exoplanet.objects.values_list('pl_name', flat=True)),
+                         ['Long Facility b', 'OGLE-2019-BLG-0468L b', 'TOI-700 d'])
+        self.assertEqual(Exoplanet.objects.get(pl_name='TOI-700 d').tic_name, 'TIC 150428135')
+
+    def test_row_without_coordinates_does_not_hide_the_planet(self):
+        from django.conf import settings
+        with open(settings.MY_EXOPLANETS_ROOT, 'w') as f:
+            f.write(HEADER)
+            f.write('TOI-700 d,TOI-700,d,,,,,1,4,2020,TESS,Published Confirmed,,,,,,,,x\n')
+            f.write('TOI-700 d,TOI-700,d,,,,,1,4,2020,TESS,Published Confirmed,,,97.09,-65.58,,,,x\n')
+            f.write('TOI-700 d,TOI-700,d,,,,,1,4,2020,TESS,Published Confirmed,,,,,,,,x\n')
+
+        chunks = list(algorithms.read_exoplanet_chunks(settings.MY_EXOPLANETS_ROOT))
+        self.assertEqual(len(chunks), 1)
+        exoplanets, rejected, truncated = chunks[0]
+        self.assertEqual([(e.pl_name, e.ra, e.dec) for e in exoplanets], [('TOI-700 d', 97.09, -65.58)])
+        self.assertEqual(rejected, {'not_confirmed': 0, 'duplicate': 1, 'no_coordinates': 1})
@@ -50,6 +50,5 @@ class UpdateExoplanets(generics.ListAPIView):
     def list(self, request):
 
          # call to the business logic that returns a list of moonphase
-        algorithms.update_exoplanet_table()
-        count = Exoplanet.objects.all().count()
-        return Response({str(count)+" exoplanets updated"})
\ No newline at end of file
+        count, rejected, truncated = algorithms.update_exoplanet_table()
+        return Response({'updated': str(count)+" exoplanets updated", 'rejected': rejected, 'truncated': truncated})
\ No newline at end of file
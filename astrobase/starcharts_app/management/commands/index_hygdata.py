@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from starcharts_app.starchart.sqlite_pool import create_index
+
+
+class Command(BaseCommand):
+    help = "Create the position and magnitude index on the hygdata table of the sqlite star databases"
+
+    def add_arguments(self, parser):
+        parser.add_argument('db_files', nargs='*',
+                            help="the sqlite databases, default settings.MY_HYG_ROOT and settings.MY_STARLABELS_ROOT")
+
+    def handle(self, *args, **options):
+        db_files = options['db_files'] or [settings.MY_HYG_ROOT, settings.MY_STARLABELS_ROOT]
+        for db_file in db_files:
+            create_index(db_file)
+            self.stdout.write(f"hygdata_position created on {db_file}")
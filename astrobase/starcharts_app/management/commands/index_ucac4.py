@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from starcharts_app.starchart.ucac4_star_database import UCAC4StarDatabase, TIER_INDEX
+
+
+class Command(BaseCommand):
+    help = "Create the magnitude tier index on the stars table of the UCAC4 database (takes minutes)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cluster', action='store_true',
+                            help="also order the stars table by the index (slow, locks the table)")
+
+    def handle(self, *args, **options):
+        ucac4_db = UCAC4StarDatabase(settings.UCAC4_HOST,
+                                     settings.UCAC4_PORT,
+                                     settings.UCAC4_DATABASE,
+                                     settings.UCAC4_USER,
+                                     settings.UCAC4_PASSWORD)
+        ucac4_db.create_tier_index(cluster=options['cluster'])
+        self.stdout.write(f"{TIER_INDEX} created on {settings.UCAC4_DATABASE}")
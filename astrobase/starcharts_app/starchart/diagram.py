@@ -1,6 +1,5 @@
 
-from .svg import Svg
-import codecs
+from .svg import Svg, chunks, gzip_chunks, write_svg
 import json
 
 MARGIN_X=0
@@ -33,21 +32,25 @@ class Diagram:
     def _invert_and_offset(self, x, y):
         return x + MARGIN_X, (self.star_data_list.max_y - y) + MARGIN_Y
 
-    def render_svg(self, outfile):
+    def svg_elements(self):
+        """
+        the elements of the svg one by one, so that they never have to be in memory all at once
+        """
         svg = Svg(self.starchart.background)
+        yield svg.header()
 
         # add stars first
-        for star_data in self.star_data_list.data:
+        for star_data in self.star_data_list:
             x, y = self._invert_and_offset(star_data.x, star_data.y)
-            svg.circle(x, y, self._mag_to_d(star_data.mag), self.starchart.star_color)
+            yield svg.circle(x, y, self._mag_to_d(star_data.mag), self.starchart.star_color)
 
         # next add labels
-        for label_data in self.star_label_list.data:
+        for label_data in self.star_label_list:
             if label_data.label:
                 x, y = self._invert_and_offset(label_data.x, label_data.y)
                 d = self._mag_to_d(label_data.mag)
-                svg.text(x + LABEL_OFFSET_X + d / 2, y + LABEL_OFFSET_Y, label_data.label, self.starchart.font_color,
-                         self.starchart.font_size)
+                yield svg.text(x + LABEL_OFFSET_X + d / 2, y + LABEL_OFFSET_Y, label_data.label, self.starchart.font_color,
+                               self.starchart.font_size)
 
         # add additional elements from the 'extra' field
         if self.plot_data_list:
@@ -56,21 +59,21 @@ class Diagram:
                 d = self._mag_to_d(plot_data.size)
 
                 if plot_data.shape == "circle":
-                    svg.circle(x, y, d, plot_data.color)
+                    yield svg.circle(x, y, d, plot_data.color)
 
                 if plot_data.shape == "circle_outline":
-                    svg.circle_outline(x, y, d, plot_data.color)
+                    yield svg.circle_outline(x, y, d, plot_data.color)
 
                 if plot_data.shape == "cross":
-                    svg.circle(x, y, d, plot_data.color)
+                    yield svg.circle(x, y, d, plot_data.color)
 
                 if plot_data.label:
                     x, y = self._invert_and_offset(plot_data.x, plot_data.y)
-                    svg.text(x + LABEL_OFFSET_X, y + LABEL_OFFSET_Y, plot_data.label, plot_data.color, self.starchart.font_size)
+                    yield svg.text(x + LABEL_OFFSET_X, y + LABEL_OFFSET_Y, plot_data.label, plot_data.color, self.starchart.font_size)
 
         # next add curves
         for curve_points in self.curves:
-            svg.curve([self._invert_and_offset(cp[0], cp[1]) for cp in curve_points], self.starchart.curve_width, self.starchart.curve_color)
+            yield svg.curve([self._invert_and_offset(cp[0], cp[1]) for cp in curve_points], self.starchart.curve_width, self.starchart.curve_color)
 
         # title
         #center_x = self.star_data_list.max_x/2 + MARGIN_X
@@ -81,4 +84,18 @@ class Diagram:
         #svg.text(center_x, chart_bottom_y + MARGIN_Y/2, "RA: {}-{}".format(self.area.ra_min, self.area.ra_max), COORDS_COLOUR, COORDS_SIZE, 'middle')
         #svg.text(center_x, chart_bottom_y + MARGIN_Y/2 + COORDS_SIZE, "Dec: {}-{}".format(self.area.dec_min, self.area.dec_max), COORDS_COLOUR, COORDS_SIZE, 'middle')
 
-        codecs.open(outfile, 'w', 'utf-8').writelines(svg.to_list())
+        yield svg.footer()
+
+    def render_svg(self, outfile):
+        """
+        write the svg to outfile, gzipped when outfile is an .svgz file
+        """
+        write_svg(self.svg_elements(), outfile)
+
+    def stream_svg(self, gzipped=False):
+        """
+        the svg in chunks, for a StreamingHttpResponse (with Content-Encoding: gzip when gzipped)
+        """
+        if gzipped:
+            return gzip_chunks(chunks(self.svg_elements()))
+        return (chunk.encode('utf-8') for chunk in chunks(self.svg_elements()))
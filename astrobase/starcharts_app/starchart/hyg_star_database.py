@@ -1,15 +1,48 @@
 import sqlite3
+import numpy as np
 from sqlite3 import Error
 
-from ..models import Stars
+from ..models import Stars, LABEL_CHOICES
 from .star_data import StarData, StarDataList
+from .sqlite_pool import get_connection
+
+# the label_field is a column name, which cannot be a bound parameter
+LABEL_FIELDS = [field for field, _ in LABEL_CHOICES]
+
+
+def query_stars(conn, sky_area, label_field='BayerFlamsteed', labelled=False):
+    """
+    the stars of the hygdata table in the sky_area that are brighter than its magnitude limit
+    (smaller mag values mean brighter stars), as a StarDataList.
+    labelled=True only returns the stars that have a label_field.
+    """
+    if label_field not in LABEL_FIELDS:
+        raise ValueError(f"unknown label field '{label_field}'")
+
+    # the (Declination, RightAscension, Magnitude) index of index_hygdata limits this to the declination band
+    query = ("SELECT RightAscension,Declination,Magnitude," + label_field + " FROM hygdata "
+             "WHERE Declination BETWEEN ? AND ? AND RightAscension BETWEEN ? AND ? AND Magnitude <= ?")
+    if labelled:
+        query += " AND " + label_field + " != ''"
+
+    rows = conn.execute(query, (sky_area.dec_min, sky_area.dec_max, sky_area.ra_min, sky_area.ra_max,
+                                sky_area.mag_min)).fetchall()
+
+    labels = {}
+    ra = np.array([row[0] for row in rows], dtype=float)
+    dec = np.array([row[1] for row in rows], dtype=float)
+    mag = np.array([row[2] for row in rows], dtype=float)
+    label_index = np.array([labels.setdefault(row[3], len(labels)) if row[3] else -1 for row in rows],
+                           dtype=np.int32)
+    return StarDataList.from_columns(ra, dec, mag, label_index, list(labels))
+
 
 class HygStarDatabase:
     def __init__(self, db_file):
 
         self.conn = None
         try:
-            self.conn = sqlite3.connect(db_file)
+            self.conn = get_connection(db_file)
         except Error as e:
             print(e)
 
@@ -17,33 +50,10 @@ class HygStarDatabase:
     def get_stars(self, sky_area):
 
             """
-            Query all rows in the tasks table
-            :param conn: the Connection object
-            :return:
+            Query the stars in the sky_area that are brighter than its magnitude limit
+            (smaller mag values mean brighter stars)
             """
-            cur = self.conn.cursor()
-            cur.execute("SELECT RightAscension,Declination,Magnitude,BayerFlamsteed FROM hygdata")
-
-            rows = cur.fetchall()
-
-            results = []
-
-            for row in rows:
-                ra = row[0]
-                dec = row[1]
-                mag = row[2]
-                label = row[3]
-
-                if mag > sky_area.mag_min:  # because smaller mag values mean brighter stars
-                    continue
-                if not (sky_area.ra_min <= ra <= sky_area.ra_max):
-                    continue
-                if not (sky_area.dec_min <= dec <= sky_area.dec_max):
-                    continue
-
-                results.append(StarData(ra, dec, mag, label))
-
-            return StarDataList(results)
+            return query_stars(self.conn, sky_area)
 
 
     def import_stars(self):
@@ -1,6 +1,4 @@
 import os
-from pathlib import Path
-from django.core.files import File
 from django.conf import settings
 from ..models import StarChart, Scheme
 from .sky_area import SkyArea, ConeToSkyArea
@@ -14,15 +12,10 @@ from .plot_data import PlotData, PlotDataList
 
 
 
-def create_starchart(input_starchart):
-    try:
-        starchart = StarChart.objects.get(name=input_starchart.name)
-        # starchart.delete()
-    except Exception as e:
-        pass
-
-    starchart = input_starchart
-
+def get_star_lists(starchart):
+    """
+    the sky area of the starchart and the stars, labels and extra objects to draw on it
+    """
     if starchart.ra:
         area = ConeToSkyArea(starchart.ra,starchart.dec,starchart.radius_ra,starchart.radius_dec,starchart.magnitude_limit)
         starchart.ra_min = area.ra_min
@@ -46,7 +39,7 @@ def create_starchart(input_starchart):
                                      settings.UCAC4_PASSWORD)
         star_data_list = ucac4_db.get_stars(area,starchart.query_limit)
 
-    starchart.nr_of_stars = len(star_data_list.data)
+    starchart.nr_of_stars = len(star_data_list)
 
     # get star labels from the HYG database
     starlabels_db = StarLabelsDatabase(settings.MY_STARLABELS_ROOT)
@@ -58,11 +51,35 @@ def create_starchart(input_starchart):
     except:
         plot_data_list = None
 
+    return area, star_data_list, star_label_list, plot_data_list
+
+
+def create_diagram(starchart, area, star_data_list, star_label_list, plot_data_list):
+    """
+    calculate the coordinates of everything on the starchart and return the Diagram to render
+    """
     cc = CoordCalc(starchart,
                    star_data_list,
                    star_label_list,
                    plot_data_list,
                    area)
+    cc.process()
+
+    d = Diagram(starchart, area, star_data_list, star_label_list, plot_data_list)
+    list(map(d.add_curve, cc.calc_curves()))
+    return d
+
+
+def create_starchart(input_starchart):
+    try:
+        starchart = StarChart.objects.get(name=input_starchart.name)
+        # starchart.delete()
+    except Exception as e:
+        pass
+
+    starchart = input_starchart
+
+    area, star_data_list, star_label_list, plot_data_list = get_star_lists(starchart)
 
     # --------------------------------------------------------------------------------
     # create plot with matplotlib
@@ -72,29 +89,17 @@ def create_starchart(input_starchart):
     # --------------------------------------------------------------------------------
 
     try:
-        cc.process()
-
-        # create the diagram
-        d = Diagram(starchart, area, star_data_list, star_label_list, plot_data_list)
-        list(map(d.add_curve, cc.calc_curves()))
-
-        # generate the temporary image file
-        temp_path = os.path.join(settings.MEDIA_ROOT, 'starchart.svg')
-        d.render_svg(temp_path)
+        d = create_diagram(starchart, area, star_data_list, star_label_list, plot_data_list)
 
-        # delete existing file before uploading
+        # write the image straight into the file of the image field (replacing the previous one),
+        # through a temporary name so that a request never sees half an image
         my_filename = starchart.name + '.svg'
-        try:
-            existing_file = os.path.join(os.path.join(settings.MEDIA_ROOT, 'my_starmaps'), my_filename)
-            os.remove(existing_file)
-        except:
-            pass
-
-        # add the image to the StarChart object and database
-        path = Path(temp_path)
-        with path.open(mode='rb') as f:
-            starchart.image = File(f, name=my_filename)
-            starchart.save()
+        starchart.image.name = starchart.image.field.upload_to + '/' + my_filename
+        image_path = starchart.image.path
+        os.makedirs(os.path.dirname(image_path), exist_ok=True)
+        d.render_svg(image_path + '.tmp')
+        os.replace(image_path + '.tmp', image_path)
+        starchart.save()
 
         starchart_url_media = settings.MEDIA_URL + 'my_starmaps/' + my_filename
         if settings.DEBUG:
@@ -106,6 +111,19 @@ def create_starchart(input_starchart):
         return starchart, 'not enough stars to create a starchart of this area'
 
 
+def stream_starchart(starchart, gzipped=False):
+    """
+    render the svg of a (saved) starchart in chunks, without writing it to a file.
+    Raises a ValueError when the starchart cannot be drawn (too few stars, an unknown label field).
+    """
+    area, star_data_list, star_label_list, plot_data_list = get_star_lists(starchart)
+    if len(star_data_list) < 2:
+        raise ValueError('not enough stars to create a starchart of this area')
+
+    d = create_diagram(starchart, area, star_data_list, star_label_list, plot_data_list)
+    return d.stream_svg(gzipped)
+
+
 def construct_starcharts_list():
     results = ''
 
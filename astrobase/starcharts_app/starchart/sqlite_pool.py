@@ -0,0 +1,51 @@
+# pooled, read-only connections to the sqlite star databases (hygdata.sqlite3, starlabels.sqlite3).
+# Every thread keeps one connection per database file for as long as it lives. The databases are
+# memory-mapped and never written at runtime. 'python manage.py index_hygdata' adds an index on the
+# position and magnitude of the stars once, so that a small chart only reads the stars in its own declination band.
+
+import os
+import sqlite3
+import threading
+from urllib.parse import quote
+
+MMAP_SIZE = 256 * 1024 * 1024
+
+_local = threading.local()
+
+
+def create_index(db_file, table='hygdata'):
+    """
+    add the (Declination, RightAscension, Magnitude) index to the table of db_file.
+    This needs write access, it is done by the index_hygdata management command and never in a request.
+    """
+    if not os.path.exists(db_file):
+        raise sqlite3.OperationalError(f'{db_file} does not exist')
+
+    conn = sqlite3.connect(db_file)
+    try:
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {table}_position '
+                     f'ON {table} (Declination, RightAscension, Magnitude)')
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def get_connection(db_file):
+    """
+    the read-only connection of this thread to db_file
+    """
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    conn = connections.get(db_file)
+    if conn is None:
+        if not os.path.exists(db_file):
+            raise sqlite3.OperationalError(f'{db_file} does not exist')
+
+        uri = 'file:' + quote(os.path.abspath(db_file)) + '?mode=ro'
+        conn = sqlite3.connect(uri, uri=True)
+        conn.execute(f'PRAGMA mmap_size={MMAP_SIZE}')
+        connections[db_file] = conn
+
+    return conn
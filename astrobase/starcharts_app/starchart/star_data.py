@@ -1,3 +1,5 @@
+import numpy as np
+
 class StarData:
     def __init__(self, ra, dec, mag, label=None):
         self.ra    = ra
@@ -11,7 +13,79 @@ class StarData:
         self.x = None
         self.y = None
 
+
+# the columns of a StarDataList that can be read and written through a StarRow
+COLUMNS = ('ra', 'dec', 'mag', 'ra_angle', 'dec_angle', 'x', 'y')
+
+class StarRow:
+    """
+    one star of a StarDataList with the attributes of a StarData, which read and write the columns of the list
+    """
+    __slots__ = ('_list', '_index')
+
+    def __init__(self, star_data_list, index):
+        object.__setattr__(self, '_list', star_data_list)
+        object.__setattr__(self, '_index', index)
+
+    def __getattr__(self, name):
+        if name == 'label':
+            return self._list.label(self._index)
+        if name in COLUMNS:
+            return float(getattr(self._list, name)[self._index])
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        if name not in COLUMNS:
+            raise AttributeError(name)
+        getattr(self._list, name)[self._index] = value
+
+
 class StarDataList:
+    """
+    the stars as numpy columns: ra, dec, mag and label_index (into labels, -1 for no label).
+    ra_angle, dec_angle, x and y are filled in by CoordCalc.
+    The stars are also available as objects in data, like a list of StarData.
+    """
     def __init__(self, data):
-        self.data = data
-        self.min_x = self.max_x = self.min_y = self.max_y = None
\ No newline at end of file
+        labels = {}
+        self.ra = np.array([star_data.ra for star_data in data], dtype=float)
+        self.dec = np.array([star_data.dec for star_data in data], dtype=float)
+        self.mag = np.array([np.nan if star_data.mag is None else star_data.mag for star_data in data], dtype=float)
+        self.label_index = np.array([labels.setdefault(star_data.label, len(labels)) if star_data.label else -1
+                                     for star_data in data], dtype=np.int32)
+        self.labels = list(labels)
+        self._init_columns()
+
+    @classmethod
+    def from_columns(cls, ra, dec, mag, label_index, labels):
+        star_data_list = cls.__new__(cls)
+        star_data_list.ra = np.asarray(ra, dtype=float)
+        star_data_list.dec = np.asarray(dec, dtype=float)
+        star_data_list.mag = np.asarray(mag, dtype=float)
+        star_data_list.label_index = np.asarray(label_index, dtype=np.int32)
+        star_data_list.labels = labels
+        star_data_list._init_columns()
+        return star_data_list
+
+    def _init_columns(self):
+        n = len(self.ra)
+        self.ra_angle = np.full(n, np.nan)
+        self.dec_angle = np.full(n, np.nan)
+        self.x = np.full(n, np.nan)
+        self.y = np.full(n, np.nan)
+        self.min_x = self.max_x = self.min_y = self.max_y = None
+
+    def __len__(self):
+        return len(self.ra)
+
+    def __iter__(self):
+        # one StarRow at a time, without the list of data
+        return (StarRow(self, i) for i in range(len(self.ra)))
+
+    @property
+    def data(self):
+        return list(self)
+
+    def label(self, i):
+        index = self.label_index[i]
+        return self.labels[index] if index >= 0 else None
@@ -3,42 +3,19 @@ from sqlite3 import Error
 
 from ..models import Stars
 from .star_data import StarData, StarDataList
+from .sqlite_pool import get_connection
+from .hyg_star_database import query_stars, LABEL_FIELDS
 
 class StarLabelsDatabase:
     def __init__(self, db_file):
 
         self.conn = None
         try:
-            self.conn = sqlite3.connect(db_file)
+            self.conn = get_connection(db_file)
         except Error as e:
             print(e)
 
 
     def get_labels(self, sky_area, label_field):
 
-            cur = self.conn.cursor()
-            query = "SELECT RightAscension,Declination,Magnitude," + label_field + " FROM hygdata"
-            cur.execute(query)
-
-            rows = cur.fetchall()
-
-            results = []
-
-            for row in rows:
-                ra = row[0]
-                dec = row[1]
-                mag = row[2]
-                label = row[3]
-
-                if not label:
-                    continue
-                if mag > sky_area.mag_min:  # because smaller mag values mean brighter stars
-                    continue
-                if not (sky_area.ra_min <= ra <= sky_area.ra_max):
-                    continue
-                if not (sky_area.dec_min <= dec <= sky_area.dec_max):
-                    continue
-
-                results.append(StarData(ra, dec, mag, label))
-
-            return StarDataList(results)
+            return query_stars(self.conn, sky_area, label_field, labelled=True)
@@ -1,34 +1,53 @@
+import gzip
+import zlib
+
 XML_HEADER = '<?xml version="1.0" encoding="UTF-8" standalone="no"?>'
 #SVG_HEADER = '<svg style="background-color:black;" xmlns="http://www.w3.org/2000/svg" version="1.1">'
 SVG_FOOTER = '</svg>'
 
+# the number of decimals of the coordinates and sizes
+PRECISION = 2
+
+# the elements are written (or streamed) in chunks of about this size
+CHUNK_SIZE = 64 * 1024
+
+# the element methods return the formatted element, so that a Diagram can write them
+# one by one instead of collecting the whole drawing in memory
 class Svg:
-    def __init__(self,background):
+    def __init__(self, background, precision=PRECISION):
         self.background = background
+        self.number = '{:.' + str(precision) + 'f}'
 
         self.svg_header = '<svg style="background-color:'
         self.svg_header += self.background
         self.svg_header += ';" xmlns="http://www.w3.org/2000/svg" version="1.1">'
 
-        self.elements = []
+    def _n(self, value):
+        return self.number.format(value)
+
+    def header(self):
+        return XML_HEADER + self.svg_header
+
+    def footer(self):
+        return SVG_FOOTER
 
     def line(self, x1, y1, x2, y2, width, colour):
-        self.elements.append('<line x1="{}" y1="{}" x2="{}" y2="{}" stroke-width="{}" stroke="{}"/>'.format(x1, y1, x2, y2, width, colour))
+        return '<line x1="{}" y1="{}" x2="{}" y2="{}" stroke-width="{}" stroke="{}"/>'.format(self._n(x1), self._n(y1), self._n(x2), self._n(y2), width, colour)
 
     def text(self, x, y, l, colour, size, align='left', decoration='None'):
-        self.elements.append('<text x="{}" y="{}" text-anchor="{}" text-decoration="{}" style="fill: {}; font-size: {}px; font-family: monospace">{}</text>'.format(x, y, align, decoration, colour, size, l))
+        return '<text x="{}" y="{}" text-anchor="{}" text-decoration="{}" style="fill: {}; font-size: {}px; font-family: monospace">{}</text>'.format(self._n(x), self._n(y), align, decoration, colour, size, l)
 
     def circle(self, x, y, d, colour):
-        self.elements.append('<circle cx="{}" cy="{}" r="{}" fill="{}"/>'.format(x, y, d, colour))
+        return '<circle cx="{}" cy="{}" r="{}" fill="{}"/>'.format(self._n(x), self._n(y), self._n(d), colour)
 
     def circle_outline(self, x, y, d, colour):
-        self.elements.append('<circle cx="{}" cy="{}" r="{}" stroke="{}" fill-opacity="0"/>'.format(x, y, d, colour))
+        return '<circle cx="{}" cy="{}" r="{}" stroke="{}" fill-opacity="0"/>'.format(self._n(x), self._n(y), self._n(d), colour)
 
     def curve(self, _points, width, colour):
         points = sum(_points, ())
 
         # http://schepers.cc/getting-to-the-point
-        d = 'M {} {} '.format(points[0], points[1])
+        d = 'M {} {} '.format(self._n(points[0]), self._n(points[1]))
         i = 0
         iLen = len(points)
         while iLen - 2 > i:
@@ -57,9 +76,47 @@ class Svg:
             bp.append((((  p[1][0]  + 6*p[2][0] - p[3][0]) / 6), (  p[1][1]  + 6*p[2][1] - p[3][1]) / 6))
             bp.append((p[2][0], p[2][1]))
 
-            d += 'C {} {},{} {},{} {} '.format(bp[1][0], bp[1][1], bp[2][0], bp[2][1], bp[3][0], bp[3][1])
+            d += 'C {} {},{} {},{} {} '.format(*map(self._n, (bp[1][0], bp[1][1], bp[2][0], bp[2][1], bp[3][0], bp[3][1])))
+
+        return '<path d="{}" stroke="{}" stroke-width="{}" fill="transparent"/>'.format(d, colour, width)
+
+
+def chunks(elements, chunk_size=CHUNK_SIZE):
+    """
+    join the elements into strings of about chunk_size characters
+    """
+    chunk = []
+    size = 0
+    for element in elements:
+        chunk.append(element)
+        size += len(element)
+        if size >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        yield ''.join(chunk)
+
+
+def gzip_chunks(text_chunks):
+    """
+    gzip the chunks on the fly (for a streaming response with Content-Encoding: gzip)
+    """
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in text_chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
 
-        self.elements.append('<path d="{}" stroke="{}" stroke-width="{}" fill="transparent"/>'.format(d, colour, width))
 
-    def to_list(self):
-        return [XML_HEADER, self.svg_header] + self.elements + [SVG_FOOTER]
\ No newline at end of file
+def write_svg(elements, outfile):
+    """
+    write the elements to outfile, gzipped when it is an .svgz file
+    """
+    if outfile.endswith('.svgz'):
+        f = gzip.open(outfile, 'wt', encoding='utf-8')
+    else:
+        f = open(outfile, 'w', encoding='utf-8')
+    with f:
+        f.writelines(chunks(elements))
\ No newline at end of file
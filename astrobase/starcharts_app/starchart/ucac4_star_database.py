@@ -2,9 +2,22 @@ import psycopg2
 from psycopg2 import Error
 from ..utils import timeit
 import math
+import numpy as np
 
 from .star_data import StarData, StarDataList
 
+# The stars are read in magnitude tiers of TIER_SIZE millimag (j_mag is in millimag), brightest tier first.
+# The index below sorts the stars by tier and then by position, so that a tier of an area is one range
+# scan over the declination band of the area, and it includes all the queried columns (index-only scan).
+# It is created once, outside of the web server, with:  python manage.py index_ucac4 [--cluster]
+TIER_SIZE = 1000
+BRIGHTEST_TIER = -2
+
+TIER_INDEX = "stars_tier_position"
+CREATE_TIER_INDEX = "CREATE INDEX IF NOT EXISTS " + TIER_INDEX + \
+                    " ON public.stars ((j_mag / " + str(TIER_SIZE) + "), dec, ra) INCLUDE (j_mag)"
+
+
 class UCAC4StarDatabase:
     def __init__(self,host,port,database,user,password):
 
@@ -20,46 +33,79 @@ class UCAC4StarDatabase:
         except Error as e:
             print(e)
 
-    @timeit
-    def get_stars(self, sky_area, limit):
-
-            """
-            Query all rows in the tasks table
-            :param conn: the Connection object
-            :return:
-            """
-            cur = self.conn.cursor()
-            where = "ra > " + str(sky_area.ra_min) + " and "
-            where+= "ra < " + str(sky_area.ra_max) + " and "
-            where+= "dec > " + str(sky_area.dec_min) + " and "
-            where+= "dec < " + str(sky_area.dec_max) + " and "
-            where+= "j_mag < " + str(sky_area.mag_min * 1000)
-            where+= " LIMIT " + str(limit)
-
-            cur.execute("SELECT ra,dec,j_mag FROM public.stars where "+where)
-            #cur.execute("SELECT ra,dec,j_mag FROM public.z570 where " + where)
+    def create_tier_index(self, cluster=False):
+        """
+        add the tier index to the stars table (this takes minutes on the full UCAC4 table).
+        cluster=True also orders the table itself by the index (takes longer, and locks the table),
+        so that the stars of a tier and sky area are also close together on disk.
+        """
+        cur = self.conn.cursor()
+        try:
+            cur.execute(CREATE_TIER_INDEX)
+            if cluster:
+                cur.execute("CLUSTER public.stars USING " + TIER_INDEX)
+            self.conn.commit()
 
-            rows = cur.fetchall()
+            # the visibility map and statistics that the planner needs for an index-only scan
+            # (VACUUM cannot run inside a transaction)
+            self.conn.autocommit = True
+            try:
+                cur.execute("VACUUM ANALYZE public.stars")
+            finally:
+                self.conn.autocommit = False
+        except Error:
+            self.conn.rollback()
+            raise
+        finally:
+            cur.close()
 
-            results = []
+    def get_tier(self, sky_area, tier, limit):
+        """
+        the (at most limit) brightest stars of one magnitude tier in the sky area, as rows of (ra, dec, j_mag)
+        """
+        cur = self.conn.cursor()
+        cur.execute("SELECT ra,dec,j_mag FROM public.stars "
+                    "WHERE (j_mag / " + str(TIER_SIZE) + ") = %s "
+                    "AND dec > %s AND dec < %s AND ra > %s AND ra < %s AND j_mag < %s "
+                    "ORDER BY j_mag LIMIT %s",
+                    (tier,
+                     sky_area.dec_min, sky_area.dec_max, sky_area.ra_min, sky_area.ra_max,
+                     sky_area.mag_min * 1000, limit))
+        rows = cur.fetchall()
+        cur.close()
+        return rows
 
-            for row in rows:
-                #print(row)
-                ra = row[0]
-                dec = row[1]
-                mag = row[2]/1000
-                label = ""
+    def iter_tiers(self, sky_area, limit):
+        """
+        the brightest stars in the sky area, one magnitude tier at a time (brightest first),
+        only fetching the next (fainter) tier when the previous ones had less than limit stars
+        """
+        # postgres divides integers towards zero, so tier 0 runs from -999 to 999 millimag
+        last_tier = int(sky_area.mag_min * 1000 / TIER_SIZE)
+        for tier in range(BRIGHTEST_TIER, last_tier + 1):
+            if limit <= 0:
+                return
 
-                # add magnitude as label
-                #label = row[2]
+            rows = self.get_tier(sky_area, tier, limit)
+            limit -= len(rows)
+            yield rows
 
-                # add colors:
-                # https://stackoverflow.com/questions/21977786/star-b-v-color-index-to-apparent-rgb-color
+    @timeit
+    def get_stars(self, sky_area, limit):
 
-                results.append(StarData(ra, dec, mag, label))
+            """
+            the limit brightest stars in the sky area
+            """
+            rows = []
+            for tier_rows in self.iter_tiers(sky_area, limit):
+                rows.extend(tier_rows)
 
-            return StarDataList(results)
+            # add colors:
+            # https://stackoverflow.com/questions/21977786/star-b-v-color-index-to-apparent-rgb-color
+            columns = np.array(rows, dtype=float).reshape(-1, 3)
+            return StarDataList.from_columns(columns[:, 0], columns[:, 1], columns[:, 2] / 1000,
+                                             np.full(len(rows), -1), [])
 
 
     def cone_search(self, sky_area, limit):
-        pass
\ No newline at end of file
+        pass
@@ -1,3 +1,300 @@
-from django.test import TestCase
+import io
+import os
+import gzip
+import shutil
+import sqlite3
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from benchmarks.coord_calc import ObjectList, ScalarCoordCalc
+from .models import StarChart
+from .starchart import svg
+from .starchart.main import create_diagram, get_star_lists, stream_starchart
+from .starchart.coord_calc import CoordCalc
+from .starchart.sky_area import ConeToSkyArea, SkyArea
+from .starchart.star_data import StarData, StarDataList
+from .starchart.hyg_star_database import HygStarDatabase
+from .starchart.starlabels_database import StarLabelsDatabase
+from .starchart.ucac4_star_database import UCAC4StarDatabase
+from .starchart.sqlite_pool import get_connection
+
+STARS = [
+    # RightAscension, Declination, Magnitude, BayerFlamsteed, ProperName
+    (83.0, -5.0, 4.0, '44Iot Ori', ''),
+    (84.0, -1.0, 1.7, '46Eps Ori', 'Alnilam'),
+    (84.5, -2.0, 9.5, '', ''),
+    (120.0, -5.0, 2.0, '', 'Outside'),
+    (85.0, 20.0, 3.0, '', 'Too far north'),
+]
+
+
+def hygdata_file():
+    # a temporary sqlite database with the STARS in a hygdata table
+    fd, db_file = tempfile.mkstemp(suffix='.sqlite3')
+    os.close(fd)
+    conn = sqlite3.connect(db_file)
+    conn.execute('CREATE TABLE hygdata (RightAscension REAL, Declination REAL, Magnitude REAL, '
+                 'BayerFlamsteed TEXT, ProperName TEXT)')
+    conn.executemany('INSERT INTO hygdata VALUES (?, ?, ?, ?, ?)', STARS)
+    conn.commit()
+    conn.close()
+    return db_file
+
+
+class HygStarDatabaseTest(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.db_file = hygdata_file()
+
+    @classmethod
+    def tearDownClass(cls):
+        os.remove(cls.db_file)
+        super().tearDownClass()
+
+    def test_get_stars(self):
+        stars = HygStarDatabase(self.db_file).get_stars(SkyArea(80, 90, -10, 10, 10))
+        self.assertEqual(sorted(stars.mag.tolist()), [1.7, 4.0, 9.5])
+
+        stars = HygStarDatabase(self.db_file).get_stars(SkyArea(80, 90, -10, 10, 5))
+        self.assertEqual(sorted(star.label for star in stars), ['44Iot Ori', '46Eps Ori'])
+
+    def test_get_labels(self):
+        labels = StarLabelsDatabase(self.db_file).get_labels(SkyArea(80, 130, -10, 10, 10), 'ProperName')
+        self.assertEqual(sorted(star.label for star in labels), ['Alnilam', 'Outside'])
+
+    def test_unknown_label_field(self):
+        with self.assertRaises(ValueError):
+            StarLabelsDatabase(self.db_file).get_labels(SkyArea(80, 90, -10, 10, 10), 'x FROM hygdata; --')
+
+    def test_connection_is_read_only(self):
+        with self.assertRaises(sqlite3.OperationalError):
+            get_connection(self.db_file).execute('CREATE INDEX hygdata_magnitude ON hygdata (Magnitude)')
+
+    def test_index_hygdata(self):
+        call_command('index_hygdata', self.db_file, stdout=io.StringIO())
+        conn = sqlite3.connect(self.db_file)
+        indexes = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")]
+        conn.close()
+        self.assertEqual(indexes, ['hygdata_position'])
+
+        stars = HygStarDatabase(self.db_file).get_stars(SkyArea(80, 90, -10, 10, 10))
+        self.assertEqual(sorted(stars.mag.tolist()), [1.7, 4.0, 9.5])
+
+
+class CoordCalcTest(SimpleTestCase):
+    # the numpy CoordCalc against the original per-star implementation
+
+    def process(self, coord_calc_class, star_data_list, star_label_list):
+        starchart = SimpleNamespace(diagram_size=500, rotation=15, display_width=500, display_height=500)
+        coord_calc = coord_calc_class(starchart, star_data_list, star_label_list, None,
+                                      ConeToSkyArea(83.8, -5.4, 10, 10, 12))
+        coord_calc.process()
+        return coord_calc
+
+    def test_same_as_scalar(self):
+        stars = [StarData(ra, dec, mag) for ra, dec, mag, _, _ in STARS]
+        labels = [StarData(ra, dec, mag, label) for ra, dec, mag, label, _ in STARS[:2]]
+
+        scalar = self.process(ScalarCoordCalc, ObjectList(stars), ObjectList(labels))
+        vectorized = self.process(CoordCalc, StarDataList(stars), StarDataList(labels))
+        self.assertTrue(np.isfinite(vectorized.star_data_list.x).all())
+
+        for scalar_list, vectorized_list in ((scalar.star_data_list, vectorized.star_data_list),
+                                             (scalar.star_label_list, vectorized.star_label_list)):
+            np.testing.assert_allclose(vectorized_list.x, [star.x for star in scalar_list.data], atol=1e-9)
+            np.testing.assert_allclose(vectorized_list.y, [star.y for star in scalar_list.data], atol=1e-9)
+
+
+class SvgTest(SimpleTestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.elements = [f'<circle cx="{i}"/>' for i in range(1000)]
+
+    def test_chunks(self):
+        chunks = list(svg.chunks(self.elements, chunk_size=1000))
+        self.assertEqual(''.join(chunks), ''.join(self.elements))
+        self.assertGreater(len(chunks), 1)
+        # every chunk but the last one has reached the chunk size, by at most one element
+        self.assertTrue(all(1000 <= len(chunk) < 1000 + 20 for chunk in chunks[:-1]))
+        self.assertEqual(list(svg.chunks([])), [])
+
+    def test_gzip_chunks(self):
+        data = b''.join(svg.gzip_chunks(svg.chunks(self.elements, chunk_size=1000)))
+        self.assertEqual(gzip.decompress(data).decode('utf-8'), ''.join(self.elements))
+
+    def test_write_svg(self):
+        outfile = os.path.join(self.temp_dir, 'chart.svg')
+        svg.write_svg(self.elements, outfile)
+        with open(outfile, encoding='utf-8') as f:
+            self.assertEqual(f.read(), ''.join(self.elements))
+
+    def test_write_svgz(self):
+        outfile = os.path.join(self.temp_dir, 'chart.svgz')
+        svg.write_svg(self.elements, outfile)
+        with gzip.open(outfile, 'rt', encoding='utf-8') as f:
+            self.assertEqual(f.read(), ''.join(self.elements))
+
+
+class StreamStarChartTest(TestCase):
+    databases = {'default', 'stars'}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.db_file = hygdata_file()
+
+    @classmethod
+    def tearDownClass(cls):
+        os.remove(cls.db_file)
+        super().tearDownClass()
+
+    def setUp(self):
+        settings_override = override_settings(MY_HYG_ROOT=self.db_file, MY_STARLABELS_ROOT=self.db_file)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        StarChart.objects.create(name='orion', source='hyg_sqlite', ra_min=80, ra_max=90,
+                                 dec_min=-10, dec_max=10, magnitude_limit=10)
+
+    def starchart(self):
+        # get_star_lists() fills in the center of the starchart, so every rendering gets its own copy
+        return StarChart.objects.get(name='orion')
+
+    def test_stream_svg(self):
+        text = b''.join(stream_starchart(self.starchart())).decode('utf-8')
+        self.assertTrue(text.startswith(svg.XML_HEADER))
+        self.assertTrue(text.endswith(svg.SVG_FOOTER))
+        self.assertEqual(text.count('<circle'), 3)
+        self.assertIn('46Eps Ori', text)
+
+        gzipped = b''.join(stream_starchart(self.starchart(), gzipped=True))
+        self.assertEqual(gzip.decompress(gzipped).decode('utf-8'), text)
+
+    def test_render_svg(self):
+        # the files have the same svg as the stream
+        text = b''.join(stream_starchart(self.starchart())).decode('utf-8')
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+
+        diagram = starchart = self.starchart()
+        diagram = create_diagram(starchart, *get_star_lists(starchart))
+        diagram.render_svg(os.path.join(temp_dir, 'orion.svg'))
+        with open(os.path.join(temp_dir, 'orion.svg'), encoding='utf-8') as f:
+            self.assertEqual(f.read(), text)
+
+        diagram.render_svg(os.path.join(temp_dir, 'orion.svgz'))
+        with gzip.open(os.path.join(temp_dir, 'orion.svgz'), 'rt', encoding='utf-8') as f:
+            self.assertEqual(f.read(), text)
+
+    def test_view(self):
+        response = self.client.get('/my_astrobase/stream-starchart/orion', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        text = gzip.decompress(b''.join(response.streaming_content)).decode('utf-8')
+        self.assertEqual(text.count('<circle'), 3)
+
+    def test_view_not_enough_stars(self):
+        StarChart.objects.filter(name='orion').update(magnitude_limit=2)
+        response = self.client.get('/my_astrobase/stream-starchart/orion')
+        self.assertEqual(response.status_code, 400)
+
+    def test_view_error(self):
+        with mock.patch('starcharts_app.views.stream_starchart', side_effect=sqlite3.OperationalError('locked')), \
+                self.assertLogs('starcharts_app.views', level='ERROR') as logs:
+            response = self.client.get('/my_astrobase/stream-starchart/orion')
+        self.assertEqual(response.status_code, 500)
+        self.assertIn('locked', logs.output[0])
+
+    def test_view_unknown_starchart(self):
+        response = self.client.get('/my_astrobase/stream-starchart/nope')
+        self.assertEqual(response.status_code, 404)
+
+
+# ra, dec, j_mag (millimag) of the stars of the mocked UCAC4 table
+UCAC4_STARS = [
+    (83.0, -5.0, -500),
+    (84.0, -1.0, 1700),
+    (84.2, -1.5, 1200),
+    (84.5, -2.0, 2300),
+    (85.0, -3.0, 4100),
+    (85.5, -4.0, 9500),
+    (120.0, -5.0, 800),
+]
+
+
+class UCAC4Cursor:
+    # answers the tier query of UCAC4StarDatabase.get_tier from UCAC4_STARS, and records the parameters
+
+    def __init__(self, queries):
+        self.queries = queries
+        self.rows = None
+
+    def execute(self, query, params):
+        self.queries.append(params)
+        tier, dec_min, dec_max, ra_min, ra_max, mag_max, limit = params
+        # postgres divides integers towards zero
+        rows = sorted((star for star in UCAC4_STARS
+                       if int(star[2] / 1000) == tier and dec_min < star[1] < dec_max
+                       and ra_min < star[0] < ra_max and star[2] < mag_max), key=lambda star: star[2])
+        self.rows = rows[:limit]
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class UCAC4StarDatabaseTest(SimpleTestCase):
+
+    def setUp(self):
+        self.queries = []
+        connection = mock.Mock()
+        connection.cursor.side_effect = lambda: UCAC4Cursor(self.queries)
+        with mock.patch('psycopg2.connect', return_value=connection):
+            self.db = UCAC4StarDatabase('localhost', 5432, 'ucac4', 'user', 'password')
+        self.area = SkyArea(80, 90, -10, 10, 10)
+
+    def tiers(self):
+        return [params[0] for params in self.queries]
+
+    def limits(self):
+        return [params[-1] for params in self.queries]
+
+    def test_get_tier(self):
+        self.assertEqual(self.db.get_tier(self.area, 1, 10), [(84.2, -1.5, 1200), (84.0, -1.0, 1700)])
+        self.assertEqual(self.queries, [(1, -10, 10, 80, 90, 10000, 10)])
+
+    def test_all_tiers(self):
+        # not enough stars: every tier up to the magnitude limit, brightest first, with the remaining limit
+        stars = self.db.get_stars(self.area, 100)
+        self.assertEqual(stars.mag.tolist(), [-0.5, 1.2, 1.7, 2.3, 4.1, 9.5])
+        self.assertEqual(self.tiers(), list(range(-2, 11)))
+        self.assertEqual(self.limits(), [100, 100, 100, 99, 97, 96, 96, 95, 95, 95, 95, 95, 94])
+
+    def test_stops_at_the_limit(self):
+        # tier 1 completes the 3 stars, the fainter tiers are never queried
+        stars = self.db.get_stars(self.area, 3)
+        self.assertEqual(stars.mag.tolist(), [-0.5, 1.2, 1.7])
+        self.assertEqual(self.tiers(), [-2, -1, 0, 1])
+        self.assertEqual(self.limits(), [3, 3, 3, 2])
+
+    def test_limit_within_a_tier(self):
+        stars = self.db.get_stars(self.area, 2)
+        self.assertEqual(stars.mag.tolist(), [-0.5, 1.2])
+        self.assertEqual(self.tiers(), [-2, -1, 0, 1])
+        self.assertEqual(self.limits(), [2, 2, 2, 1])
+
+    def test_empty_area(self):
+        stars = self.db.get_stars(SkyArea(200, 210, -10, 10, 3), 10)
+        self.assertEqual(len(stars), 0)
+        self.assertEqual(self.tiers(), [-2, -1, 0, 1, 2, 3])
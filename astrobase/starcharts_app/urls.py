@@ -14,6 +14,8 @@ urlpatterns = [
      path('show-starchart/', views.ShowStarChartView, name='show-starchart'),
      path('show-starchart/<name>', views.ShowStarChartView, name='show-starchart'),
 
+     path('stream-starchart/<name>', views.StreamStarChartView, name='stream-starchart'),
+
      path('starchart/', views.StarChartView, name='starchart'),
      path('starchart/<name>', views.StarChartView, name='starchart'),
 
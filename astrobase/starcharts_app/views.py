@@ -1,13 +1,17 @@
+import logging
 from django.shortcuts import render, redirect
+from django.http import StreamingHttpResponse, HttpResponseNotFound, HttpResponseBadRequest, HttpResponseServerError
 from django_filters import rest_framework as filters
 from rest_framework import generics, pagination
 from django.conf import settings
 from .models import StarChart, Scheme, Stars
 from .serializers import StarChartSerializer, StarsSerializer
 from .forms import StarChartForm
-from .starchart.main import create_starchart, construct_starcharts_list, create_scheme_from_chart
+from .starchart.main import create_starchart, construct_starcharts_list, create_scheme_from_chart, stream_starchart
 from .starchart.hyg_star_database import HygStarDatabase
 
+logger = logging.getLogger(__name__)
+
 class StarsFilter(filters.FilterSet):
 
     class Meta:
@@ -150,6 +154,30 @@ def CreateStarChart(request):
 
 
 
+# render the svg of a saved starchart on the fly and stream it to the client, gzipped when the client accepts that
+#http://localhost:8000/my_astrobase/stream-starchart/my_starchart
+def StreamStarChartView(request, name='my_starchart'):
+    try:
+        starchart = StarChart.objects.get(name=name)
+    except StarChart.DoesNotExist:
+        return HttpResponseNotFound(f'starchart {name} does not exist')
+
+    gzipped = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+    try:
+        chunks = stream_starchart(starchart, gzipped)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    except Exception as e:
+        logger.exception(f'StreamStarChartView: starchart {name} failed: {e}')
+        return HttpResponseServerError(f'starchart {name} could not be rendered')
+
+    response = StreamingHttpResponse(chunks, content_type='image/svg+xml')
+    response['Vary'] = 'Accept-Encoding'
+    if gzipped:
+        response['Content-Encoding'] = 'gzip'
+    return response
+
+
 def StarChartView(request, name=None):
 
     try:
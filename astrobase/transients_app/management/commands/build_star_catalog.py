@@ -0,0 +1,12 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from transients_app.services import star_catalog
+
+
+class Command(BaseCommand):
+    help = "Convert hip_main.dat and the Stellarium constellation lines into the star catalog of the starmaps"
+
+    def handle(self, *args, **options):
+        count = star_catalog.build_star_catalog()
+        self.stdout.write(f"{count} stars written to {settings.MY_STAR_CATALOG_ROOT}")
@@ -1,9 +1,11 @@
 import os
-import requests
 import math
 import json
 import datetime
+import time
+import logging
 from django.conf import settings
+from django.db import transaction
 
 import numpy as np
 
@@ -19,11 +21,20 @@ except:
 
 from ..models import Asteroid
 from exoplanets.models import Exoplanet
+from . import kernels, mpcorb, comets, asteroid_ephemeris, chebyshev, resolver, sky_index, mpc_webservice
+
+logger = logging.getLogger(__name__)
 
 DATE_FORMAT = "%Y-%m-%d"
 TIME_FORMAT = "%Y-%m-%d %H:%M:%SZ"
 DJANGO_TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
 
+# asteroids fainter than this are not drawn on the images
+ASTEROID_MAGNITUDE_LIMIT = 15
+
+# margin (degrees) around the image in which asteroids are drawn
+ASTEROID_FIELD_MARGIN = 1.0
+
 def phi_func(index, phase_angle):
     """
     Phase function that is needed for the reduced magnitude. The function has
@@ -122,14 +133,8 @@ def get_minor_planets_webservice(name, timestamp):
     result = {}
     ephemeris = {}
 
-    url = 'https://minorplanetcenter.net/web_service/search_orbits'
-
-    params = {}
-    params['name'] = name
-    params['json'] = 1
-
-    r = requests.get(url, params, auth=('mpc_ws', 'mpc!!ws'))
-    orbital_elements = r.json()
+    # from the local MPCORB table, or the (cached) Minor Planet Center web service
+    orbital_elements = mpc_webservice.get_orbital_elements(name)
     d = orbital_elements[0]
 
     # gather the correct orbital elements for the ephem.readdb function
@@ -198,17 +203,11 @@ def get_comet(name, timestamp):
 
     # name = "C/2020 F3 (NEOWISE)"
     # https://www.minorplanetcenter.net/iau/info/CometOrbitFormat.html
-    with load.open(mpc.COMET_URL) as f:
-        comets = mpc.load_comets_dataframe(f)
-
-    comets = (comets.sort_values('reference')
-              .groupby('designation', as_index=False).last()
-              .set_index('designation', drop=False))
-
-    row = comets.loc[name]
+    # the comet elements come from the local snapshot, indexed by designation
+    row = comets.get_comet_row(name)
     print(row)
-    ts = load.timescale()
-    eph = load('de421.bsp')
+    ts = kernels.get_timescale()
+    eph = kernels.get_kernel('de421.bsp')
     sun, earth = eph['sun'], eph['earth']
 
     comet = sun + mpc.comet_orbit(row, ts, GM_SUN)
@@ -240,25 +239,12 @@ def get_asteroid(name, timestamp):
 
     # https://ssd-api.jpl.nasa.gov/doc/horizons.html
 
-    designation = name
-    try:
-        asteroids = Asteroid.objects.filter(designation__icontains=name)
-        designation = asteroids[0].designation
-    except:
-        pass
-
-    with load.open(settings.MY_ASTEROIDS_URL) as f:
-        minor_planets = mpc.load_mpcorb_dataframe(f)
-
-    bad_orbits = minor_planets.semimajor_axis_au.isnull()
-    minor_planets = minor_planets[~bad_orbits]
+    # the orbital elements come from the in-memory MPCORB table, which is only reloaded when it changes
+    row = mpcorb.get_orbit(name)
+    designation = row['designation']
 
-    # Index by designation for fast lookup.
-    minor_planets = minor_planets.set_index('designation', drop=False)
-    row = minor_planets.loc[designation]
-
-    ts = load.timescale()
-    eph = load('de440s.bsp')
+    ts = kernels.get_timescale()
+    eph = kernels.get_kernel('de440s.bsp')
     sun, earth = eph['sun'], eph['earth']
 
     asteroid = sun + mpc.mpcorb_orbit(row, ts, GM_SUN)
@@ -314,8 +300,8 @@ def get_planet(name, timestamp):
 
     # https://rhodesmill.org/skyfield/api.html#planetary-magnitudes
 
-    ts = load.timescale()
-    eph = load('de421.bsp')
+    ts = kernels.get_timescale()
+    eph = kernels.get_kernel('de421.bsp')
     sun, earth = eph['sun'], eph['earth']
     planet = eph[name+' BARYCENTER']
 
@@ -353,54 +339,49 @@ def get_planet(name, timestamp):
     # result['row'] = row
     return result,planet
 
+# https://naif.jpl.nasa.gov/pub/naif/generic_kernels/spk/satellites/a_old_versions/
+# Dictionary mapping names → kernel
+MOON_KERNELS = {
+    # Jupiter (Galilean moons)
+    "Io": 'jup365.bsp',
+    "Europa": 'jup365.bsp',
+    "Ganymede": 'jup365.bsp',
+    "Callisto": 'jup365.bsp',
+    # Saturn (Titan, Rhea, Dione, etc.)
+    "Titan": 'sat365.bsp',
+    "Rhea": 'sat365.bsp',
+    "Dione": 'sat365.bsp',
+    "Tethys": 'sat365.bsp',
+    "Iapetus": 'sat365.bsp',
+    "Enceladus": 'sat365.bsp',
+    # Uranus (Titania, Oberon)
+    "Titania": 'ura083.bsp',
+    "Oberon": 'ura083.bsp',
+    # Neptune (Triton)
+    "Triton": 'nep076.bsp',
+}
+
+MOON_MAGNITUDES = {
+    "Io": 5.0, "Europa": 5.3, "Ganymede": 4.6, "Callisto": 5.6,
+    "Titan": 8.4, "Rhea": 9.7, "Dione": 10.4, "Tethys": 10.2,
+    "Iapetus": 10.2, "Enceladus": 11.7,
+    "Titania": 13.9, "Oberon": 14.1,
+    "Triton": 13.5,
+    "Phobos": 11.3, "Deimos": 12.4,
+}
+
 # http://localhost:8000/my_astrobase/bright_moon/?name=Triton
 def get_bright_moon(name, timestamp):
-    # https://naif.jpl.nasa.gov/pub/naif/generic_kernels/spk/satellites/a_old_versions/
-    eph = load(os.path.join(settings.REPOSITORY_ROOT,'de421.bsp'))        # planets + Earth's Moon
-    jup_moons = load(os.path.join(settings.REPOSITORY_ROOT, 'jup365.bsp'))  # Galilean moons
-    sat_moons = load(os.path.join(settings.REPOSITORY_ROOT, 'sat365.bsp'))  # Titan, Rhea, Dione, etc.
-    ura_moons = load(os.path.join(settings.REPOSITORY_ROOT, 'ura083.bsp'))  # Titania, Oberon
-    nep_moons = load(os.path.join(settings.REPOSITORY_ROOT, 'nep076.bsp'))  # Triton
-
-    # Dictionary mapping names → kernel
-    MOON_KERNELS = {
-        # Jupiter
-        "Io": jup_moons,
-        "Europa": jup_moons,
-        "Ganymede": jup_moons,
-        "Callisto": jup_moons,
-        # Saturn
-        "Titan": sat_moons,
-        "Rhea": sat_moons,
-        "Dione": sat_moons,
-        "Tethys": sat_moons,
-        "Iapetus": sat_moons,
-        "Enceladus": sat_moons,
-        # Uranus
-        "Titania": ura_moons,
-        "Oberon": ura_moons,
-        # Neptune
-        "Triton": nep_moons,
-    }
-
-    MOON_MAGNITUDES = {
-        "Io": 5.0, "Europa": 5.3, "Ganymede": 4.6, "Callisto": 5.6,
-        "Titan": 8.4, "Rhea": 9.7, "Dione": 10.4, "Tethys": 10.2,
-        "Iapetus": 10.2, "Enceladus": 11.7,
-        "Titania": 13.9, "Oberon": 14.1,
-        "Triton": 13.5,
-        "Phobos": 11.3, "Deimos": 12.4,
-    }
-
-    ts = load.timescale()
+    eph = kernels.get_kernel('de421.bsp')
+    ts = kernels.get_timescale()
     sun, earth = eph['sun'], eph['earth']
 
     # Find the correct kernel
-    kernel = MOON_KERNELS.get(name)
-    if kernel is None:
+    kernel_name = MOON_KERNELS.get(name)
+    if kernel_name is None:
         raise ValueError(f"{name} is not in the list of supported bright moons")
 
-    target = kernel[name]
+    target = kernels.get_kernel(kernel_name)[name]
 
     # Convert timestamp
     t = ts.utc(timestamp.year, timestamp.month, timestamp.day,
@@ -428,6 +409,210 @@ def get_bright_moon(name, timestamp):
     }
     return result, target
 
+def _times(timestamps):
+    # one skyfield Time array for a list of timestamps
+    ts = kernels.get_timescale()
+    return ts.utc([t.year for t in timestamps], [t.month for t in timestamps], [t.day for t in timestamps],
+                  [t.hour for t in timestamps], [t.minute for t in timestamps])
+
+
+def _bright_moon_track(name, t):
+    kernel_name = MOON_KERNELS.get(name)
+    if kernel_name is None:
+        raise ValueError(f"{name} is not in the list of supported bright moons")
+
+    earth = kernels.get_kernel('de421.bsp')['earth']
+    target = kernels.get_kernel(kernel_name)[name]
+
+    ra, dec, _ = earth.at(t).observe(target).radec()
+    visual_magnitude = np.full(len(t), MOON_MAGNITUDES.get(name, 0))
+    return name, ra.hours * 15, dec.degrees, visual_magnitude
+
+
+def _comet_track(name, t):
+    row = comets.get_comet_row(name)
+    ts = kernels.get_timescale()
+    eph = kernels.get_kernel('de421.bsp')
+    sun, earth = eph['sun'], eph['earth']
+
+    comet = sun + mpc.comet_orbit(row, ts, GM_SUN)
+    ra, dec, _ = earth.at(t).observe(comet).radec()
+    visual_magnitude = np.full(len(t), row['magnitude_k'])
+    return row['designation'], ra.hours * 15, dec.degrees, visual_magnitude
+
+
+def _asteroid_track(name, t):
+    row = mpcorb.get_orbit(name)
+    ts = kernels.get_timescale()
+    eph = kernels.get_kernel('de440s.bsp')
+    sun, earth = eph['sun'], eph['earth']
+
+    asteroid = sun + mpc.mpcorb_orbit(row, ts, GM_SUN)
+    _, _, distance_from_sun = sun.at(t).observe(asteroid).radec()
+
+    observer = earth + wgs84.latlon(latitude_degrees=52, longitude_degrees=6, elevation_m=0)
+    ra, dec, distance_from_earth = observer.at(t).observe(asteroid).apparent().radec()
+
+    ast_sun = asteroid.at(t).observe(sun)
+    ast_earth = asteroid.at(t).observe(earth)
+    phase_angle = ast_sun.separation_from(ast_earth)
+
+    visual_magnitude = app_mag(abs_mag=row['magnitude_H'],
+                               phase_angle=phase_angle.radians,
+                               slope_g=row['magnitude_G'],
+                               d_ast_sun=distance_from_sun.au,
+                               d_ast_earth=distance_from_earth.au)
+    return row['designation'], ra.degrees, dec.degrees, visual_magnitude
+
+
+def _planet_track(name, t):
+    eph = kernels.get_kernel('de421.bsp')
+    planet = eph[name + ' BARYCENTER']
+
+    astrometric = eph['earth'].at(t).observe(planet)
+    ra, dec, _ = astrometric.radec()
+    try:
+        visual_magnitude = planetary_magnitude(astrometric)
+    except:
+        visual_magnitude = np.zeros(len(t))
+    return name, ra.hours * 15, dec.degrees, visual_magnitude
+
+
+# the vectorized calculations per body type, they return (designation, ra, dec, visual_magnitude)
+TRACK_FUNCTIONS = {
+    'bright_moon': _bright_moon_track,
+    'comet': _comet_track,
+    'asteroid': _asteroid_track,
+    'planet': _planet_track,
+}
+
+# the maximum number of positions in one streamed track. An asteroid track of skyfield
+# takes about 0.15 ms per position on a PC, so a Raspberry Pi stays well within the gunicorn timeout
+MAX_TRACK_POINTS = 10000
+
+# the maximum number of (name, timestamp) pairs in one batch request
+MAX_BATCH_PAIRS = 10000
+
+
+def get_track(name, timestamps):
+    """
+    the positions of a transient at a list of timestamps, calculated in one vectorized call
+    @input name: name of a bright moon, planet, comet or asteroid
+    @input timestamps: list of datetimes
+    @output list of dicts (name, designation, body_type, timestamp, ra_decimal, dec_decimal, visual_magnitude)
+    """
+
+    # an unknown name raises a KeyError
+    body_type, designation = resolver.resolve(name)
+    return _track(name, body_type, designation, timestamps)
+
+
+def _track(name, body_type, designation, timestamps):
+    # use the precomputed ephemeris grid when it covers this body at all the timestamps
+    grid_track = chebyshev.interpolate_track(designation, timestamps, body_type)
+    if grid_track is not None:
+        designation = grid_track['designation']
+        ra, dec = grid_track['ra_decimal'], grid_track['dec_decimal']
+        visual_magnitude = grid_track['visual_magnitude']
+    else:
+        # otherwise route the name directly to the right calculation
+        track_function = TRACK_FUNCTIONS[body_type]
+        designation, ra, dec, visual_magnitude = track_function(designation, _times(timestamps))
+
+    visual_magnitude = np.broadcast_to(np.asarray(visual_magnitude, dtype=float), (len(timestamps),))
+
+    track = []
+    for i, timestamp in enumerate(timestamps):
+        track.append({
+            'name': name,
+            'designation': designation,
+            'body_type': body_type,
+            'timestamp': str(timestamp),
+            'ra_decimal': float(ra[i]),
+            'dec_decimal': float(dec[i]),
+            'visual_magnitude': None if np.isnan(visual_magnitude[i]) else float(visual_magnitude[i]),
+        })
+    return track
+
+
+def iter_track(name, start, stop, step, chunk_size=5000):
+    """
+    the positions of a transient from start to stop (datetimes) every step (timedelta), as a generator of chunks.
+    The epochs are calculated in vectorized chunks of chunk_size, so that a long track
+    never has to be in memory at once. An unknown name raises a KeyError right away.
+    @output dicts with the name, designation and body_type, and the arrays timestamp (strings, to the second),
+            ra_decimal, dec_decimal and visual_magnitude (NaN when it is unknown)
+    """
+    body_type, designation = resolver.resolve(name)
+
+    step_seconds = step.total_seconds()
+    points = int((stop - start).total_seconds() // step_seconds) + 1
+    return _track_chunks(name, body_type, designation, start, step_seconds, points, chunk_size)
+
+
+def _track_chunks(name, body_type, designation, start, step_seconds, points, chunk_size):
+    track_function = TRACK_FUNCTIONS[body_type]
+    ts = kernels.get_timescale()
+
+    for first in range(0, points, chunk_size):
+        seconds = np.arange(first, min(first + chunk_size, points)) * step_seconds
+        t = ts.utc(start.year, start.month, start.day, start.hour, start.minute, start.second + seconds)
+
+        designation, ra, dec, visual_magnitude = track_function(designation, t)
+
+        timestamps = np.datetime64(start, 's') + seconds.astype('timedelta64[s]')
+        yield {
+            'name': name,
+            'designation': designation,
+            'body_type': body_type,
+            'timestamp': np.char.replace(np.datetime_as_string(timestamps, unit='s'), 'T', ' '),
+            'ra_decimal': np.asarray(ra, dtype=float),
+            'dec_decimal': np.asarray(dec, dtype=float),
+            'visual_magnitude': np.broadcast_to(np.asarray(visual_magnitude, dtype=float), seconds.shape),
+        }
+
+
+def get_ephemeris_batch(pairs):
+    """
+    the positions for many (name, timestamp) pairs. The pairs are grouped per body and epoch,
+    so that every body is calculated in one vectorized call over all its timestamps.
+    @input pairs: list of (name, timestamp) tuples
+    @output list of results in the same order as the pairs, with an 'error' when a body can not be calculated
+    """
+    results = [None] * len(pairs)
+
+    # 'Psyche', 'psyche' and '16' are the same body, every name is resolved once
+    resolved = {}
+    groups = {}
+    for i, (name, timestamp) in enumerate(pairs):
+        if name not in resolved:
+            try:
+                resolved[name] = resolver.resolve(name)
+            except KeyError as e:
+                resolved[name] = str(e.args[0])
+
+        if isinstance(resolved[name], str):
+            results[i] = {'name': name, 'timestamp': str(timestamp), 'error': resolved[name]}
+        else:
+            groups.setdefault(resolved[name], {}).setdefault(timestamp, []).append(i)
+
+    for (body_type, designation), epochs in groups.items():
+        timestamps = [timestamp for timestamp in epochs]
+        try:
+            track = _track(designation, body_type, designation, timestamps)
+        except Exception as e:
+            # a KeyError would be quoted by str()
+            error = str(e.args[0]) if e.args else str(e)
+            track = [{'timestamp': str(timestamp), 'error': error} for timestamp in timestamps]
+
+        # every pair gets the name it asked for
+        for timestamp, result in zip(timestamps, track):
+            for i in epochs[timestamp]:
+                results[i] = dict(result, name=pairs[i][0])
+
+    return results
+
+
 # http://localhost:8000/my_astrobase/run-command?command=transient&observation_id=1305
 def get_transients_as_json(transient, date):
     transient_list = transient.split(',')
@@ -450,28 +635,14 @@ def get_transients_as_json(transient, date):
     list = []
 
     for transient_name in transient_list:
-        is_bright_moon = False
+        # all the timestamps of a transient are calculated in one go
+        track = get_track(transient_name, timestamps)
+        is_bright_moon = track[0]['body_type'] == 'bright_moon'
+
         count = 0
-        for t in timestamps:
+        for t, result in zip(timestamps, track):
             count += 1
 
-            # first try if the transient is a bright moon
-            try:
-                result, _ = get_bright_moon(transient_name, t)
-                is_bright_moon = True
-
-            except:
-                # then try a comet
-                try:
-                    result, _ = get_comet(transient_name, t)
-                except:
-                    # then try an asteroid
-                    try:
-                        result, _ = get_asteroid(transient_name, t)
-                    except:
-                        # finally try a planet
-                        result, _ = get_planet(transient_name, t)
-
             try:
                 vmag = round(float(result['visual_magnitude']) * 10) / 10
             except:
@@ -572,96 +743,152 @@ def get_exoplanets_as_json(observation):
 
 def get_asteroids_as_json(observation):
     """
-    update the coordinates of all the 1000 asteroid on file
-    and draw them on the transient images of my observation
+    calculate the ephemeris of all the asteroids of the MPCORB table
+    and draw the bright ones on the transient images of my observation
     """
-    # update the asteroids table with the data of the observation.
-    update_asteroid_table_ephemeris(observation.date)
-
-    # roughly cut out the coordinate box of the image, but take a wide margin
-
-    box = observation.box.split(',')
-    ra_end = float(box[0]) + 5
-    dec_end = float(box[1]) + 5
-    ra_start = float(box[4]) - 5
-    dec_start = float(box[5]) - 5
+    field, index = asteroid_ephemeris.get_field(observation.date, ASTEROID_MAGNITUDE_LIMIT)
 
-    asteroids = Asteroid.objects.filter(ra__gt=ra_start, ra__lt=ra_end, dec__gt=dec_start, dec__lt=dec_end)
+    # the cone around the 4 corners of the image, with a margin
+    box = [float(value) for value in observation.box.split(',')]
+    ra, dec, radius = sky_index.enclosing_cone(box[0::2], box[1::2])
+    rows = index.query_cone(ra, dec, radius + ASTEROID_FIELD_MARGIN)
+    rows = rows[field['visual_magnitude'][rows] <= ASTEROID_MAGNITUDE_LIMIT]
 
     list = []
-    for asteroid in asteroids:
+    for name, ra, dec, visual_magnitude in zip(field['designation'][rows], field['ra'][rows],
+                                               field['dec'][rows], field['visual_magnitude'][rows]):
 
-        designation = f'{asteroid.designation} - m{asteroid.visual_magnitude}'
+        designation = f'{name} - m{round(float(visual_magnitude), 1)}'
 
-        if asteroid.visual_magnitude <= 15:
-            element = {}
+        element = {}
 
-            element['ra'] = float(asteroid.ra)
-            element['dec'] = float(asteroid.dec)
+        element['ra'] = float(ra)
+        element['dec'] = float(dec)
 
-            element['label'] = designation
-            element['shape'] = 'asteroid'
-            element['size'] = 20
-            element['color'] = 'yellow'
+        element['label'] = designation
+        element['shape'] = 'asteroid'
+        element['size'] = 20
+        element['color'] = 'yellow'
 
-            list.append(element)
+        list.append(element)
 
     extra = json.dumps(list)
     return extra
 
 
 
-def update_asteroid_table():
+def read_mpcorb_chunks(filename, chunk_size=5000):
+    """
+    read a MPCORB file (or a part of it, like asteroids.txt) and yield lists of Asteroid objects.
+    https://www.minorplanetcenter.net/iau/info/MPOrbitFormat.html
+    """
+    chunk = []
+    with open(filename, "r") as f:
+        for line in f:
+            # skip the header and empty lines of the full MPCORB.DAT
+            if len(line) < 160 or line.startswith('-'):
+                continue
+
+            # the readable designation, like '(1) Ceres' or '2010 AB12'
+            designation = line[166:194].strip()
+            if not designation:
+                continue
+
+            # find the absolute magnitude
+            try:
+                absolute_magnitude = float(line[8:13])
+            except ValueError:
+                absolute_magnitude = None
+
+            chunk.append(Asteroid(designation=designation, absolute_magnitude=absolute_magnitude))
+
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+
+    if chunk:
+        yield chunk
+
+
+def update_asteroid_table(chunk_size=5000):
     """
         update asteroids.txt
         - download MPCORB.DAT file: https://www.minorplanetcenter.net/iau/MPCORB/MPCORB.DAT.gz
         - unzip
-        - cut off header
+        - cut off header (optional)
         - save (first 1000?) as /shared/respository/asteroids.txt file (look for MY_ASTEROID_ROOT in settings\base.py)
         https://uilennest.net/my_astrobase/update_asteroids/
-    """
-    # clear asteroid table
-    Asteroid.objects.all().delete()
-
-#    for b in urllib.request.urlopen(MY_ASTEROID_URL):
-#        line = b.decode('utf-8')
-
-    with open(settings.MY_ASTEROIDS_ROOT, "r") as f:
-        line = f.readline()
 
-        while line != '':  # The EOF char is an empty string
-
-            # find the absolute magnitude
-            m = line[8:13]
-            absolute_magnitude = float(m)
+        The file is streamed in chunks into the table with bulk_create.
+        Clearing and filling the table is done in a single transaction,
+        so other requests keep seeing the old asteroids until the new ones are committed.
+    """
+    start = time.time()
+    count = 0
 
-            # find the designation
-            pos = line.find('(')
-            designation = line[pos:pos+20].rstrip()
+    with transaction.atomic():
+        # clear asteroid table
+        Asteroid.objects.all().delete()
 
-            asteroid = Asteroid(designation=designation, absolute_magnitude=absolute_magnitude)
-            print(designation,absolute_magnitude)
-            asteroid.save()
+        for chunk in read_mpcorb_chunks(settings.MY_ASTEROIDS_ROOT, chunk_size):
+            Asteroid.objects.bulk_create(chunk, batch_size=chunk_size)
+            count += len(chunk)
 
-            line = f.readline()
+    duration = time.time() - start
+    rate = count / duration if duration > 0 else count
+    logger.info(f'{count} asteroids loaded in {duration:.1f}s ({rate:.0f} rows/s)')
+    return count, rate
 
 
 # update the ra,dec and timestamp in the asteroid table
 # so that the table can be used to know where asteroids are for a given timestamp
 # this function could be executed daily by a service to keep the ra,dec uptodate
-def update_asteroid_table_ephemeris(timestamp):
-
-    asteroids = Asteroid.objects.all()
-
-    for asteroid in asteroids:
-        designation = asteroid.designation
-
-        details,_ = get_asteroid(designation,timestamp)
-
-        asteroid.ra = details['ra_decimal']
-        asteroid.dec = details['dec_decimal']
-        asteroid.visual_magnitude = round(details['visual_magnitude'],1)
+def update_asteroid_table_ephemeris(timestamp, magnitude_limit=None):
+    """
+    calculate the ephemeris of all the asteroids in the table in one vectorized computation
+    (instead of a get_asteroid() per asteroid), and write them back with a single bulk_update.
+    With a magnitude_limit, the asteroids that can never be brighter than that limit are not calculated,
+    their coordinates and magnitude are cleared.
+    """
+    asteroids = list(Asteroid.objects.all())
+    if not asteroids:
+        return 0
+
+    elements = asteroid_ephemeris.select(asteroid_ephemeris.get_elements(),
+                                         [asteroid.designation for asteroid in asteroids])
+
+    if magnitude_limit is None:
+        candidates = np.ones(len(asteroids), dtype=bool)
+    else:
+        # cheap bound from H, perihelion and aphelion before the precise calculation
+        candidates = asteroid_ephemeris.can_be_brighter(elements, magnitude_limit)
+        elements = {key: values[candidates] for key, values in elements.items()}
+
+    ephemeris = asteroid_ephemeris.compute_ephemeris(elements, timestamp)
+
+    updated = []
+    too_faint = []
+    calculated = iter(zip(ephemeris['ra'], ephemeris['dec'], ephemeris['visual_magnitude']))
+    for asteroid, candidate in zip(asteroids, candidates):
         asteroid.timestamp = timestamp
-        print(f'{designation} - m{asteroid.visual_magnitude}')
-        asteroid.save()
-
+        if not candidate:
+            asteroid.ra = None
+            asteroid.dec = None
+            asteroid.visual_magnitude = None
+            too_faint.append(asteroid)
+            continue
+
+        ra, dec, visual_magnitude = next(calculated)
+        if np.isnan(ra):
+            # not in the MPCORB table
+            continue
+
+        asteroid.ra = float(ra)
+        asteroid.dec = float(dec)
+        asteroid.visual_magnitude = round(float(visual_magnitude), 1)
+        updated.append(asteroid)
+
+    Asteroid.objects.bulk_update(updated + too_faint, ['ra', 'dec', 'visual_magnitude', 'timestamp'],
+                                 batch_size=1000)
+    logger.info(f'{len(updated)} of {len(asteroids)} asteroids updated for {timestamp}, {len(too_faint)} too faint')
+    return len(updated)
@@ -0,0 +1,35 @@
+# write files so that readers never see half of them
+#
+# The snapshots, caches and job files of the services are read by other threads and gunicorn workers
+# while they are being replaced. They are written to a temporary file next to the target (unique per
+# process and thread), which then replaces the target in one os.replace(). A failed write leaves the
+# target as it was and removes the temporary file.
+
+import os
+import threading
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_path(path, suffix=''):
+    """
+    a temporary filename next to path, that replaces path when the block succeeds.
+    The suffix ends the temporary name, np.save and np.savez add '.npy' or '.npz' when it is missing.
+    """
+    temp_file = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp{suffix}'
+    try:
+        yield temp_file
+        os.replace(temp_file, path)
+    finally:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+
+@contextmanager
+def atomic_open(path, mode='w'):
+    """
+    like open(path, mode), but the file only replaces path when the block succeeds
+    """
+    with atomic_path(path) as temp_file:
+        with open(temp_file, mode) as f:
+            yield f
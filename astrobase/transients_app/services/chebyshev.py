@@ -0,0 +1,305 @@
+# precomputed Chebyshev ephemeris grid for the solar system bodies
+#
+# build_grid() samples the geocentric positions and magnitudes of the planets, the bright moons (MOON_KERNELS)
+# and the asteroids in the Asteroid table over a date range, and fits Chebyshev polynomials per time segment.
+# The coefficients are stored in a compressed numpy file (settings.MY_EPHEMERIS_GRID_ROOT).
+# interpolate() then answers 'where is X at t' in microseconds, or returns None when X or t
+# is not covered by the grid, so that the caller can fall back to the skyfield calculation.
+# The asteroids are fitted from the MPCORB table, when that table changes they are not answered
+# from the grid anymore until it is built again.
+
+import os
+import logging
+import datetime
+import threading
+import numpy as np
+from numpy.polynomial import chebyshev
+from django.conf import settings
+
+from skyfield.magnitudelib import planetary_magnitude
+
+from ..models import Asteroid
+from . import algorithms, kernels, asteroid_ephemeris, mpcorb
+from .atomic_write import atomic_path
+
+logger = logging.getLogger(__name__)
+
+PLANETS = ['Mercury', 'Venus', 'Mars', 'Jupiter', 'Saturn', 'Uranus', 'Neptune', 'Pluto']
+
+# segment length (days) and polynomial degree per group of bodies.
+# The bright moons move fast around their planet, so they need short segments.
+GROUPS = {
+    'planet': {'segment_days': 8.0, 'degree': 12},
+    'bright_moon': {'segment_days': 1.0, 'degree': 12},
+    'asteroid': {'segment_days': 16.0, 'degree': 10},
+}
+
+_lock = threading.Lock()
+_cache = {
+    'version': None,
+    'grid': None,
+}
+
+
+def _to_utc(timestamp):
+    # the grid works with naive utc datetimes
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def _sample_days(segments, segment_days, degree):
+    """
+    the Chebyshev nodes of every segment, as days since the start of the grid. Shape (segments, degree+1)
+    """
+    k = np.arange(degree + 1)
+    x = np.cos(np.pi * (k + 0.5) / (degree + 1))
+    offsets = (np.arange(segments) * segment_days)[:, np.newaxis]
+    return x, offsets + (x + 1.0) / 2.0 * segment_days
+
+
+def _fit(x, samples, segments, degree):
+    """
+    fit Chebyshev coefficients to the samples (shape (segments, degree+1, channels))
+    returns an array of shape (segments, degree+1, channels)
+    """
+    channels = samples.shape[2]
+    y = samples.transpose(1, 0, 2).reshape(degree + 1, segments * channels)
+    coefficients = chebyshev.chebfit(x, y, degree)
+    return coefficients.reshape(degree + 1, segments, channels).transpose(1, 0, 2)
+
+
+def _sample_skyfield(targets, magnitudes, t, shape):
+    # geocentric astrometric position and magnitude of skyfield targets, like get_planet and get_bright_moon
+    earth = kernels.get_kernel('de421.bsp')['earth']
+    observer = earth.at(t)
+
+    samples = []
+    for target, magnitude in zip(targets, magnitudes):
+        astrometric = observer.observe(target)
+        if magnitude is None:
+            try:
+                magnitude = planetary_magnitude(astrometric)
+            except Exception:
+                magnitude = 0
+        magnitude = np.broadcast_to(np.nan_to_num(magnitude), t.shape)
+
+        xyz = astrometric.position.au
+        samples.append(np.vstack([xyz, magnitude]).T.reshape(shape + (4,)))
+    return samples
+
+
+def _sample_planets(ts, start, days, shape):
+    eph = kernels.get_kernel('de421.bsp')
+    t = ts.utc(start.year, start.month, start.day, start.hour, start.minute, days.ravel() * 86400.0)
+    targets = [eph[name + ' BARYCENTER'] for name in PLANETS]
+    return PLANETS, _sample_skyfield(targets, [None] * len(PLANETS), t, shape)
+
+
+def _sample_bright_moons(ts, start, days, shape):
+    t = ts.utc(start.year, start.month, start.day, start.hour, start.minute, days.ravel() * 86400.0)
+    names, targets, magnitudes = [], [], []
+    for name, kernel_name in algorithms.MOON_KERNELS.items():
+        try:
+            targets.append(kernels.get_kernel(kernel_name)[name])
+        except Exception as e:
+            logger.warning(f'chebyshev: skipping {name}: {e}')
+            continue
+        names.append(name)
+        magnitudes.append(algorithms.MOON_MAGNITUDES.get(name, 0))
+    return names, _sample_skyfield(targets, magnitudes, t, shape)
+
+
+def _observer_offset(jd):
+    """
+    the geocentric position (au) of the asteroid_ephemeris.OBSERVER at julian dates (utc), shape (3,) + jd.shape.
+    Only the earth rotation (GMST) is applied, which is good to a fraction of an arcsecond of parallax.
+    """
+    gmst = np.radians((280.46061837 + 360.98564736629 * (np.asarray(jd) - 2451545.0)) % 360.0)
+    x, y, z = asteroid_ephemeris.OBSERVER.itrs_xyz.au
+    return np.array([x * np.cos(gmst) - y * np.sin(gmst), x * np.sin(gmst) + y * np.cos(gmst),
+                     np.full(gmst.shape, z)])
+
+
+def _sample_asteroids(ts, start, days, shape):
+    designations = list(Asteroid.objects.values_list('designation', flat=True))
+    elements = asteroid_ephemeris.select(asteroid_ephemeris.get_elements(), designations)
+
+    samples = np.empty((len(designations),) + shape + (4,))
+    for index, day in np.ndenumerate(days):
+        t = ts.utc(start.year, start.month, start.day, start.hour, start.minute, day * 86400.0)
+        ephemeris = asteroid_ephemeris.compute_ephemeris_at(elements, t)
+
+        # the apparent direction, scaled to the distance from the observer.
+        # The observer turns with the earth, which cannot be fitted over a segment of days,
+        # so the geocentric position is fitted and the observer is subtracted again in interpolate()
+        apparent = ephemeris['apparent']
+        apparent = apparent / np.linalg.norm(apparent, axis=0) * ephemeris['distance_from_earth']
+        apparent = apparent + asteroid_ephemeris.OBSERVER.at(t).position.au[:, np.newaxis]
+        samples[(slice(None),) + index + (slice(0, 3),)] = apparent.T
+        samples[(slice(None),) + index + (3,)] = ephemeris['visual_magnitude']
+
+    # asteroids that are not in the MPCORB table cannot be fitted
+    found = ~np.isnan(samples).any(axis=(1, 2, 3))
+    return [d for d, ok in zip(designations, found) if ok], list(samples[found])
+
+
+def build_grid(start, stop, include_asteroids=True):
+    """
+    sample and fit all bodies between start and stop (datetimes, utc) and store the grid
+    """
+    start = _to_utc(start).replace(second=0, microsecond=0)
+    stop = _to_utc(stop)
+    total_days = (stop - start).total_seconds() / 86400.0
+    ts = kernels.get_timescale()
+
+    samplers = {
+        'planet': _sample_planets,
+        'bright_moon': _sample_bright_moons,
+    }
+    arrays = {'start': np.array(start.isoformat())}
+    if include_asteroids:
+        samplers['asteroid'] = _sample_asteroids
+        # the version of the MPCORB table that the asteroids are fitted from
+        arrays['mpcorb_version'] = np.array(str(mpcorb.get_version()))
+    count = 0
+    for group, sampler in samplers.items():
+        segment_days = GROUPS[group]['segment_days']
+        degree = GROUPS[group]['degree']
+        segments = max(1, int(np.ceil(total_days / segment_days)))
+
+        x, days = _sample_days(segments, segment_days, degree)
+        names, samples = sampler(ts, start, days, days.shape)
+
+        coefficients = np.array([_fit(x, s, segments, degree) for s in samples]).reshape(
+            (len(names), segments, degree + 1, 4))
+
+        arrays[group + '_names'] = np.array(names, dtype=str)
+        arrays[group + '_coefficients'] = coefficients
+        arrays[group + '_segment_days'] = np.array(segment_days)
+        count += len(names)
+
+    grid_file = settings.MY_EPHEMERIS_GRID_ROOT
+    with atomic_path(grid_file, '.npz') as temp_file:
+        np.savez_compressed(temp_file, **arrays)
+
+    logger.info(f'chebyshev: {count} bodies fitted from {start} to {stop} in {grid_file}')
+    return count
+
+
+def _load_grid(mpcorb_version):
+    grid = {'names': {}}
+    with np.load(settings.MY_EPHEMERIS_GRID_ROOT) as data:
+        grid['start'] = datetime.datetime.fromisoformat(str(data['start']))
+        for group in GROUPS:
+            if group + '_names' not in data.files:
+                continue
+            if group == 'asteroid' and ('mpcorb_version' not in data.files or
+                                        str(data['mpcorb_version']) != str(mpcorb_version)):
+                logger.warning('chebyshev: the asteroids in the grid are from another version of the MPCORB table')
+                continue
+            names = [str(name) for name in data[group + '_names']]
+            grid[group] = {
+                'names': names,
+                'coefficients': data[group + '_coefficients'],
+                'segment_days': float(data[group + '_segment_days']),
+            }
+            for index, name in enumerate(names):
+                grid['names'].setdefault(name.lower(), (group, index))
+                # also find asteroids by their name, 'psyche' for '(16) Psyche'
+                if name.startswith('('):
+                    grid['names'].setdefault(name.partition(')')[2].strip().lower(), (group, index))
+    return grid
+
+
+def get_grid():
+    """
+    return the loaded grid, or None when it has not been precomputed.
+    It is loaded again when the grid file or the MPCORB file changes.
+    """
+    try:
+        version = (os.stat(settings.MY_EPHEMERIS_GRID_ROOT).st_mtime_ns, mpcorb.get_file_version())
+    except OSError:
+        return None
+
+    if _cache['grid'] is None or _cache['version'] != version:
+        with _lock:
+            if _cache['grid'] is None or _cache['version'] != version:
+                _cache['grid'] = _load_grid(version[1])
+                _cache['version'] = version
+    return _cache['grid']
+
+
+def get_range():
+    """
+    the first and last moment covered by all the groups in the grid, or None
+    """
+    grid = get_grid()
+    if grid is None:
+        return None
+    days = min(grid[group]['coefficients'].shape[1] * grid[group]['segment_days']
+               for group in GROUPS if group in grid)
+    return grid['start'], grid['start'] + datetime.timedelta(days=days)
+
+
+def interpolate_track(name, timestamps, body_type=None):
+    """
+    positions of a body at a list of timestamps from the precomputed grid, evaluated for all of them at once.
+    Returns None when the body (of body_type, when given) or one of the timestamps is not in the grid,
+    otherwise a dict with the designation, body_type and the arrays ra_decimal, dec_decimal,
+    distance_from_earth and visual_magnitude.
+    """
+    grid = get_grid()
+    if grid is None or not len(timestamps):
+        return None
+
+    entry = grid['names'].get(name.strip().lower())
+    if entry is None or body_type not in (None, entry[0]):
+        return None
+    group, index = entry
+    body = grid[group]
+
+    seconds = np.array([(_to_utc(timestamp) - grid['start']).total_seconds() for timestamp in timestamps])
+    days = seconds / 86400.0
+    segments = (days // body['segment_days']).astype(int)
+    if days.min() < 0 or segments.max() >= body['coefficients'].shape[1]:
+        return None
+
+    # every timestamp has the coefficients of its own segment, shape (degree+1, 4, n)
+    x = 2.0 * (days - segments * body['segment_days']) / body['segment_days'] - 1.0
+    coefficients = body['coefficients'][index, segments].transpose(1, 2, 0)
+    px, py, pz, magnitude = chebyshev.chebval(x, coefficients, tensor=False)
+    if group == 'asteroid':
+        jd = 2440587.5 + (seconds + (grid['start'] - datetime.datetime(1970, 1, 1)).total_seconds()) / 86400.0
+        px, py, pz = np.array([px, py, pz]) - _observer_offset(jd)
+
+    distance = np.sqrt(px * px + py * py + pz * pz)
+    return {
+        'designation': body['names'][index],
+        'body_type': group,
+        'ra_decimal': np.degrees(np.arctan2(py, px)) % 360.0,
+        'dec_decimal': np.degrees(np.arcsin(pz / distance)),
+        'distance_from_earth': distance,
+        'visual_magnitude': magnitude,
+    }
+
+
+def interpolate(name, timestamp, body_type=None):
+    """
+    position of a body at the timestamp from the precomputed grid.
+    Returns None when the body (of body_type, when given) or the timestamp is not in the grid.
+    """
+    track = interpolate_track(name, [timestamp], body_type)
+    if track is None:
+        return None
+
+    return {
+        'name': name,
+        'designation': track['designation'],
+        'body_type': track['body_type'],
+        'timestamp': str(timestamp),
+        'ra_decimal': float(track['ra_decimal'][0]),
+        'dec_decimal': float(track['dec_decimal'][0]),
+        'distance_from_earth': float(track['distance_from_earth'][0]),
+        'visual_magnitude': float(track['visual_magnitude'][0]),
+    }
@@ -0,0 +1,161 @@
+# local snapshot of the Minor Planet Center comet elements (CometEls.txt)
+#
+# instead of streaming mpc.COMET_URL and grouping the whole dataframe for every request,
+# the deduplicated comet table is stored as a compressed columnar numpy file (settings.MY_COMETS_ROOT).
+# It is loaded once per worker (and again when the file changes), indexed by designation.
+# A snapshot older than COMET_SNAPSHOT_MAX_AGE is refreshed in the background,
+# /my_astrobase/update_comets/ refreshes it on demand (for instance from a daily cron job).
+# After a failed download the Minor Planet Center is not asked again for COMET_RETRY_INTERVAL seconds,
+# without a snapshot get_comets fails right away in the meantime.
+
+import os
+import time
+import logging
+import threading
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from skyfield.api import load
+from skyfield.data import mpc
+
+from .atomic_write import atomic_path
+
+logger = logging.getLogger(__name__)
+
+# refresh the snapshot once a day
+MAX_AGE = getattr(settings, 'COMET_SNAPSHOT_MAX_AGE', 24 * 3600)
+
+# after a failed download, the Minor Planet Center is not asked again for this many seconds
+RETRY_INTERVAL = getattr(settings, 'COMET_RETRY_INTERVAL', 300)
+
+_lock = threading.Lock()
+_cache = {
+    'version': None,
+    'comets': None,
+    'refreshing': False,
+    'retry_at': 0,
+    'error': None,
+}
+
+
+def _to_columns(comets):
+    # strings are stored as fixed width unicode, so that the file can be loaded without pickle
+    columns = {}
+    for column in comets.columns:
+        values = comets[column]
+        if values.dtype == object:
+            columns[column] = values.fillna('').astype(str).to_numpy(dtype=str)
+        else:
+            columns[column] = values.to_numpy()
+    return columns
+
+
+def update_comet_snapshot():
+    """
+    download the comet elements from the Minor Planet Center and store them as a local snapshot
+    https://www.minorplanetcenter.net/iau/info/CometOrbitFormat.html
+    """
+    try:
+        with load.open(mpc.COMET_URL, reload=True) as f:
+            comets = mpc.load_comets_dataframe(f)
+    except Exception as e:
+        # remember the failure, so that the requests don't all wait for the network again
+        _cache['retry_at'] = time.time() + RETRY_INTERVAL
+        _cache['error'] = e
+        raise
+    _cache['retry_at'] = 0
+
+    # keep only the most recent orbit of every comet
+    comets = (comets.sort_values('reference')
+              .groupby('designation', as_index=False).last())
+
+    snapshot = settings.MY_COMETS_ROOT
+    with atomic_path(snapshot, '.npz') as temp_file:
+        np.savez_compressed(temp_file, **_to_columns(comets))
+
+    logger.info(f'comets: stored {len(comets)} comets in {snapshot}')
+    return len(comets)
+
+
+def _refresh_in_background():
+    def refresh():
+        try:
+            update_comet_snapshot()
+        except Exception as e:
+            logger.warning(f'comets: cannot refresh {settings.MY_COMETS_ROOT}: {e}')
+        finally:
+            _cache['refreshing'] = False
+
+    with _lock:
+        if _cache['refreshing'] or time.time() < _cache['retry_at']:
+            return
+        _cache['refreshing'] = True
+
+    threading.Thread(target=refresh, daemon=True).start()
+
+
+def _snapshot_version():
+    try:
+        stat = os.stat(settings.MY_COMETS_ROOT)
+    except OSError:
+        return None, None
+    return str(stat.st_mtime_ns), stat.st_mtime
+
+
+def _load_snapshot():
+    with np.load(settings.MY_COMETS_ROOT) as data:
+        comets = pd.DataFrame({column: data[column] for column in data.files})
+    return comets.set_index('designation', drop=False)
+
+
+def get_comets():
+    """
+    return the comet table, indexed by designation
+    """
+    version, mtime = _snapshot_version()
+
+    if version is None:
+        if time.time() < _cache['retry_at']:
+            raise FileNotFoundError(f"no comet snapshot {settings.MY_COMETS_ROOT}, "
+                                    f"the download failed: {_cache['error']}")
+
+        # no snapshot yet, this request has to wait for the download
+        update_comet_snapshot()
+        version, mtime = _snapshot_version()
+
+    elif time.time() - mtime > MAX_AGE:
+        # serve the current snapshot while a fresh one is downloaded
+        _refresh_in_background()
+
+    if _cache['comets'] is not None and version == _cache['version']:
+        return _cache['comets']
+
+    with _lock:
+        if _cache['comets'] is None or version != _cache['version']:
+            _cache['comets'] = _load_snapshot()
+            _cache['version'] = version
+
+    return _cache['comets']
+
+
+def get_version():
+    """
+    the version of the currently loaded snapshot, changes when the snapshot is refreshed
+    """
+    get_comets()
+    return _cache['version']
+
+
+def get_file_version():
+    """
+    the version of the snapshot on disk (None when there is none yet), without downloading or loading it
+    """
+    return _snapshot_version()[0]
+
+
+def get_comet_row(name):
+    """
+    return the orbital elements of a comet, raises a KeyError when it is unknown
+    """
+    return get_comets().loc[name]
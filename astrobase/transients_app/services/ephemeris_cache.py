@@ -0,0 +1,51 @@
+# cache for the results of the ephemeris views (comet, asteroid, planet, bright_moon)
+#
+# For a given name and timestamp the result only changes when the source catalog changes,
+# so the key contains the body type (view), the name, the timestamp (to the minute, like the calculations)
+# and the version of the MPCORB table or the comet snapshot. A refreshed catalog gets new keys,
+# the old entries are never read again and are culled by the LRU of the 'ephemeris' cache.
+
+import hashlib
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import InvalidCacheBackendError
+
+from . import comets, mpcorb
+
+MAX_AGE = getattr(settings, 'EPHEMERIS_CACHE_MAX_AGE', 3600)
+
+
+def get_cache():
+    try:
+        return caches['ephemeris']
+    except InvalidCacheBackendError:
+        return caches['default']
+
+
+def catalog_version(body_type):
+    # the planets and bright moons come from the (static) JPL kernels
+    if body_type == 'comet':
+        return comets.get_version()
+    if body_type == 'asteroid':
+        return mpcorb.get_version()
+    return 'static'
+
+
+def make_key(body_type, name, timestamp):
+    """
+    the cache key, which is also used as ETag
+    """
+    key = '|'.join([body_type, name.strip(), timestamp.strftime('%Y-%m-%dT%H:%M'), str(catalog_version(body_type))])
+    return 'ephemeris:' + hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def get_or_compute(key, compute):
+    """
+    return the cached result for key, or compute and cache it
+    """
+    cache = get_cache()
+    result = cache.get(key)
+    if result is None:
+        result = compute()
+        cache.set(key, result)
+    return result
@@ -0,0 +1,111 @@
+# process wide registry of the skyfield ephemeris kernels and timescale
+#
+# opening a SPK file and building a timescale is expensive (especially on the Raspberry Pi),
+# so every gunicorn worker opens each kernel only once and shares it between
+# the ephemeris functions in algorithms.py and the starmap code.
+
+import os
+import threading
+from django.conf import settings
+
+from skyfield.api import load
+
+_lock = threading.Lock()
+_kernels = {}
+_timescale = None
+
+_stats = {'hits': 0, 'misses': 0, 'kernels': {}}
+
+
+def _kernel_path(filename):
+    # prefer the kernels in the repository (the bright moon kernels live there),
+    # otherwise let skyfield find (or download) it in its own directory
+    path = os.path.join(settings.REPOSITORY_ROOT, filename)
+    if os.path.exists(path):
+        return path
+    return filename
+
+
+def _count(key, hit):
+    # the caller holds _lock, so that concurrent requests do not lose counts
+    counters = _stats['kernels'].setdefault(key, {'hits': 0, 'misses': 0})
+    if hit:
+        _stats['hits'] += 1
+        counters['hits'] += 1
+    else:
+        _stats['misses'] += 1
+        counters['misses'] += 1
+
+
+def get_kernel(filename):
+    """
+    return the opened SPK kernel for this filename, open it on first use
+    @input filename: name of the SPK file, like 'de421.bsp'
+    """
+    kernel = _kernels.get(filename)
+    if kernel is not None:
+        with _lock:
+            _count(filename, True)
+        return kernel
+
+    with _lock:
+        # another thread may have opened it while we were waiting
+        kernel = _kernels.get(filename)
+        if kernel is None:
+            kernel = load(_kernel_path(filename))
+            _kernels[filename] = kernel
+            _count(filename, False)
+        else:
+            _count(filename, True)
+
+    return kernel
+
+
+def get_timescale():
+    """
+    return the shared skyfield timescale, build it on first use
+    """
+    global _timescale
+
+    if _timescale is not None:
+        with _lock:
+            _count('timescale', True)
+        return _timescale
+
+    with _lock:
+        if _timescale is None:
+            _timescale = load.timescale()
+            _count('timescale', False)
+        else:
+            _count('timescale', True)
+
+    return _timescale
+
+
+def get_stats():
+    """
+    return the hit/miss counters of the registry, overall and per kernel
+    """
+    with _lock:
+        return {
+            'hits': _stats['hits'],
+            'misses': _stats['misses'],
+            'loaded': sorted(_kernels.keys()),
+            'kernels': {key: dict(value) for key, value in _stats['kernels'].items()},
+        }
+
+
+def clear():
+    """
+    close all the kernels, they will be reopened on the next request
+    """
+    global _timescale
+
+    with _lock:
+        for kernel in _kernels.values():
+            try:
+                kernel.close()
+            except Exception:
+                pass
+        _kernels.clear()
+        _timescale = None
@@ -0,0 +1,132 @@
+# offline cache for the Minor Planet Center web service (search_orbits)
+#
+# get_minor_planets_webservice() used to do a blocking request to minorplanetcenter.net for every call.
+# Now the orbital elements come from the local MPCORB table when the asteroid is in there.
+# Otherwise the web service response is kept as a json file per designation (settings.MPC_WEBSERVICE_CACHE_ROOT).
+# A cached response older than MPC_WEBSERVICE_TTL is still returned, while a fresh one is fetched in the
+# background (stale-while-revalidate). settings.MPC_WEBSERVICE_URL can point to a local stand-in for offline use.
+
+import os
+import json
+import time
+import logging
+import hashlib
+import datetime
+import threading
+import requests
+from django.conf import settings
+
+from . import asteroid_ephemeris, mpcorb
+from .atomic_write import atomic_open
+
+logger = logging.getLogger(__name__)
+
+URL = getattr(settings, 'MPC_WEBSERVICE_URL', 'https://minorplanetcenter.net/web_service/search_orbits')
+TIMEOUT = getattr(settings, 'MPC_WEBSERVICE_TIMEOUT', 10)
+TTL = getattr(settings, 'MPC_WEBSERVICE_TTL', 7 * 24 * 3600)
+
+_lock = threading.Lock()
+_refreshing = set()
+
+
+def _cache_file(name):
+    key = hashlib.sha1(name.strip().lower().encode('utf-8')).hexdigest()
+    return os.path.join(settings.MPC_WEBSERVICE_CACHE_ROOT, key + '.json')
+
+
+def _read_cache(name):
+    try:
+        with open(_cache_file(name)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_cache(name, orbital_elements):
+    os.makedirs(settings.MPC_WEBSERVICE_CACHE_ROOT, exist_ok=True)
+    with atomic_open(_cache_file(name)) as f:
+        json.dump({'name': name, 'fetched_at': time.time(), 'orbital_elements': orbital_elements}, f)
+
+
+def fetch(name):
+    """
+    ask the web service for the orbital elements of name, and cache the response
+    """
+    params = {'name': name, 'json': 1}
+    r = requests.get(URL, params, auth=('mpc_ws', 'mpc!!ws'), timeout=TIMEOUT)
+    r.raise_for_status()
+    orbital_elements = r.json()
+    if not orbital_elements:
+        raise KeyError(f"{name} is unknown at {URL}")
+
+    _write_cache(name, orbital_elements)
+    return orbital_elements
+
+
+def _refresh_in_background(name):
+    def refresh():
+        try:
+            fetch(name)
+        except Exception as e:
+            logger.warning(f'mpc_webservice: cannot refresh {name}: {e}')
+        finally:
+            with _lock:
+                _refreshing.discard(name)
+
+    with _lock:
+        if name in _refreshing:
+            return
+        _refreshing.add(name)
+
+    threading.Thread(target=refresh, daemon=True).start()
+
+
+def _from_mpcorb(row):
+    # the MPCORB row in the format of the web service, which returns the values as strings
+    epoch_jd = asteroid_ephemeris.packed_epoch_to_jd(str(row['epoch_packed']))
+    epoch = datetime.datetime(2000, 1, 1, 12) + datetime.timedelta(days=epoch_jd - 2451545.0)
+    last_opposition = str(row['observation_period']).split('-')[-1].strip()
+
+    return {
+        'designation': row['designation'],
+        'epoch': epoch.strftime('%Y-%m-%d.0'),
+        'epoch_jd': str(epoch_jd),
+        'inclination': str(row['inclination_degrees']),
+        'ascending_node': str(row['longitude_of_ascending_node_degrees']),
+        'argument_of_perihelion': str(row['argument_of_perihelion_degrees']),
+        'semimajor_axis': str(row['semimajor_axis_au']),
+        'mean_daily_motion': str(row['mean_daily_motion_degrees']),
+        'eccentricity': str(row['eccentricity']),
+        'mean_anomaly': str(row['mean_anomaly_degrees']),
+        'last_opposition_used': last_opposition,
+        'absolute_magnitude': str(row['magnitude_H']),
+        'phase_slope': str(row['magnitude_G']),
+        'observations': str(row['observations']),
+        'oppositions': str(row['oppositions']),
+        'source': 'mpcorb',
+    }
+
+
+def get_orbital_elements(name):
+    """
+    the orbital elements of a minor planet as a list of dicts, like the search_orbits web service returns them
+    """
+    # the local MPCORB table first
+    try:
+        designation = mpcorb.find_designation(name, exact=True)
+    except Exception as e:
+        logger.warning(f'mpc_webservice: MPCORB table not available: {e}')
+        designation = None
+    if designation:
+        return [_from_mpcorb(mpcorb.get_orbits().loc[designation])]
+
+    cached = _read_cache(name)
+    if cached is None:
+        # nothing cached yet, this request has to wait for the web service
+        return fetch(name)
+
+    if time.time() - cached['fetched_at'] > TTL:
+        # serve the cached response while a fresh one is fetched
+        _refresh_in_background(name)
+
+    return cached['orbital_elements']
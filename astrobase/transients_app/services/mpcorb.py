@@ -0,0 +1,254 @@
+# in-memory cache of the MPCORB orbital elements (asteroids.txt)
+#
+# parsing the MPCORB file with skyfield is expensive, so the parsed and indexed table is kept
+# in memory and shared by get_asteroid, the /asteroid/ view and the ephemeris updater.
+# The source is the complete MPCORB file (settings.MY_MPCORB_ROOT) when it is available,
+# otherwise the 1000 asteroids of settings.MY_ASTEROIDS_ROOT or settings.MY_ASTEROIDS_URL.
+# The table is only reloaded when the source file changes: the mtime of the local file,
+# or the ETag of settings.MY_ASTEROIDS_URL when there is no local file.
+
+import os
+import time
+import logging
+import threading
+import requests
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from skyfield.api import load
+from skyfield.data import mpc
+
+logger = logging.getLogger(__name__)
+
+# how often (in seconds) the remote ETag is checked, a HEAD request per asteroid would defeat the cache
+CHECK_INTERVAL = getattr(settings, 'MPCORB_CHECK_INTERVAL', 300)
+
+# a part of a designation must be at least this long, and fit only one asteroid
+MIN_PARTIAL_LENGTH = 4
+
+_lock = threading.Lock()
+_cache = {
+    'version': None,
+    'checked_at': 0,
+    'orbits': None,
+    'names': None,
+    'packed': None,
+    'lowercase': None,
+}
+
+
+def _local_file():
+    # the first local source that exists, or None
+    for filename in (getattr(settings, 'MY_MPCORB_ROOT', None), settings.MY_ASTEROIDS_ROOT):
+        if filename and os.path.exists(filename):
+            return filename
+    return None
+
+
+def _local_version():
+    try:
+        filename = _local_file()
+        stat = os.stat(filename)
+        return 'mtime:' + filename + ':' + str(stat.st_mtime_ns) + ':' + str(stat.st_size)
+    except (OSError, TypeError):
+        return None
+
+
+def _remote_version():
+    try:
+        r = requests.head(settings.MY_ASTEROIDS_URL, timeout=10)
+        return 'etag:' + r.headers.get('ETag', r.headers.get('Last-Modified', ''))
+    except Exception as e:
+        logger.warning(f'mpcorb: cannot check {settings.MY_ASTEROIDS_URL}: {e}')
+        return None
+
+
+def _current_version():
+    """
+    the version of the source file, a local mtime is cheap and always checked,
+    a remote ETag is only checked every CHECK_INTERVAL seconds.
+    """
+    version = _local_version()
+    if version:
+        return version
+
+    now = time.time()
+    if _cache['version'] and now - _cache['checked_at'] < CHECK_INTERVAL:
+        return _cache['version']
+
+    _cache['checked_at'] = now
+    return _remote_version() or _cache['version']
+
+
+def _load_orbits():
+    source = _local_file()
+    if source:
+        with open(source, 'rb') as f:
+            minor_planets = mpc.load_mpcorb_dataframe(f)
+    else:
+        source = settings.MY_ASTEROIDS_URL
+        with load.open(source, reload=True) as f:
+            minor_planets = mpc.load_mpcorb_dataframe(f)
+
+    bad_orbits = minor_planets.semimajor_axis_au.isnull()
+    minor_planets = minor_planets[~bad_orbits]
+
+    # Index by designation for fast lookup.
+    minor_planets = minor_planets.set_index('designation', drop=False)
+    logger.info(f'mpcorb: loaded {len(minor_planets)} orbits from {source}')
+    return minor_planets
+
+
+def _unique(names):
+    # a name that fits more than one asteroid keeps the first one. is_unique builds the hash table of the
+    # index, the lookups use the same table later
+    if names.index.is_unique:
+        return names
+    return names[~names.index.duplicated(keep='first')]
+
+
+def _build_names(orbits):
+    # the lookups of the numbers '1' and the lowercase names 'ceres', each a Series name => designation.
+    # The designations themselves are looked up in the index of the table. MPCORB has 1.3M orbits,
+    # so this is done once per table and without a dict of all the ~4M names.
+    designations = orbits['designation'].dropna().to_numpy()
+    numbered = designations[np.array([designation.startswith('(') for designation in designations], dtype=bool)]
+    parts = [designation[1:].partition(')') for designation in numbered]
+
+    return (_unique(pd.Series(numbered, index=[number.strip() for number, _, _ in parts])),
+            _unique(pd.Series(numbered, index=[rest.strip().lower() for _, _, rest in parts])))
+
+
+def _packed_names():
+    # the lookup of the lowercase packed designations '00001', only made for the first name
+    # that is not a designation, number or name
+    packed = _cache['packed']
+    if packed is None:
+        orbits = get_orbits()
+        valid = orbits['designation'].notna().to_numpy()
+        packed = _cache['packed'] = _unique(pd.Series(
+            orbits['designation'].to_numpy()[valid],
+            index=[str(packed).strip().lower() for packed in orbits['designation_packed'].to_numpy()[valid]]))
+    return packed
+
+
+def get_orbits():
+    """
+    return the MPCORB table, indexed by designation. (Re)load it when the source has changed.
+    """
+    version = _current_version()
+
+    if _cache['orbits'] is not None and version == _cache['version']:
+        return _cache['orbits']
+
+    with _lock:
+        if _cache['orbits'] is None or version != _cache['version']:
+            orbits = _load_orbits()
+            _cache['names'] = _build_names(orbits)
+            _cache['packed'] = None
+            _cache['lowercase'] = None
+            _cache['orbits'] = orbits
+            _cache['version'] = version
+
+    return _cache['orbits']
+
+
+def get_version():
+    """
+    the version of the currently loaded table, changes when the source file is refreshed
+    """
+    get_orbits()
+    return _cache['version']
+
+
+def get_file_version():
+    """
+    the version of the local source file, without loading it. Without a local file this is the version
+    of the table that is already loaded (or None), the remote ETag is not checked.
+    """
+    return _local_version() or _cache['version']
+
+
+def _partial_index():
+    # the lowercase designations in the order of the table, joined into one text with the offset of every
+    # designation, so that a part is searched with str.find instead of a loop over 1.3M strings.
+    # Only made for the first partial search of a table.
+    index = _cache['lowercase']
+    if index is None:
+        designations = [str(designation).lower() for designation in get_orbits().index]
+        offsets = np.cumsum([0] + [len(designation) + 1 for designation in designations])
+        index = _cache['lowercase'] = ('\n'.join(designations), offsets)
+    return index
+
+
+def _find_partial(key):
+    # like 'designation__icontains', but only when the part fits exactly one asteroid,
+    # a short typo must not resolve to an arbitrary asteroid
+    if len(key) < MIN_PARTIAL_LENGTH or '\n' in key:
+        return None
+
+    text, offsets = _partial_index()
+    found = text.find(key)
+    if found < 0:
+        return None
+
+    # the row of the first match, and no match in any of the designations after it
+    row = int(np.searchsorted(offsets, found, side='right')) - 1
+    if text.find(key, offsets[row + 1]) >= 0:
+        return None
+    return get_orbits().index[row]
+
+
+def find_designation(name, exact=False):
+    """
+    translate a name like 'psyche', '16', '00016', '2003 ab12' or '(16) Psyche' into the designation
+    used in the table. Unless exact, a part of a designation is also accepted when it fits only one asteroid.
+    Returns None when the asteroid is unknown.
+    """
+    orbits = get_orbits()
+    name = name.strip()
+    # provisional designations like '2003 AB12' are in uppercase
+    for designation in (name, name.upper()):
+        if designation in orbits.index:
+            return designation
+
+    key = name.lower()
+    numbers, names = _cache['names']
+
+    # '16', '(16)' and '(16) psyche'
+    number, _, rest = key[1:].partition(')') if key.startswith('(') else (key, '', '')
+    designation = numbers.get(number.strip())
+    if designation is not None and (not rest.strip() or names.get(rest.strip()) == designation):
+        return designation
+
+    designation = names.get(key)
+    if designation is None:
+        designation = _packed_names().get(key)
+    if designation is not None:
+        return designation
+
+    if exact:
+        return None
+
+    return _find_partial(key)
+
+
+def get_orbit(name):
+    """
+    return the row with the orbital elements of an asteroid, raises a KeyError when it is unknown
+    """
+    designation = find_designation(name)
+    if designation is None:
+        raise KeyError(f"{name} is not in {settings.MY_ASTEROIDS_URL}")
+    return get_orbits().loc[designation]
+
+
+def clear():
+    with _lock:
+        _cache['version'] = None
+        _cache['checked_at'] = 0
+        _cache['orbits'] = None
+        _cache['names'] = None
+        _cache['packed'] = None
+        _cache['lowercase'] = None
@@ -0,0 +1,180 @@
+# render the starmaps in a small pool of background processes
+#
+# The /starmap/ view used to render the matplotlib figure inside the request. Now it submits a job and
+# returns at once, the job is the hash of the starmap (starmaps.starmap_key), so identical requests share
+# a job and a finished job is just the cached image.
+# The workers run matplotlib headless, are replaced after STARMAP_RENDER_TASKS_PER_WORKER starmaps and
+# cannot grow beyond STARMAP_RENDER_MAX_MEMORY_MB. The state of the jobs that are not finished is kept in
+# a small json file next to the images, so that every gunicorn worker can answer the status requests.
+
+import os
+import re
+import sys
+import json
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, CancelledError
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+
+from .atomic_write import atomic_open
+
+WORKERS = getattr(settings, 'STARMAP_RENDER_WORKERS', 1)
+TASKS_PER_WORKER = getattr(settings, 'STARMAP_RENDER_TASKS_PER_WORKER', 20)
+MAX_MEMORY_MB = getattr(settings, 'STARMAP_RENDER_MAX_MEMORY_MB', 1024)
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_pool = None
+_submitted = 0
+_jobs = {}
+
+
+def _init_worker(settings_module, max_memory_mb):
+    # this runs in a fresh (spawned) process, before it gets any starmap to render
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    os.environ['MPLBACKEND'] = 'Agg'
+
+    if max_memory_mb:
+        try:
+            import resource
+            limit = max_memory_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ImportError, ValueError, OSError) as e:
+            logger.warning(f'render_queue: cannot limit the memory of the worker: {e}')
+
+    import django
+    django.setup()
+
+
+def _render(key, name, timestamp, days_past, days_future, fov, magnitude):
+    # runs in the worker, starmaps is imported here because it needs the django setup of _init_worker
+    from . import starmaps
+    return starmaps.render_cached_starmap(key, name, timestamp, days_past, days_future, fov, magnitude)
+
+
+def _get_pool(broken=False):
+    global _pool, _submitted
+    # python 3.11 replaces the workers itself (max_tasks_per_child), before that the whole pool is replaced
+    # after WORKERS * TASKS_PER_WORKER starmaps. The old pool still finishes the starmaps it already has.
+    recycle = sys.version_info < (3, 11) and _submitted >= WORKERS * TASKS_PER_WORKER
+
+    if (broken or recycle) and _pool is not None:
+        # when a worker was killed (by the OS), the pool is broken and its queued starmaps are cancelled
+        _pool.shutdown(wait=False, cancel_futures=broken)
+        _pool = None
+
+    if _pool is None:
+        kwargs = {}
+        if sys.version_info >= (3, 11):
+            kwargs['max_tasks_per_child'] = TASKS_PER_WORKER
+
+        # spawn instead of fork: the workers are replaced while the web server runs threads
+        _pool = ProcessPoolExecutor(
+            max_workers=WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'astrobase.settings.base'), MAX_MEMORY_MB),
+            **kwargs
+        )
+        _submitted = 0
+
+    _submitted += 1
+    return _pool
+
+
+def _job_file(key):
+    from . import starmaps
+    return os.path.join(settings.MEDIA_ROOT, starmaps.STARMAP_CACHE_DIR, key + '.json')
+
+
+def _write_job(key, state):
+    job_file = _job_file(key)
+    os.makedirs(os.path.dirname(job_file), exist_ok=True)
+
+    with atomic_open(job_file) as f:
+        json.dump(dict(state, updated_at=time.time()), f)
+
+
+def _read_job(key):
+    try:
+        with open(_job_file(key)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _finished(key, future):
+    with _lock:
+        _jobs.pop(key, None)
+
+    try:
+        future.result()
+    except (Exception, CancelledError) as e:
+        logger.warning(f'render_queue: starmap {key} failed: {e}')
+        # a MemoryError (the memory limit of the worker) has no message
+        _write_job(key, {'status': 'failed', 'error': str(e) or type(e).__name__})
+        return
+
+    try:
+        os.remove(_job_file(key))
+    except OSError:
+        pass
+
+
+def submit_starmap(name, timestamp, days_past, days_future, fov, magnitude):
+    """
+    queue the rendering of a starmap, unless it is already cached or queued. Returns the job (key).
+    """
+    from . import starmaps
+    key = starmaps.starmap_key(name, timestamp, days_past, days_future, fov, magnitude)
+    if starmaps.get_cached_starmap(key) is not None:
+        return key
+
+    with _lock:
+        if key in _jobs:
+            return key
+
+        _write_job(key, {'status': 'queued'})
+        args = (_render, key, name, timestamp, days_past, days_future, fov, magnitude)
+        try:
+            future = _get_pool().submit(*args)
+        except BrokenProcessPool:
+            future = _get_pool(broken=True).submit(*args)
+        _jobs[key] = future
+
+    future.add_done_callback(lambda f: _finished(key, f))
+    return key
+
+
+def get_status(key):
+    """
+    the status of a job: 'done' (with the url of the image), 'queued', 'running', 'failed' (with the error)
+    or 'unknown'
+    """
+    from . import starmaps
+    if not re.fullmatch('[0-9a-f]{40}', key):
+        # the job comes from the request, it must never become an arbitrary path
+        return {'job': key, 'status': 'unknown'}
+
+    path, image_url = starmaps.starmap_file(key)
+    if os.path.exists(path):
+        return {'job': key, 'status': 'done', 'url': image_url}
+
+    with _lock:
+        future = _jobs.get(key)
+    if future is not None:
+        return {'job': key, 'status': 'running' if future.running() else 'queued', 'url': image_url}
+
+    # submitted by another web server process
+    job = _read_job(key)
+    if job is None:
+        return {'job': key, 'status': 'unknown'}
+
+    status = {'job': key, 'status': job['status'], 'url': image_url}
+    if 'error' in job:
+        status['error'] = job['error']
+    return status
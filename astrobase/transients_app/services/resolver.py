@@ -0,0 +1,105 @@
+# name resolver for the transients
+#
+# get_transients_as_json used to find out what a name refers to by trying get_bright_moon, get_comet,
+# get_asteroid and get_planet in turn and catching their exceptions, which loaded kernels and catalogs
+# for every failed attempt. Here the names of the bright moons, the planets and the comet snapshot are
+# indexed once, so that a name resolves to its body type and designation with a lookup. The index is rebuilt
+# when the comet snapshot changes. The asteroids are looked up in the name index of the MPCORB table.
+
+import logging
+import threading
+
+from . import algorithms, chebyshev, comets, mpcorb
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_cache = {
+    'version': None,
+    'names': None,
+    'static_names': None,
+}
+
+
+def _static_names():
+    # the bright moons and planets are known without loading anything
+    if _cache['static_names'] is None:
+        names = {}
+        for name in algorithms.MOON_KERNELS:
+            names[name.lower()] = ('bright_moon', name)
+        for name in chebyshev.PLANETS:
+            names.setdefault(name.lower(), ('planet', name))
+        _cache['static_names'] = names
+    return _cache['static_names']
+
+
+def _comet_names(names):
+    # 'c/1995 o1 (hale-bopp)' and 'hale-bopp' => 'C/1995 O1 (Hale-Bopp)'
+    for designation in comets.get_comets()['designation']:
+        names.setdefault(designation.lower(), ('comet', designation))
+        if designation.endswith(')') and '(' in designation:
+            alias = designation[designation.rindex('(') + 1:-1].strip().lower()
+            names.setdefault(alias, ('comet', designation))
+
+
+def _version():
+    try:
+        return comets.get_version()
+    except Exception as e:
+        logger.warning(f'resolver: comets are not available: {e}')
+        return None
+
+
+def get_names():
+    """
+    the lowercase name index of the comets, name => ('comet', designation)
+    """
+    version = _version()
+    if _cache['names'] is not None and version == _cache['version']:
+        return _cache['names']
+
+    with _lock:
+        if _cache['names'] is None or version != _cache['version']:
+            names = {}
+            try:
+                _comet_names(names)
+            except Exception as e:
+                logger.warning(f'resolver: cannot index the comets: {e}')
+            _cache['names'] = names
+            _cache['version'] = version
+
+    return _cache['names']
+
+
+def resolve(name):
+    """
+    resolve the name of a transient into (body_type, designation),
+    body_type is 'bright_moon', 'planet', 'comet' or 'asteroid'.
+    Raises a KeyError when the name is unknown.
+    """
+    key = name.strip().lower()
+
+    # the bright moons and planets first, they don't need the catalogs
+    entry = _static_names().get(key)
+    if entry:
+        return entry
+
+    # comets before asteroids, like the order of the old exception cascade
+    entry = get_names().get(key)
+    if entry:
+        return entry
+
+    try:
+        designation = mpcorb.find_designation(key, exact=True)
+    except Exception as e:
+        logger.warning(f'resolver: MPCORB table is not available: {e}')
+        designation = None
+    if designation is None:
+        raise KeyError(f"{name} is not a known bright moon, planet, comet or asteroid")
+    return 'asteroid', designation
+
+
+def clear():
+    with _lock:
+        _cache['version'] = None
+        _cache['names'] = None
@@ -0,0 +1,182 @@
+# spatial index of positions on the sky
+#
+# The positions are bucketed in iso-latitude rings (like HEALPix): rings of equal height in sin(dec),
+# each divided into a number of RA cells proportional to its circumference, so that all the cells have
+# about the same area. The positions are sorted by cell, a query only collects the cells that overlap
+# the cone or box and then tests those candidates exactly. Cones and boxes across RA=0 and around
+# the poles are handled.
+
+import math
+import numpy as np
+
+
+def _unit_vectors(ra, dec):
+    ra = np.radians(ra)
+    dec = np.radians(dec)
+    return np.array([np.cos(dec) * np.cos(ra), np.cos(dec) * np.sin(ra), np.sin(dec)])
+
+
+def enclosing_cone(ra, dec):
+    """
+    the smallest cone around the mean direction of the given points (degrees), returns (ra, dec, radius)
+    """
+    vectors = _unit_vectors(np.asarray(ra, dtype=float), np.asarray(dec, dtype=float))
+    center = vectors.sum(axis=1)
+    center = center / np.linalg.norm(center)
+
+    radius = np.degrees(np.arccos(np.clip(center.dot(vectors), -1.0, 1.0))).max()
+    center_ra = math.degrees(math.atan2(center[1], center[0])) % 360.0
+    center_dec = math.degrees(math.asin(center[2]))
+    return center_ra, center_dec, float(radius)
+
+
+class SkyIndex:
+    def __init__(self, ra, dec, rings=180):
+        """
+        ra, dec: arrays with the positions in degrees. NaN positions are kept, but never found.
+        """
+        self.rings = rings
+
+        # the rings are bounded by equal steps in sin(dec), the number of cells follows the circumference
+        z_edges = np.linspace(-1.0, 1.0, rings + 1)
+        ring_dec = np.arcsin((z_edges[:-1] + z_edges[1:]) / 2.0)
+        self.cells_per_ring = np.maximum(1, np.round(2 * rings * np.cos(ring_dec))).astype(int)
+        self.ring_offset = np.concatenate([[0], np.cumsum(self.cells_per_ring)])
+        self.total_cells = int(self.ring_offset[-1])
+
+        self.ra = np.array(ra, dtype=float)
+        self.dec = np.array(dec, dtype=float)
+        self.vectors = _unit_vectors(self.ra, self.dec)
+        self.cells = self._cells(self.ra, self.dec)
+        self._sort()
+
+    def __len__(self):
+        return len(self.ra)
+
+    def _ring(self, dec):
+        z = np.sin(np.radians(dec))
+        return np.clip(np.floor((z + 1.0) / 2.0 * self.rings), 0, self.rings - 1).astype(int)
+
+    def _cells(self, ra, dec):
+        # NaN positions go into an extra cell after the last one, which is never queried
+        valid = ~(np.isnan(ra) | np.isnan(dec))
+        cells = np.full(len(ra), self.total_cells, dtype=int)
+
+        ring = self._ring(dec[valid])
+        n = self.cells_per_ring[ring]
+        column = np.minimum(np.floor(np.mod(ra[valid], 360.0) / 360.0 * n).astype(int), n - 1)
+        cells[valid] = self.ring_offset[ring] + column
+        return cells
+
+    def _sort(self):
+        self.order = np.argsort(self.cells, kind='stable')
+        self._count_cells()
+
+    def _count_cells(self):
+        self.cell_start = np.searchsorted(self.cells[self.order], np.arange(self.total_cells + 1))
+
+    def _move(self, rows, cells):
+        # take the moved rows out of the sorted order and merge them back in at their new cells
+        is_moved = np.zeros(len(self.ra), dtype=bool)
+        is_moved[rows] = True
+        keep = self.order[~is_moved[self.order]]
+
+        self.cells[rows] = cells
+        moved = rows[np.argsort(cells, kind='stable')]
+        positions = np.searchsorted(self.cells[keep], self.cells[moved], side='right')
+        self.order = np.insert(keep, positions, moved)
+        self._count_cells()
+
+    def update(self, ra, dec, rows=None):
+        """
+        move the positions of the given rows (default: all rows) to new coordinates.
+        Only the positions that move to another cell are taken out and merged back into the sorted order.
+        """
+        if rows is None:
+            rows = np.arange(len(self.ra))
+        rows = np.asarray(rows)
+        ra = np.asarray(ra, dtype=float)
+        dec = np.asarray(dec, dtype=float)
+
+        self.ra[rows] = ra
+        self.dec[rows] = dec
+        self.vectors[:, rows] = _unit_vectors(ra, dec)
+
+        cells = self._cells(ra, dec)
+        moved = cells != self.cells[rows]
+        if moved.any():
+            self._move(rows[moved], cells[moved])
+        return int(moved.sum())
+
+    def _candidates(self, dec_min, dec_max, ra_min, ra_width):
+        """
+        the rows in the cells that overlap a dec band and an RA interval (starting at ra_min, ra_width wide)
+        """
+        first_ring = int(self._ring(np.array([dec_min]))[0])
+        last_ring = int(self._ring(np.array([dec_max]))[0])
+
+        slices = []
+        for ring in range(first_ring, last_ring + 1):
+            n = int(self.cells_per_ring[ring])
+            offset = int(self.ring_offset[ring])
+
+            if ra_width >= 360.0:
+                columns = [(0, n - 1)]
+            else:
+                first = int(math.floor(ra_min / 360.0 * n))
+                last = int(math.floor((ra_min + ra_width) / 360.0 * n))
+                if last - first + 1 >= n:
+                    columns = [(0, n - 1)]
+                else:
+                    first, last = first % n, last % n
+                    # the interval can run across RA=0
+                    columns = [(first, last)] if first <= last else [(first, n - 1), (0, last)]
+
+            for first, last in columns:
+                start = self.cell_start[offset + first]
+                stop = self.cell_start[offset + last + 1]
+                if stop > start:
+                    slices.append(self.order[start:stop])
+
+        if not slices:
+            return np.empty(0, dtype=int)
+        return np.concatenate(slices)
+
+    def query_cone(self, ra, dec, radius):
+        """
+        the rows within radius (degrees) of (ra, dec), sorted
+        """
+        dec_min = max(dec - radius, -90.0)
+        dec_max = min(dec + radius, 90.0)
+
+        # the RA half width of the cone, the whole ring when the cone contains a pole
+        cos_dec = math.cos(math.radians(dec))
+        sin_radius = math.sin(math.radians(radius))
+        if dec_min <= -90.0 or dec_max >= 90.0 or radius >= 90.0 or sin_radius >= cos_dec:
+            ra_min, ra_width = 0.0, 360.0
+        else:
+            half_width = math.degrees(math.asin(sin_radius / cos_dec))
+            ra_min, ra_width = (ra - half_width) % 360.0, 2 * half_width
+
+        rows = self._candidates(dec_min, dec_max, ra_min, ra_width)
+        center = _unit_vectors(np.array(ra, dtype=float), np.array(dec, dtype=float))
+        inside = center.dot(self.vectors[:, rows]) >= math.cos(math.radians(radius))
+        return np.sort(rows[inside])
+
+    def query_box(self, ra_min, ra_max, dec_min, dec_max):
+        """
+        the rows with ra_min <= ra <= ra_max and dec_min <= dec <= dec_max, sorted.
+        A box with ra_min > ra_max runs across RA=0, for instance (350, 10).
+        """
+        ra_width = ra_max - ra_min
+        if ra_width < 0:
+            ra_width += 360.0
+        ra_min = ra_min % 360.0
+
+        rows = self._candidates(dec_min, dec_max, ra_min, ra_width)
+        ra = self.ra[rows]
+        dec = self.dec[rows]
+        inside = (dec >= dec_min) & (dec <= dec_max)
+        if ra_width < 360.0:
+            inside &= np.mod(ra - ra_min, 360.0) <= ra_width
+        return np.sort(rows[inside])
@@ -0,0 +1,175 @@
+# preprocessed Hipparcos star catalog and Stellarium constellation lines for the starmaps
+#
+# create_starmap() used to parse the whole hip_main.dat and download constellationship.fab for every request.
+# build_star_catalog() (python manage.py build_star_catalog) converts them once into numpy files
+# in the directory settings.MY_STAR_CATALOG_ROOT:
+#   stars.npy    the Hipparcos columns that skyfield needs, as a structured array
+#   vectors.npy  the ICRS unit vectors of the stars (at the catalog epoch), shape (N, 3)
+#   edges.npy    the constellation lines as pairs of row numbers in stars.npy, shape (M, 2)
+# get_star_catalog() memory-maps them once per worker, it never builds the catalog itself.
+
+import os
+import logging
+import threading
+import numpy as np
+from django.conf import settings
+
+from skyfield.api import Star, load
+from skyfield.data import hipparcos, stellarium
+
+from .atomic_write import atomic_path
+
+logger = logging.getLogger(__name__)
+
+STAR_DTYPE = np.dtype([
+    ('hip', 'i4'),
+    ('magnitude', 'f8'),
+    ('ra_degrees', 'f8'),
+    ('dec_degrees', 'f8'),
+    ('parallax_mas', 'f8'),
+    ('ra_mas_per_year', 'f8'),
+    ('dec_mas_per_year', 'f8'),
+])
+
+# the Hipparcos positions are for J1991.25, as a julian date (like Star.from_dataframe)
+HIPPARCOS_EPOCH = 1721045.0 + 1991.25 * 365.25
+
+# extra radius (degrees) of the preselection cone of a starmap, for the proper motion since the catalog epoch
+# (the fastest star moves about 0.1 degree in 35 years), parallax and aberration
+STARMAP_CONE_MARGIN = getattr(settings, 'STARMAP_CONE_MARGIN', 0.25)
+
+_lock = threading.Lock()
+_cache = {
+    'version': None,
+    'catalog': None,
+}
+
+
+def _open(root, url):
+    # the local copy when it is there, otherwise download it
+    if os.path.exists(root):
+        return open(root, 'rb')
+    return load.open(url)
+
+
+def unit_vectors(ra_degrees, dec_degrees):
+    ra = np.radians(ra_degrees)
+    dec = np.radians(dec_degrees)
+    return np.column_stack([np.cos(dec) * np.cos(ra), np.cos(dec) * np.sin(ra), np.sin(dec)])
+
+
+def build_star_catalog():
+    """
+    convert hip_main.dat and constellationship.fab into the numpy files of the star catalog
+    """
+    with _open(settings.MY_HIPPARCOS_ROOT, settings.MY_HIPPARCOS_URL) as f:
+        df = hipparcos.load_dataframe(f)
+
+    with _open(settings.MY_CONSTELLATIONS_ROOT, settings.MY_CONSTELLATIONS_URL) as f:
+        constellations = stellarium.parse_constellations(f)
+
+    stars = np.zeros(len(df), dtype=STAR_DTYPE)
+    stars['hip'] = df.index.to_numpy()
+    for column in STAR_DTYPE.names[1:]:
+        stars[column] = df[column].to_numpy(dtype=float)
+
+    vectors = unit_vectors(stars['ra_degrees'], stars['dec_degrees'])
+
+    # translate the Hipparcos numbers of the lines into row numbers
+    rows = {hip: row for row, hip in enumerate(stars['hip'])}
+    edges = [(rows[star1], rows[star2]) for _, lines in constellations for star1, star2 in lines
+             if star1 in rows and star2 in rows]
+    edges = np.array(edges, dtype='i4').reshape(-1, 2)
+
+    # stars.npy last, its mtime is the version of the catalog
+    root = settings.MY_STAR_CATALOG_ROOT
+    os.makedirs(root, exist_ok=True)
+    for name, array in (('vectors', vectors), ('edges', edges), ('stars', stars)):
+        with atomic_path(os.path.join(root, name + '.npy'), '.npy') as temp_file:
+            np.save(temp_file, array)
+
+    logger.info(f'star_catalog: {len(stars)} stars and {len(edges)} constellation lines in {root}')
+    return len(stars)
+
+
+def _catalog_version():
+    try:
+        return os.stat(os.path.join(settings.MY_STAR_CATALOG_ROOT, 'stars.npy')).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _load_catalog():
+    root = settings.MY_STAR_CATALOG_ROOT
+    return {
+        'stars': np.load(os.path.join(root, 'stars.npy'), mmap_mode='r'),
+        'vectors': np.load(os.path.join(root, 'vectors.npy'), mmap_mode='r'),
+        'edges': np.load(os.path.join(root, 'edges.npy')),
+    }
+
+
+def get_star_catalog():
+    """
+    return the star catalog as a dict with 'stars', 'vectors' and 'edges'.
+    Raises a FileNotFoundError when the catalog has not been built.
+    """
+    version = _catalog_version()
+    if version is None:
+        # parsing hip_main.dat and downloading the constellations does not belong in a request
+        raise FileNotFoundError(f"no star catalog in {settings.MY_STAR_CATALOG_ROOT}, "
+                                f"create it with 'python manage.py build_star_catalog'")
+
+    if _cache['catalog'] is not None and version == _cache['version']:
+        return _cache['catalog']
+
+    with _lock:
+        if _cache['catalog'] is None or version != _cache['version']:
+            _cache['catalog'] = _load_catalog()
+            _cache['version'] = version
+
+    return _cache['catalog']
+
+
+def get_file_version():
+    """
+    the version of the catalog on disk (None when it is not built yet), without building or loading it
+    """
+    return _catalog_version()
+
+
+def select_stars(catalog, center, radius, magnitude_limit):
+    """
+    the rows of the stars brighter than magnitude_limit within radius (degrees) of the direction center (xyz),
+    and the stars of the constellation lines. Returns (rows, edges) with the edges as positions in rows.
+    """
+    center = np.asarray(center, dtype=float)
+    center = center / np.linalg.norm(center)
+    margin = STARMAP_CONE_MARGIN
+
+    if radius + margin >= 180.0:
+        selected = np.ones(len(catalog['stars']), dtype=bool)
+    else:
+        # stars without a position give NaN and drop out
+        selected = catalog['vectors'].dot(center) >= np.cos(np.radians(radius + margin))
+    selected &= catalog['stars']['magnitude'] <= magnitude_limit
+
+    # the lines also cross the chart when their stars are outside of it, so those stars are always included
+    edges = catalog['edges']
+    selected[edges.ravel()] = True
+
+    rows = np.flatnonzero(selected)
+    return rows, np.searchsorted(rows, edges)
+
+
+def as_star(stars):
+    """
+    a skyfield Star for (a selection of) the rows of the catalog, like Star.from_dataframe
+    """
+    return Star(
+        ra_hours=np.asarray(stars['ra_degrees']) / 15.0,
+        dec_degrees=np.asarray(stars['dec_degrees']),
+        ra_mas_per_year=np.asarray(stars['ra_mas_per_year']),
+        dec_mas_per_year=np.asarray(stars['dec_mas_per_year']),
+        parallax_mas=np.asarray(stars['parallax_mas']),
+        epoch=HIPPARCOS_EPOCH,
+    )
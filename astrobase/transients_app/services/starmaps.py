@@ -1,7 +1,17 @@
 # create starmaps using skyfield and matplotlib
-
+#
+# The rendered starmaps are cached in MEDIA_ROOT/starmaps, with a hash of the arguments and the catalog
+# versions as filename. A repeated request returns the url of the cached image. When the cache grows
+# beyond STARMAP_CACHE_MAX_BYTES, the least recently used images are removed.
+# The /starmap/ view renders them in the background with render_queue, matplotlib runs headless (Agg)
+# and every process reuses a single figure.
+
+import hashlib
+import threading
 import numpy as np
 try:
+    import matplotlib
+    matplotlib.use('Agg')
     from matplotlib import pyplot as plt
     from matplotlib.collections import LineCollection
 except:
@@ -9,16 +19,119 @@ except:
 
 from skyfield.api import Star, load
 from skyfield.constants import GM_SUN_Pitjeva_2005_km3_s2 as GM_SUN
-from skyfield.data import hipparcos, mpc, stellarium
+from skyfield.data import mpc
 from skyfield.projections import build_stereographic_projection
 
 import os
 from django.conf import settings
 
-from . import algorithms
+from . import algorithms, kernels, star_catalog, comets, mpcorb
+from .atomic_write import atomic_path
+
+STARMAP_CACHE_DIR = 'starmaps'
+STARMAP_CACHE_MAX_BYTES = getattr(settings, 'STARMAP_CACHE_MAX_BYTES', 200 * 1024 * 1024)
+
+_lock = threading.Lock()
+_figure_lock = threading.Lock()
+_figure = None
+
+
+def starmap_key(name, timestamp, days_past, days_future, fov, magnitude):
+    """
+    the hash of everything that determines the starmap image.
+    This runs in the request, so it only looks at the versions of the files (a stat), it never
+    downloads or parses the comets, MPCORB or the star catalog.
+    """
+    key = '|'.join([
+        name.strip(), timestamp.strftime('%Y-%m-%dT%H:%M'),
+        str(days_past), str(days_future), str(fov), str(magnitude),
+        str(comets.get_file_version()), str(mpcorb.get_file_version()), str(star_catalog.get_file_version()),
+    ])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def _cleanup_cache(root, keep):
+    # remove the least recently used images until the cache fits in STARMAP_CACHE_MAX_BYTES,
+    # but never the image that is just rendered (keep)
+    files = []
+    for entry in os.scandir(root):
+        if entry.is_file() and entry.name.endswith('.png') and entry.path != keep:
+            stat = entry.stat()
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in files) + os.path.getsize(keep)
+    for _, size, path in sorted(files):
+        if total <= STARMAP_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+def starmap_file(key):
+    """
+    the path and url of the cached starmap image
+    """
+    filename = key + '.png'
+    path = os.path.join(settings.MEDIA_ROOT, STARMAP_CACHE_DIR, filename)
+    image_url = os.path.join(settings.MEDIA_URL, STARMAP_CACHE_DIR, filename)
+    return path, image_url
+
+
+def get_cached_starmap(key):
+    """
+    the url of the cached starmap image, or None when it is not (yet) rendered
+    """
+    path, image_url = starmap_file(key)
+    try:
+        # mark it as recently used
+        os.utime(path)
+        return image_url
+    except OSError:
+        return None
+
+
+def render_cached_starmap(key, name, timestamp, days_past, days_future, fov, magnitude):
+    """
+    render the starmap into the cache and return its url
+    """
+    path, image_url = starmap_file(key)
+    root = os.path.dirname(path)
+    os.makedirs(root, exist_ok=True)
+
+    with atomic_path(path) as temp_file, _figure_lock:
+        render_starmap(name, timestamp, days_past, days_future, fov, magnitude, temp_file)
+
+    with _lock:
+        _cleanup_cache(root, path)
+
+    return image_url
+
 
 # /astrobase/starmap?name=C/2020%20F3%20(NEOWISE)&timestamp=2020-07-12T08:55:59Z
 def create_starmap(name, timestamp, days_past, days_future, fov, magnitude):
+    """
+    return the url of the starmap, which is only rendered when it is not in the cache
+    """
+    key = starmap_key(name, timestamp, days_past, days_future, fov, magnitude)
+    image_url = get_cached_starmap(key)
+    if image_url is None:
+        image_url = render_cached_starmap(key, name, timestamp, days_past, days_future, fov, magnitude)
+    return image_url
+
+
+def _get_figure():
+    # one figure per process, which is reused for every starmap instead of leaking a new one
+    global _figure
+    if _figure is None:
+        _figure = plt.figure(figsize=[12, 12])
+    _figure.clf()
+    return _figure
+
+
+def render_starmap(name, timestamp, days_past, days_future, fov, magnitude, path):
 
     # The comet is plotted on several dates `t_transient`.  But the stars only
     # need to be drawn once, so we take the middle comet date as the single
@@ -31,7 +144,7 @@ def create_starmap(name, timestamp, days_past, days_future, fov, magnitude):
         # then try asteroids
         d, transient = algorithms.get_asteroid(name, timestamp)
 
-    ts = load.timescale()
+    ts = kernels.get_timescale()
     t_timestamp = ts.utc(timestamp.year, timestamp.month, timestamp.day, timestamp.hour, timestamp.minute)
 
     t_transient = ts.utc(timestamp.year, timestamp.month, range(timestamp.day-days_past, timestamp.day+days_future))
@@ -39,28 +152,14 @@ def create_starmap(name, timestamp, days_past, days_future, fov, magnitude):
 
     # An ephemeris from the JPL provides Sun and Earth positions.
 
-    eph = load('de421.bsp')
+    eph = kernels.get_kernel('de421.bsp')
     earth = eph['earth']
 
-    # The Hipparcos mission provides our star catalog.
-
-    # with load.open(hipparcos.URL) as f:
-    with load.open(settings.MY_HIPPARCOS_URL) as f:
-        stars = hipparcos.load_dataframe(f)
-
-    # And the constellation outlines come from Stellarium.  We make a list
-    # of the stars at which each edge stars, and the star at which each edge
-    # ends.
-
-    url = ('https://raw.githubusercontent.com/Stellarium/stellarium/master'
-           '/skycultures/western_SnT/constellationship.fab')
+    # The Hipparcos mission provides our star catalog, and the constellation
+    # outlines come from Stellarium.  Both are preprocessed once into the
+    # star catalog, with the edges as pairs of row numbers in the star table.
 
-    with load.open(url) as f:
-        constellations = stellarium.parse_constellations(f)
-
-    edges = [edge for name, edges in constellations for edge in edges]
-    edges_star1 = [star1 for star1, star2 in edges]
-    edges_star2 = [star2 for star1, star2 in edges]
+    catalog = star_catalog.get_star_catalog()
 
     # We will center the chart on the comet's middle position.
 
@@ -72,11 +171,19 @@ def create_starmap(name, timestamp, days_past, days_future, fov, magnitude):
     field_of_view_degrees = float(fov)
     limiting_magnitude = magnitude
 
+    # Only the stars that can be drawn go through the astrometry: the bright
+    # stars in the cone that encloses the corners of the chart, and the stars
+    # of the constellation lines (with the edges as positions in `stars`).
+
+    radius = 2 * np.degrees(np.arctan(np.sqrt(2) * np.tan(np.radians(field_of_view_degrees / 4))))
+    rows, edges = star_catalog.select_stars(catalog, center.position.au, radius, limiting_magnitude)
+    stars = catalog['stars'][rows]
+
     # Now that we have constructed our projection, compute the x and y
     # coordinates that each star and the comet will have on the plot.
 
-    star_positions = earth.at(t).observe(Star.from_dataframe(stars))
-    stars['x'], stars['y'] = projection(star_positions)
+    star_positions = earth.at(t).observe(star_catalog.as_star(stars))
+    x, y = projection(star_positions)
 
     transient_x, transient_y = projection(earth.at(t_transient).observe(transient))
 
@@ -84,7 +191,7 @@ def create_starmap(name, timestamp, days_past, days_future, fov, magnitude):
     # included in our plot.  And go ahead and compute how large their
     # markers will be on the plot.
 
-    bright_stars = (stars.magnitude <= limiting_magnitude)
+    bright_stars = (stars['magnitude'] <= limiting_magnitude)
     magnitude = stars['magnitude'][bright_stars]
     marker_size = (0.5 + limiting_magnitude - magnitude) ** 2.0
 
@@ -92,13 +199,13 @@ def create_starmap(name, timestamp, days_past, days_future, fov, magnitude):
     # at the x,y of another.  We have to "rollaxis" the resulting coordinate
     # array into the shape that matplotlib expects.
 
-    xy1 = stars[['x', 'y']].loc[edges_star1].values
-    xy2 = stars[['x', 'y']].loc[edges_star2].values
-    lines_xy = np.rollaxis(np.array([xy1, xy2]), 1)
+    xy = np.column_stack([x, y])
+    lines_xy = np.rollaxis(np.array([xy[edges[:, 0]], xy[edges[:, 1]]]), 1)
 
     # Time to build the figure!
 
-    fig, ax = plt.subplots(figsize=[12, 12])
+    fig = _get_figure()
+    ax = fig.add_subplot()
 
     # Draw the constellation lines.
 
@@ -106,7 +213,7 @@ def create_starmap(name, timestamp, days_past, days_future, fov, magnitude):
 
     # Draw the stars.
 
-    ax.scatter(stars['x'][bright_stars], stars['y'][bright_stars],
+    ax.scatter(x[bright_stars], y[bright_stars],
                s=marker_size, color='k')
 
     # Draw the comet positions, and label them with dates.
@@ -138,11 +245,6 @@ def create_starmap(name, timestamp, days_past, days_future, fov, magnitude):
         t_transient[-1].utc_strftime('%d %B %Y'),
     ))
 
-    # Save.
-    filename = 'starmap.png'
-    path = os.path.join(settings.MEDIA_ROOT, filename)
-
-    fig.savefig(path, bbox_inches='tight')
-
-    image_url = os.path.join(settings.MEDIA_URL, filename)
-    return image_url
\ No newline at end of file
+    # Save, and free the drawing for the next starmap.
+    fig.savefig(path, format='png', bbox_inches='tight')
+    fig.clf()
\ No newline at end of file
@@ -1,3 +1,941 @@
-from django.test import TestCase
+import io
+import os
+import json
+import time
+import base64
+import shutil
+import tempfile
+import datetime
+import threading
+from concurrent.futures import Future
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.contrib.auth.models import Permission, User
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from skyfield.constants import GM_SUN_Pitjeva_2005_km3_s2 as GM_SUN
+from skyfield.data import mpc
+
+from .models import Asteroid
+from .services import render_queue, starmaps, comets, mpcorb, resolver, algorithms, chebyshev, ephemeris_cache, \
+    asteroid_ephemeris, kernels, sky_index, mpc_webservice, star_catalog
+
+# the files of the tests are written in TEST_ROOT, the settings of the test classes point into it
+TEST_ROOT = os.path.join(tempfile.gettempdir(), f'transients_app_tests_{os.getpid()}')
+
+
+def temp_path(*names):
+    return os.path.join(TEST_ROOT, *names)
+
+
+class TempRootMixin:
+    # every test starts with an empty TEST_ROOT, which is removed again afterwards
+
+    def setUp(self):
+        super().setUp()
+        shutil.rmtree(TEST_ROOT, ignore_errors=True)
+        os.makedirs(TEST_ROOT)
+        self.addCleanup(shutil.rmtree, TEST_ROOT, ignore_errors=True)
+
+
+@override_settings(MEDIA_ROOT=TEST_ROOT, MEDIA_URL='media/')
+class RenderQueueTest(TempRootMixin, SimpleTestCase):
+    # the status of a starmap job, as the web server processes see it through the job files
+
+    key = 'a' * 40
+
+    def test_invalid_job_is_unknown(self):
+        self.assertEqual(render_queue.get_status('../../etc/passwd')['status'], 'unknown')
+        self.assertEqual(render_queue.get_status(self.key)['status'], 'unknown')
+
+    def test_queued_then_done(self):
+        render_queue._write_job(self.key, {'status': 'queued'})
+        self.assertEqual(render_queue.get_status(self.key)['status'], 'queued')
+
+        future = Future()
+        future.set_result('url')
+        render_queue._finished(self.key, future)
+        self.assertFalse(os.path.exists(render_queue._job_file(self.key)))
+
+        from .services import starmaps
+        path, url = starmaps.starmap_file(self.key)
+        open(path, 'wb').close()
+        self.assertEqual(render_queue.get_status(self.key), {'job': self.key, 'status': 'done', 'url': url})
+
+    def test_failed(self):
+        # an OSError of the render (no hip_main.dat, no network) must fail the job, not leave it queued
+        for error in (FileNotFoundError('hip_main.dat'), MemoryError(), ConnectionError('no network')):
+            render_queue._write_job(self.key, {'status': 'queued'})
+            future = Future()
+            future.set_exception(error)
+            render_queue._finished(self.key, future)
+
+            status = render_queue.get_status(self.key)
+            self.assertEqual(status['status'], 'failed')
+            self.assertEqual(status['error'], str(error) or type(error).__name__)
+
+    def test_cancelled(self):
+        render_queue._write_job(self.key, {'status': 'queued'})
+        future = Future()
+        future.cancel()
+        render_queue._finished(self.key, future)
+        self.assertEqual(render_queue.get_status(self.key)['status'], 'failed')
+
+    def test_pool_is_replaced_before_python_311(self):
+        # python 3.10 has no max_tasks_per_child, the whole pool is replaced after WORKERS * TASKS_PER_WORKER jobs
+        with mock.patch.object(render_queue, '_pool', None), mock.patch.object(render_queue, '_submitted', 0), \
+                mock.patch.object(render_queue.sys, 'version_info', (3, 10)):
+            pool = render_queue._get_pool()
+            for _ in range(render_queue.WORKERS * render_queue.TASKS_PER_WORKER - 1):
+                self.assertIs(render_queue._get_pool(), pool)
+            new_pool = render_queue._get_pool()
+            self.assertIsNot(new_pool, pool)
+            new_pool.shutdown()
+
+
+@override_settings(MY_COMETS_ROOT=temp_path('comets.npz'), MY_MPCORB_ROOT=temp_path('MPCORB.DAT'),
+                   MY_ASTEROIDS_ROOT=temp_path('asteroids.txt'), MY_ASTEROIDS_URL='http://localhost:1/asteroids.txt',
+                   MY_STAR_CATALOG_ROOT=temp_path('star_catalog'))
+class StarmapKeyTest(TempRootMixin, SimpleTestCase):
+    # the key of a starmap is computed in the request, it may only look at the files
+
+    def key(self, fov=20):
+        return starmaps.starmap_key('(1) Ceres', datetime.datetime(2024, 5, 10, 12, 0), 5, 10, fov, 8)
+
+    def test_key_does_not_load_the_sources(self):
+        with mock.patch.object(comets, 'update_comet_snapshot') as download, \
+                mock.patch.object(mpcorb, '_load_orbits') as load_orbits:
+            key = self.key()
+            download.assert_not_called()
+            load_orbits.assert_not_called()
+
+        self.assertRegex(key, '^[0-9a-f]{40}$')
+        self.assertEqual(self.key(), key)
+        self.assertNotEqual(self.key(fov=30), key)
+
+    def test_key_changes_with_the_files(self):
+        key = self.key()
+        with open(temp_path('MPCORB.DAT'), 'w') as f:
+            f.write('new orbits')
+        self.assertNotEqual(self.key(), key)
+
+        key = self.key()
+        with open(temp_path('comets.npz'), 'w') as f:
+            f.write('new comets')
+        self.assertNotEqual(self.key(), key)
+
+
+class FindDesignationTest(SimpleTestCase):
+    # the name lookups of the MPCORB table, without parsing an MPCORB file
+
+    def setUp(self):
+        orbits = pd.DataFrame({
+            'designation': ['(1) Ceres', '(16) Psyche', '(3708) 1974 FV1', '2003 AB12', '2003 AB123'],
+            'designation_packed': ['00001', '00016', '03708', 'K03A12B', 'K03AC3B'],
+        }).set_index('designation', drop=False)
+
+        self.version = mock.patch.object(mpcorb, '_current_version', return_value='test')
+        self.version.start()
+        mpcorb.clear()
+        mpcorb._cache.update(version='test', orbits=orbits, names=mpcorb._build_names(orbits))
+
+    def tearDown(self):
+        self.version.stop()
+        mpcorb.clear()
+        resolver.clear()
+
+    def test_exact(self):
+        for name in ['(16) Psyche', '(16) psyche', ' (16) PSYCHE ', '16', '(16)', 'psyche', '00016']:
+            self.assertEqual(mpcorb.find_designation(name, exact=True), '(16) Psyche', name)
+
+        self.assertEqual(mpcorb.find_designation('1974 fv1', exact=True), '(3708) 1974 FV1')
+        self.assertEqual(mpcorb.find_designation('2003 ab12', exact=True), '2003 AB12')
+        self.assertEqual(mpcorb.find_designation('k03a12b', exact=True), '2003 AB12')
+        self.assertIsNone(mpcorb.find_designation('(16) Ceres', exact=True))
+        self.assertIsNone(mpcorb.find_designation('psy', exact=True))
+
+    def test_partial(self):
+        # a part of a designation only resolves when it is long enough and fits one asteroid
+        self.assertEqual(mpcorb.find_designation('psych'), '(16) Psyche')
+        self.assertEqual(mpcorb.find_designation('ab123'), '2003 AB123')
+        self.assertIsNone(mpcorb.find_designation('2003 ab1'))
+        self.assertIsNone(mpcorb.find_designation('cer'))
+        self.assertIsNone(mpcorb.find_designation('unknown'))
+
+        # the first and the last designation of the table, and a part that does not cross two designations
+        self.assertEqual(mpcorb.find_designation('(1) c'), '(1) Ceres')
+        self.assertEqual(mpcorb.find_designation('b123'), '2003 AB123')
+        self.assertIsNone(mpcorb.find_designation('ceres\n(16)'))
+
+    def test_select(self):
+        elements = {'designation': np.array(['(1) Ceres', '(16) Psyche', '(1) Ceres']), 'a': np.array([1.0, 2.0, 3.0])}
+        selection = asteroid_ephemeris.select(elements, ['(16) Psyche', 'unknown', '(1) Ceres'])
+        self.assertEqual(list(selection['designation']), ['(16) Psyche', 'unknown', '(1) Ceres'])
+        # the last one of a duplicate designation, like a dict of the designations
+        np.testing.assert_array_equal(selection['a'], [2.0, np.nan, 3.0])
+
+    def test_resolve(self):
+        with mock.patch.object(comets, 'get_version', return_value='test'), \
+                mock.patch.object(comets, 'get_comets', return_value={'designation': ['C/1995 O1 (Hale-Bopp)']}):
+            resolver.clear()
+            self.assertEqual(resolver.resolve('Psyche'), ('asteroid', '(16) Psyche'))
+            self.assertEqual(resolver.resolve('hale-bopp'), ('comet', 'C/1995 O1 (Hale-Bopp)'))
+            self.assertEqual(resolver.resolve('Mars')[0], 'planet')
+            with self.assertRaises(KeyError):
+                resolver.resolve('psych')
+
+
+@override_settings(MY_COMETS_ROOT=temp_path('comets.npz'))
+class CometDownloadTest(TempRootMixin, SimpleTestCase):
+    # without a snapshot and without network, only one request waits for the failing download
+
+    def setUp(self):
+        super().setUp()
+        comets._cache['retry_at'] = 0
+        resolver.clear()
+
+    def tearDown(self):
+        comets._cache['retry_at'] = 0
+        resolver.clear()
+
+    def test_failed_download_is_not_retried(self):
+        with mock.patch.object(comets.load, 'open', side_effect=ConnectionError('no network')) as download:
+            for _ in range(3):
+                with self.assertRaises(OSError):
+                    comets.get_comets()
+            self.assertEqual(download.call_count, 1)
+
+            # the asteroids and planets still resolve
+            with mock.patch.object(mpcorb, 'find_designation', return_value='(16) Psyche'):
+                self.assertEqual(resolver.resolve('psyche'), ('asteroid', '(16) Psyche'))
+                self.assertEqual(resolver.resolve('psyche'), ('asteroid', '(16) Psyche'))
+            self.assertEqual(download.call_count, 1)
+
+            # and it is tried again after the interval
+            comets._cache['retry_at'] = 0
+            with self.assertRaises(OSError):
+                comets.get_comets()
+            self.assertEqual(download.call_count, 2)
+
+
+# (hip, magnitude, ra, dec) of a few stars, two of them far away and one without a position
+HIPPARCOS_STARS = [
+    (1, 1.0, 10.0, 10.0),
+    (2, 5.0, 12.0, 11.0),
+    (3, 9.0, 11.0, 9.0),
+    (4, 2.0, 200.0, -30.0),
+    (5, 8.5, 201.0, -31.0),
+    (6, 7.0, None, None),
+]
+
+# lines between 1-2 and 4-5, the line to 99 has a star that is not in the catalog
+CONSTELLATIONS = 'Tst 3 1 2 4 5 5 99\n'
+
+
+def hipparcos_line(hip, magnitude, ra, dec):
+    # a line of hip_main.dat, with only the columns that skyfield reads
+    fields = [''] * 78
+    fields[0], fields[1], fields[5] = 'H', str(hip), str(magnitude)
+    if ra is not None:
+        fields[8], fields[9], fields[11], fields[12], fields[13] = str(ra), str(dec), '10.0', '1.0', '-1.0'
+    return '|'.join(fields) + '\n'
+
+
+@override_settings(MY_HIPPARCOS_ROOT=temp_path('hip_main.dat'),
+                   MY_CONSTELLATIONS_ROOT=temp_path('constellationship.fab'),
+                   MY_STAR_CATALOG_ROOT=temp_path('star_catalog'))
+class StarCatalogTest(TempRootMixin, SimpleTestCase):
+    # the star catalog is built by a management command, the starmaps only read it
+
+    def setUp(self):
+        super().setUp()
+        with open(settings.MY_HIPPARCOS_ROOT, 'w') as f:
+            f.writelines(hipparcos_line(*star) for star in HIPPARCOS_STARS)
+        with open(settings.MY_CONSTELLATIONS_ROOT, 'w') as f:
+            f.write(CONSTELLATIONS)
+        star_catalog._cache['catalog'] = None
+
+    def tearDown(self):
+        star_catalog._cache['catalog'] = None
+
+    def test_missing_catalog(self):
+        with mock.patch.object(star_catalog, 'build_star_catalog') as build:
+            with self.assertRaisesRegex(FileNotFoundError, 'manage.py build_star_catalog'):
+                star_catalog.get_star_catalog()
+            build.assert_not_called()
+        self.assertIsNone(star_catalog.get_file_version())
+
+    def test_build(self):
+        call_command('build_star_catalog', stdout=io.StringIO())
+        catalog = star_catalog.get_star_catalog()
+        self.assertIs(star_catalog.get_star_catalog(), catalog)
+
+        stars = catalog['stars']
+        self.assertEqual(list(stars['hip']), [1, 2, 3, 4, 5, 6])
+        self.assertEqual(list(stars['magnitude']), [1.0, 5.0, 9.0, 2.0, 8.5, 7.0])
+        self.assertEqual((stars['ra_degrees'][1], stars['dec_degrees'][1]), (12.0, 11.0))
+        self.assertEqual((stars['parallax_mas'][0], stars['ra_mas_per_year'][0], stars['dec_mas_per_year'][0]),
+                         (10.0, 1.0, -1.0))
+
+        # the unit vectors of the positions, NaN without a position
+        vectors = catalog['vectors']
+        np.testing.assert_allclose(np.linalg.norm(vectors[:5], axis=1), 1.0)
+        np.testing.assert_allclose(vectors[0], star_catalog.unit_vectors([10.0], [10.0])[0])
+        self.assertTrue(np.isnan(vectors[5]).all())
+
+        # the constellation lines as row numbers, without the line to the unknown star
+        self.assertEqual(catalog['edges'].tolist(), [[0, 1], [3, 4]])
+
+    def test_select_stars(self):
+        call_command('build_star_catalog', stdout=io.StringIO())
+        catalog = star_catalog.get_star_catalog()
+        center = star_catalog.unit_vectors([10.5], [10.0])[0]
+
+        # the bright stars in the cone, the faint star 3 and the far away stars 4 and 5 are not
+        lonely = dict(catalog, edges=np.zeros((0, 2), dtype='i4'))
+        rows, edges = star_catalog.select_stars(lonely, center, 3.0, 6.0)
+        self.assertEqual((rows.tolist(), edges.tolist()), ([0, 1], []))
+
+        rows, edges = star_catalog.select_stars(lonely, center, 3.0, 10.0)
+        self.assertEqual(rows.tolist(), [0, 1, 2])
+
+        # the stars of the constellation lines are always selected, and the lines point into the selection
+        rows, edges = star_catalog.select_stars(catalog, center, 3.0, 6.0)
+        self.assertEqual((rows.tolist(), edges.tolist()), ([0, 1, 3, 4], [[0, 1], [2, 3]]))
+        np.testing.assert_array_equal(rows[edges], catalog['edges'])
+
+        rows, edges = star_catalog.select_stars(catalog, center, 3.0, 10.0)
+        self.assertEqual((rows.tolist(), edges.tolist()), ([0, 1, 2, 3, 4], [[0, 1], [3, 4]]))
+
+        # the whole sky, also the star without a position
+        rows, edges = star_catalog.select_stars(catalog, center, 180.0, 10.0)
+        self.assertEqual(rows.tolist(), [0, 1, 2, 3, 4, 5])
+
+
+NAMES = {
+    'psyche': ('asteroid', '(16) Psyche'),
+    '16': ('asteroid', '(16) Psyche'),
+    'jupiter': ('planet', 'Jupiter'),
+}
+
+
+def fake_resolve(name):
+    try:
+        return NAMES[name.strip().lower()]
+    except KeyError:
+        raise KeyError(f"{name} is not a known bright moon, planet, comet or asteroid")
+
+
+def fake_track(designation, t):
+    # ra is the index of the epoch, dec the number of epochs in the call
+    n = len(t.tt)
+    return designation, np.arange(n, dtype=float), np.full(n, float(n)), np.full(n, np.nan)
+
+
+@mock.patch.object(algorithms.resolver, 'resolve', side_effect=fake_resolve)
+@mock.patch.dict(algorithms.TRACK_FUNCTIONS, {'asteroid': fake_track, 'planet': fake_track})
+@mock.patch.object(algorithms.chebyshev, 'interpolate_track', return_value=None)
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class EphemerisEndpointTest(TestCase):
+
+    def setUp(self):
+        # the batches are only calculated for users with the permission to add transients
+        user = User.objects.create_user('astronomer', password='secret')
+        user.user_permissions.add(Permission.objects.get(codename='add_transient'))
+        self.authorization = 'Basic ' + base64.b64encode(b'astronomer:secret').decode()
+
+    def post_batch(self, requests, **extra):
+        extra.setdefault('HTTP_AUTHORIZATION', self.authorization)
+        return self.client.post('/my_astrobase/ephemeris/batch/', {'requests': requests},
+                                content_type='application/json', **extra)
+
+    def test_batch_is_grouped_per_body(self, interpolate_track, resolve):
+        requests = [
+            {'name': 'Psyche', 'timestamp': '2025-09-01T22:00:00Z'},
+            {'name': '16', 'timestamp': '2025-09-02T22:00:00Z'},
+            {'name': 'psyche', 'timestamp': '2025-09-01T22:00:00Z'},
+            {'name': 'Jupiter', 'timestamp': '2025-09-01T22:00:00Z'},
+            {'name': 'Nowhere', 'timestamp': '2025-09-01T22:00:00Z'},
+            {'name': 'Psyche', 'timestamp': 'yesterday'},
+        ]
+        with mock.patch.object(algorithms, '_track', wraps=algorithms._track) as track:
+            response = self.post_batch(requests)
+            # three names of Psyche are one calculation over its two epochs
+            self.assertEqual(track.call_count, 2)
+
+        self.assertEqual(response.status_code, 200)
+        psyche, number, same_epoch, jupiter, unknown, invalid = response.json()
+
+        self.assertEqual([psyche['name'], number['name'], same_epoch['name']], ['Psyche', '16', 'psyche'])
+        self.assertEqual({psyche['designation'], number['designation']}, {'(16) Psyche'})
+        self.assertEqual(psyche['dec_decimal'], 2.0)
+        self.assertEqual(same_epoch['ra_decimal'], psyche['ra_decimal'])
+        self.assertNotEqual(number['ra_decimal'], psyche['ra_decimal'])
+        self.assertEqual(jupiter['body_type'], 'planet')
+        self.assertIn('not a known', unknown['error'])
+        self.assertIn('expected a name and a timestamp', invalid['error'])
+
+    def test_batch_maximum(self, interpolate_track, resolve):
+        requests = [{'name': 'Psyche', 'timestamp': '2025-09-01T22:00:00Z'}] * 3
+        with mock.patch.object(algorithms, 'MAX_BATCH_PAIRS', 2):
+            response = self.post_batch(requests)
+        self.assertEqual(response.status_code, 400)
+        resolve.assert_not_called()
+
+    def test_batch_needs_permission(self, interpolate_track, resolve):
+        requests = [{'name': 'Psyche', 'timestamp': '2025-09-01T22:00:00Z'}]
+        self.assertEqual(self.post_batch(requests, HTTP_AUTHORIZATION='').status_code, 401)
+
+        User.objects.create_user('visitor', password='secret')
+        authorization = 'Basic ' + base64.b64encode(b'visitor:secret').decode()
+        self.assertEqual(self.post_batch(requests, HTTP_AUTHORIZATION=authorization).status_code, 403)
+        resolve.assert_not_called()
+
+    def test_track(self, interpolate_track, resolve):
+        response = self.client.get('/my_astrobase/ephemeris/track/', {
+            'name': 'Psyche', 'start': '2025-09-01T00:00:00Z', 'stop': '2025-09-02T00:00:00Z',
+            'step': '1h', 'output': 'csv'})
+        self.assertEqual(response.status_code, 200)
+
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'name,designation,body_type,timestamp,ra_decimal,dec_decimal,visual_magnitude')
+        self.assertEqual(len(lines), 1 + 25)
+        self.assertEqual(lines[1], 'Psyche,(16) Psyche,asteroid,2025-09-01 00:00:00,0.0,25.0,')
+        self.assertEqual(lines[-1].split(',')[3], '2025-09-02 00:00:00')
+
+    def test_track_ndjson(self, interpolate_track, resolve):
+        response = self.client.get('/my_astrobase/ephemeris/track/', {
+            'name': 'Psyche', 'start': '2025-09-01T00:00:00Z', 'stop': '2025-09-01T01:00:00Z', 'step': '1.5m'})
+        self.assertEqual(response.status_code, 200)
+
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(rows), 41)
+        self.assertEqual(rows[1], {'name': 'Psyche', 'designation': '(16) Psyche', 'body_type': 'asteroid',
+                                   'timestamp': '2025-09-01 00:01:30', 'ra_decimal': 1.0, 'dec_decimal': 41.0,
+                                   'visual_magnitude': None})
+        self.assertEqual(rows[-1]['timestamp'], '2025-09-01 01:00:00')
+
+    def test_track_errors(self, interpolate_track, resolve):
+        params = {'name': 'Psyche', 'start': '2025-09-01T00:00:00Z', 'stop': '2025-09-02T00:00:00Z'}
+
+        response = self.client.get('/my_astrobase/ephemeris/track/', dict(params, step='0.5m'))
+        self.assertEqual(response.status_code, 400)
+
+        with mock.patch.object(algorithms, 'MAX_TRACK_POINTS', 10):
+            response = self.client.get('/my_astrobase/ephemeris/track/', dict(params, step='1h'))
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get('/my_astrobase/ephemeris/track/', dict(params, name='Nowhere', step='1h'))
+        self.assertEqual(response.status_code, 404)
+
+
+# the Chebyshev coefficients of Mars in the two segments of the test grid, shape (segments, degree+1, 4)
+MARS_COEFFICIENTS = np.array([[[1.0, 1.0, 0.5, 1.0], [0.5, -0.2, 0.1, 0.3]],
+                              [[2.0, 1.0, 0.4, 1.2], [0.3, 0.2, -0.1, 0.1]]])
+
+
+@override_settings(MY_EPHEMERIS_GRID_ROOT=temp_path('ephemeris_grid.npz'))
+class EphemerisGridTest(TempRootMixin, SimpleTestCase):
+    # the tracks and batches answer from the precomputed grid, and fall back to skyfield
+
+    def setUp(self):
+        super().setUp()
+        # two segments of 4 days with polynomials of degree 1 for (x, y, z, magnitude):
+        # Jupiter stands still at ra 90, dec 0 and 5 au, Mars moves
+        jupiter = np.array([[0, 5.0, 0, -2.0], [0, 0, 0, 0]])
+        np.savez_compressed(settings.MY_EPHEMERIS_GRID_ROOT, start=np.array('2025-09-01T00:00:00'),
+                            planet_names=np.array(['Jupiter', 'Mars']),
+                            planet_coefficients=np.array([[jupiter, jupiter], MARS_COEFFICIENTS]),
+                            planet_segment_days=np.array(4.0),
+                            asteroid_names=np.array(['(16) Psyche']),
+                            asteroid_coefficients=np.array([0, 0, 2.0, 11.0]).reshape(1, 1, 1, 4),
+                            asteroid_segment_days=np.array(16.0),
+                            mpcorb_version=np.array('v1'))
+
+        self.mpcorb_version = mock.patch.object(mpcorb, 'get_file_version', return_value='v1')
+        self.mpcorb_version.start()
+        chebyshev._cache['grid'] = None
+        ephemeris_cache.get_cache().clear()
+
+    def tearDown(self):
+        self.mpcorb_version.stop()
+        chebyshev._cache['grid'] = None
+        ephemeris_cache.get_cache().clear()
+
+    def test_interpolate(self):
+        position = chebyshev.interpolate('jupiter', datetime.datetime(2025, 9, 3, 12, 0, 30), 'planet')
+        self.assertEqual(position['designation'], 'Jupiter')
+        self.assertEqual(position['timestamp'], '2025-09-03 12:00:30')
+        self.assertAlmostEqual(position['ra_decimal'], 90.0)
+        self.assertAlmostEqual(position['dec_decimal'], 0.0)
+        self.assertAlmostEqual(position['distance_from_earth'], 5.0)
+        self.assertEqual(position['visual_magnitude'], -2.0)
+
+        # outside of the grid, and not a bright moon
+        self.assertIsNone(chebyshev.interpolate('Jupiter', datetime.datetime(2025, 9, 9, 12), 'planet'))
+        self.assertIsNone(chebyshev.interpolate('Jupiter', datetime.datetime(2025, 8, 31, 12), 'planet'))
+        self.assertIsNone(chebyshev.interpolate('Jupiter', datetime.datetime(2025, 9, 3), 'bright_moon'))
+
+    def test_asteroids_follow_the_mpcorb_version(self):
+        timestamp = datetime.datetime(2025, 9, 3, 12)
+        self.assertEqual(chebyshev.interpolate('psyche', timestamp, 'asteroid')['designation'], '(16) Psyche')
+
+        # a new MPCORB table, the asteroids are calculated with skyfield until the grid is built again
+        with mock.patch.object(mpcorb, 'get_file_version', return_value='v2'):
+            self.assertIsNone(chebyshev.interpolate('psyche', timestamp, 'asteroid'))
+            self.assertEqual(chebyshev.interpolate('Jupiter', timestamp, 'planet')['designation'], 'Jupiter')
+
+    def test_track(self):
+        start = datetime.datetime(2025, 9, 1)
+        timestamps = [datetime.datetime(2025, 9, 1, 6), datetime.datetime(2025, 9, 4, 23, 59),
+                      datetime.datetime(2025, 9, 5, 0, 30), datetime.datetime(2025, 9, 8, 18)]
+        track = algorithms.get_track('Mars', timestamps)
+        self.assertEqual([point['timestamp'] for point in track], [str(timestamp) for timestamp in timestamps])
+
+        # every point from the polynomial of its own segment
+        for point, timestamp in zip(track, timestamps):
+            days = (timestamp - start).total_seconds() / 86400.0
+            segment = int(days // 4.0)
+            x = 2.0 * (days - segment * 4.0) / 4.0 - 1.0
+            px, py, pz, magnitude = np.polynomial.chebyshev.chebval(x, MARS_COEFFICIENTS[segment])
+            self.assertEqual((point['designation'], point['body_type']), ('Mars', 'planet'))
+            self.assertAlmostEqual(point['ra_decimal'], np.degrees(np.arctan2(py, px)) % 360.0)
+            self.assertAlmostEqual(point['dec_decimal'], np.degrees(np.arcsin(pz / np.sqrt(px * px + py * py + pz * pz))))
+            self.assertAlmostEqual(point['visual_magnitude'], magnitude)
+
+    def test_track_falls_back_to_skyfield(self):
+        # one timestamp outside of the grid, all of them are calculated with skyfield
+        planet_track = mock.Mock(return_value=('Mars', np.array([1.0, 2.0]), np.array([3.0, 4.0]), np.nan))
+        with mock.patch.dict(algorithms.TRACK_FUNCTIONS, {'planet': planet_track}):
+            track = algorithms.get_track('Mars', [datetime.datetime(2025, 9, 8), datetime.datetime(2025, 9, 9)])
+        planet_track.assert_called_once()
+        self.assertEqual([(point['ra_decimal'], point['dec_decimal'], point['visual_magnitude']) for point in track],
+                         [(1.0, 3.0, None), (2.0, 4.0, None)])
+
+    def test_single_body_view_does_not_use_the_grid(self):
+        # the grid has no distance_from_sun and phase_angle, so the /planet/ view always answers with skyfield
+        with mock.patch.object(algorithms, 'get_planet', return_value=({'name': 'Jupiter'}, None)) as get_planet:
+            response = self.client.get('/my_astrobase/planet/', {'name': 'Jupiter',
+                                                                 'timestamp': '2025-09-03T12:00:00Z'})
+            self.assertEqual(response.json(), {'name': 'Jupiter'})
+            get_planet.assert_called_once()
+
+
+MPCORB_LINES = [
+    '00001    3.53  0.15 K20CH 205.54542   73.72487   80.27236   10.58790  0.0781685  0.21424210   2.7660891  0 MPC xxxxx  7283 120 1801-2021 0.51 M-v 30k Pan        0000      (1) Ceres              20210128',
+    '00016    6.06  0.15 K20CH  46.43564  229.08639  150.03697    3.09652  0.1337219  0.19716964   2.9235421  0 MPC xxxxx  3367  87 1852-2021 0.57 M-v 3Ek Pan        0000     (16) Psyche             20210318',
+    '00433   10.42  0.15 K20CH  23.04175  178.86894  304.29913   10.83052  0.2229939  0.55974867   1.4581672  0 MPC xxxxx  9296  51 1893-2021 0.46 M-v 3Ek Pan        1804    (433) Eros               20210306',
+]
+
+
+def mpcorb_line(line, packed=None, designation=None, absolute_magnitude=None):
+    # a copy of a MPCORB line with other columns
+    if packed is not None:
+        line = packed.ljust(7) + line[7:]
+    if absolute_magnitude is not None:
+        line = line[:8] + absolute_magnitude.rjust(5) + line[13:]
+    if designation is not None:
+        line = line[:166] + designation.ljust(28) + line[194:]
+    return line
+
+
+@override_settings(MY_ASTEROIDS_ROOT=temp_path('MPCORB.DAT'))
+class AsteroidTableTest(TempRootMixin, TestCase):
+    # the Asteroid table is filled in chunks from a MPCORB file
+
+    def setUp(self):
+        super().setUp()
+        with open(settings.MY_ASTEROIDS_ROOT, 'w') as f:
+            # the header of the full MPCORB.DAT
+            f.write('MPCORB.DAT: Minor Planet Center Orbit Database\n\n')
+            f.write('Des\'n     H     G   Epoch     M        Peri.      Node       Incl.       e\n')
+            f.write('-' * 202 + '\n')
+            f.write('\n'.join(MPCORB_LINES) + '\n\n')
+            f.write(mpcorb_line(MPCORB_LINES[2], packed='K10A12B', designation='2010 AB12') + '\n')
+            f.write(mpcorb_line(MPCORB_LINES[2], packed='K10A12C', designation='2010 AC12',
+                                absolute_magnitude='') + '\n')
+
+    def test_read_chunks(self):
+        chunks = list(algorithms.read_mpcorb_chunks(settings.MY_ASTEROIDS_ROOT, chunk_size=2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+
+        asteroids = [(asteroid.designation, asteroid.absolute_magnitude) for chunk in chunks for asteroid in chunk]
+        self.assertEqual(asteroids, [('(1) Ceres', 3.53), ('(16) Psyche', 6.06), ('(433) Eros', 10.42),
+                                     ('2010 AB12', 10.42), ('2010 AC12', None)])
+
+    def test_update_table(self):
+        Asteroid.objects.create(designation='(99942) Apophis', absolute_magnitude=19.09)
+
+        count, rate = algorithms.update_asteroid_table(chunk_size=2)
+        self.assertEqual(count, 5)
+        self.assertEqual(sorted(Asteroid.objects.values_list('designation', flat=True)),
+                         ['(1) Ceres', '(16) Psyche', '(433) Eros', '2010 AB12', '2010 AC12'])
+
+    def test_failed_update_keeps_the_table(self):
+        Asteroid.objects.create(designation='(99942) Apophis', absolute_magnitude=19.09)
+
+        bulk_create = Asteroid.objects.bulk_create
+        calls = []
+
+        def fail_on_second_chunk(chunk, **kwargs):
+            calls.append(len(chunk))
+            if len(calls) == 2:
+                raise IOError('disk full')
+            return bulk_create(chunk, **kwargs)
+
+        with mock.patch.object(Asteroid.objects, 'bulk_create', side_effect=fail_on_second_chunk):
+            with self.assertRaises(IOError):
+                algorithms.update_asteroid_table(chunk_size=2)
+
+        # the delete and the first chunk are rolled back
+        self.assertEqual(list(Asteroid.objects.values_list('designation', flat=True)), ['(99942) Apophis'])
+
+
+@override_settings(MY_MPCORB_ROOT=temp_path('MPCORB.DAT'), MPC_WEBSERVICE_CACHE_ROOT=temp_path('mpc_webservice'))
+@mock.patch.object(mpc_webservice, 'URL', 'http://127.0.0.1:8765/search_orbits')
+class MpcWebserviceTest(TempRootMixin, SimpleTestCase):
+    # the orbital elements come from MPCORB, or from the cached responses of the (stand-in) web service
+
+    def setUp(self):
+        super().setUp()
+        with open(settings.MY_MPCORB_ROOT, 'w') as f:
+            f.write('\n'.join(MPCORB_LINES) + '\n')
+        mpcorb.clear()
+
+    def tearDown(self):
+        mpcorb.clear()
+
+    def response(self, orbital_elements):
+        response = mock.Mock()
+        response.json.return_value = orbital_elements
+        return response
+
+    def wait_for_refresh(self, name):
+        for _ in range(500):
+            with mpc_webservice._lock:
+                if name not in mpc_webservice._refreshing:
+                    return
+            time.sleep(0.01)
+        self.fail(f'{name} is still refreshing')
+
+    @mock.patch.object(mpc_webservice.requests, 'get')
+    def test_local_mpcorb_first(self, get):
+        orbital_elements = mpc_webservice.get_orbital_elements('psyche')
+        get.assert_not_called()
+
+        self.assertEqual(len(orbital_elements), 1)
+        self.assertEqual(orbital_elements[0]['designation'], '(16) Psyche')
+        self.assertEqual(orbital_elements[0]['source'], 'mpcorb')
+        self.assertEqual(float(orbital_elements[0]['semimajor_axis']), 2.9235421)
+        self.assertEqual(orbital_elements[0]['last_opposition_used'], '2021')
+
+    @mock.patch.object(mpc_webservice.requests, 'get')
+    def test_web_service_is_cached(self, get):
+        get.return_value = self.response([{'designation': '2024 YR4', 'semimajor_axis': '2.516'}])
+
+        orbital_elements = mpc_webservice.get_orbital_elements('2024 YR4')
+        self.assertEqual(orbital_elements, [{'designation': '2024 YR4', 'semimajor_axis': '2.516'}])
+        # the stand-in of settings.MPC_WEBSERVICE_URL
+        get.assert_called_once()
+        self.assertEqual(get.call_args[0][0], 'http://127.0.0.1:8765/search_orbits')
+        self.assertEqual(get.call_args[0][1], {'name': '2024 YR4', 'json': 1})
+
+        # a fresh response is not asked again
+        self.assertEqual(mpc_webservice.get_orbital_elements('2024 YR4'), orbital_elements)
+        get.assert_called_once()
+
+        get.return_value = self.response([])
+        with self.assertRaises(KeyError):
+            mpc_webservice.get_orbital_elements('nowhere')
+
+    @mock.patch.object(mpc_webservice.requests, 'get')
+    def test_stale_while_revalidate(self, get):
+        mpc_webservice._write_cache('2024 YR4', [{'designation': '2024 YR4', 'semimajor_axis': 'old'}])
+        get.return_value = self.response([{'designation': '2024 YR4', 'semimajor_axis': 'new'}])
+
+        # a fresh response is served from the cache
+        self.assertEqual(mpc_webservice.get_orbital_elements('2024 YR4')[0]['semimajor_axis'], 'old')
+        get.assert_not_called()
+
+        # an expired one is still served, while the new one is fetched in the background
+        with mock.patch.object(mpc_webservice, 'TTL', -1):
+            self.assertEqual(mpc_webservice.get_orbital_elements('2024 YR4')[0]['semimajor_axis'], 'old')
+            self.wait_for_refresh('2024 YR4')
+        get.assert_called_once()
+        self.assertEqual(mpc_webservice.get_orbital_elements('2024 YR4')[0]['semimajor_axis'], 'new')
+
+        # a failing refresh keeps the expired response
+        get.side_effect = ConnectionError('no network')
+        with mock.patch.object(mpc_webservice, 'TTL', -1):
+            self.assertEqual(mpc_webservice.get_orbital_elements('2024 YR4')[0]['semimajor_axis'], 'new')
+            self.wait_for_refresh('2024 YR4')
+        self.assertEqual(mpc_webservice.get_orbital_elements('2024 YR4')[0]['semimajor_axis'], 'new')
+
+
+@override_settings(MY_MPCORB_ROOT=temp_path('MPCORB.DAT'))
+class AsteroidEphemerisTest(TempRootMixin, SimpleTestCase):
+    # the vectorized ephemeris against skyfield, for a few lines of MPCORB.DAT
+
+    def setUp(self):
+        super().setUp()
+        with open(settings.MY_MPCORB_ROOT, 'w') as f:
+            f.write('\n'.join(MPCORB_LINES) + '\n')
+        mpcorb.clear()
+        asteroid_ephemeris._cache['elements'] = None
+
+    def tearDown(self):
+        mpcorb.clear()
+        asteroid_ephemeris._cache['elements'] = None
+
+    def test_heliocentric_positions(self):
+        ts = kernels.get_timescale()
+        orbits = mpcorb.get_orbits()
+        elements = asteroid_ephemeris.get_elements()
+
+        for t in (ts.utc(2025, 9, 1, 22), ts.utc(2031, 2, 14, 3, 30)):
+            positions = asteroid_ephemeris.heliocentric_positions(elements, t.tt)
+            for i, (_, row) in enumerate(orbits.iterrows()):
+                expected = mpc.mpcorb_orbit(row, ts, GM_SUN).at(t).position.au
+                # 1e-9 au is 150 m
+                np.testing.assert_allclose(positions[:, i], expected, rtol=0, atol=1e-9)
+
+    @skipUnless(os.path.exists(os.path.join(settings.REPOSITORY_ROOT, 'de440s.bsp')), 'de440s.bsp is not available')
+    @override_settings(MY_EPHEMERIS_GRID_ROOT=temp_path('no_ephemeris_grid.npz'))
+    def test_track_matches_get_asteroid(self):
+        timestamps = [datetime.datetime(2025, 9, 1, 22, 0) + datetime.timedelta(hours=7 * i) for i in range(5)]
+        with mock.patch.object(resolver, 'resolve', return_value=('asteroid', '(16) Psyche')):
+            track = algorithms.get_track('Psyche', timestamps)
+
+        for point, timestamp in zip(track, timestamps):
+            expected, _ = algorithms.get_asteroid('(16) Psyche', timestamp)
+            self.assertEqual(point['designation'], expected['designation'])
+            self.assertAlmostEqual(point['ra_decimal'], float(expected['ra_decimal']), places=9)
+            self.assertAlmostEqual(point['dec_decimal'], float(expected['dec_decimal']), places=9)
+            self.assertAlmostEqual(point['visual_magnitude'], expected['visual_magnitude'], places=9)
+
+    @skipUnless(os.path.exists(os.path.join(settings.REPOSITORY_ROOT, 'de440s.bsp')), 'de440s.bsp is not available')
+    def test_validate(self):
+        result = asteroid_ephemeris.validate(datetime.datetime(2025, 9, 1, 22, 0), sample=3)
+        self.assertEqual([asteroid['designation'] for asteroid in result['asteroids']],
+                         ['(1) Ceres', '(16) Psyche', '(433) Eros'])
+        self.assertTrue(result['passed'], result)
+        for asteroid in result['asteroids']:
+            self.assertLess(abs(asteroid['magnitude_difference']), 0.01)
+
+
+@skipUnless(os.path.exists(os.path.join(settings.REPOSITORY_ROOT, 'de421.bsp')), 'de421.bsp is not available')
+@override_settings(MY_EPHEMERIS_GRID_ROOT=temp_path('no_ephemeris_grid.npz'))
+class PlanetTrackTest(SimpleTestCase):
+    # the vectorized track gives the same positions as get_planet for every timestamp
+
+    def test_track_matches_get_planet(self):
+        timestamps = [datetime.datetime(2025, 9, 1, 22, 0) + datetime.timedelta(hours=7 * i) for i in range(5)]
+        track = algorithms.get_track('Saturn', timestamps)
+
+        for point, timestamp in zip(track, timestamps):
+            expected, _ = algorithms.get_planet('Saturn', timestamp)
+            self.assertEqual(point['designation'], 'Saturn')
+            self.assertAlmostEqual(point['ra_decimal'], float(expected['ra_decimal']), places=9)
+            self.assertAlmostEqual(point['dec_decimal'], float(expected['dec_decimal']), places=9)
+            self.assertAlmostEqual(point['visual_magnitude'], float(expected['visual_magnitude']), places=9)
+
+
+class BrightestMagnitudeTest(SimpleTestCase):
+    # the cheap magnitude bound may drop an asteroid only when it can never reach the limit
+
+    def elements(self, a, e, H):
+        return {'a': np.array(a, dtype=float), 'e': np.array(e, dtype=float), 'H': np.array(H, dtype=float)}
+
+    def test_bound(self):
+        # Ceres: perihelion 2.55 au, at least 1.53 au from the Earth
+        elements = self.elements([2.7660891], [0.0781685], [3.53])
+        perihelion = 2.7660891 * (1 - 0.0781685)
+        expected = 3.53 + 5 * np.log10(perihelion * (perihelion - asteroid_ephemeris.EARTH_APHELION_AU))
+        self.assertAlmostEqual(asteroid_ephemeris.brightest_magnitude(elements)[0], expected)
+
+    def test_can_be_brighter(self):
+        elements = self.elements(
+            # main belt, bright          main belt, faint    earth crossing, faint    unknown H    hyperbolic
+            [2.7660891,                  2.7,                1.5,                     2.7,         -3.0],
+            [0.0781685,                  0.1,                0.5,                     0.1,         1.2],
+            [3.53,                       18.0,               25.0,                    np.nan,      20.0])
+        mask = asteroid_ephemeris.can_be_brighter(elements, 15.0)
+        self.assertEqual(mask.tolist(), [True, False, True, True, True])
+
+    def test_bound_is_never_brighter_than_the_orbit(self):
+        # the magnitude at zero phase angle along the orbit, with the Earth anywhere on its orbit, is never brighter
+        a, e, H = 1.4581672, 0.2229939, 10.42
+        anomaly = np.linspace(0, 2 * np.pi, 721)
+        distance_from_sun = a * (1 - e * np.cos(anomaly))
+        earth = np.linspace(asteroid_ephemeris.EARTH_PERIHELION_AU, asteroid_ephemeris.EARTH_APHELION_AU, 11)
+        distance_from_earth = np.abs(distance_from_sun[:, np.newaxis] - earth[np.newaxis, :])
+        magnitudes = H + 5 * np.log10(distance_from_sun[:, np.newaxis] * distance_from_earth)
+
+        bound = asteroid_ephemeris.brightest_magnitude(self.elements([a], [e], [H]))[0]
+        self.assertLessEqual(bound, magnitudes.min())
+
+
+class SkyIndexTest(SimpleTestCase):
+    # the cone and box queries of the spatial index against a brute force search
+
+    def setUp(self):
+        rng = np.random.default_rng(12)
+        n = 20000
+        # uniform on the sky, plus positions on the poles and around RA=0, and some NaN positions
+        ra = rng.uniform(0, 360, n)
+        dec = np.degrees(np.arcsin(rng.uniform(-1, 1, n)))
+        ra[:200] = rng.uniform(-1, 1, 200) % 360.0
+        dec[200:300] = rng.choice([-90.0, 90.0], 100)
+        ra[300:310] = np.nan
+        self.ra, self.dec = ra, dec
+        self.index = sky_index.SkyIndex(ra, dec)
+        self.rng = rng
+
+    def brute_cone(self, ra, dec, radius):
+        vectors = sky_index._unit_vectors(self.ra, self.dec)
+        center = sky_index._unit_vectors(np.array(ra, dtype=float), np.array(dec, dtype=float))
+        with np.errstate(invalid='ignore'):
+            return np.flatnonzero(center.dot(vectors) >= np.cos(np.radians(radius)))
+
+    def brute_box(self, ra_min, ra_max, dec_min, dec_max):
+        with np.errstate(invalid='ignore'):
+            inside = (self.dec >= dec_min) & (self.dec <= dec_max)
+            if ra_min <= ra_max:
+                inside &= (self.ra >= ra_min) & (self.ra <= ra_max)
+            else:
+                inside &= (self.ra >= ra_min) | (self.ra <= ra_max)
+        return np.flatnonzero(inside)
+
+    def check_queries(self):
+        cones = [(0.0, 0.0, 2.0), (359.5, 10.0, 3.0), (10.0, 89.0, 5.0), (200.0, -88.0, 3.0), (45.0, 30.0, 0.5),
+                 (120.0, 0.0, 120.0)]
+        cones += [(self.rng.uniform(0, 360), self.rng.uniform(-90, 90), self.rng.uniform(0.1, 20)) for _ in range(50)]
+        for ra, dec, radius in cones:
+            np.testing.assert_array_equal(self.index.query_cone(ra, dec, radius), self.brute_cone(ra, dec, radius),
+                                          err_msg=str((ra, dec, radius)))
+
+        boxes = [(350.0, 10.0, -5.0, 5.0), (0.0, 360.0, 80.0, 90.0), (100.0, 110.0, -90.0, -85.0),
+                 (359.0, 1.0, -90.0, 90.0), (20.0, 25.0, 10.0, 12.0)]
+        for ra_min, ra_max, dec_min, dec_max in boxes:
+            np.testing.assert_array_equal(self.index.query_box(ra_min, ra_max, dec_min, dec_max),
+                                          self.brute_box(ra_min, ra_max, dec_min, dec_max),
+                                          err_msg=str((ra_min, ra_max, dec_min, dec_max)))
+
+    def test_queries(self):
+        self.assertEqual(len(self.index), len(self.ra))
+        self.check_queries()
+
+    def test_update(self):
+        # move a part of the positions a little (most stay in their cell) and some far away
+        rows = np.arange(0, len(self.ra), 3)
+        self.ra[rows] = (self.ra[rows] + self.rng.normal(0, 0.5, len(rows))) % 360.0
+        self.dec[rows] = np.clip(self.dec[rows] + self.rng.normal(0, 0.5, len(rows)), -90, 90)
+        self.ra[1::50] = self.rng.uniform(0, 360, len(self.ra[1::50]))
+
+        self.index.update(self.ra[rows], self.dec[rows], rows)
+        self.index.update(self.ra[1::50], self.dec[1::50], np.arange(1, len(self.ra), 50))
+        self.check_queries()
+
+        # and all of them at once
+        self.ra = (self.ra + 10.0) % 360.0
+        self.index.update(self.ra, self.dec)
+        self.check_queries()
+
+
+@override_settings(MY_EPHEMERIS_GRID_ROOT=temp_path('no_ephemeris_grid.npz'))
+class EphemerisCacheTest(SimpleTestCase):
+    # the results of the ephemeris views are cached, and the ETag saves the client from downloading them again
+
+    params = {'name': 'Jupiter', 'timestamp': '2025-09-01T22:00:00Z'}
+
+    def setUp(self):
+        chebyshev._cache['grid'] = None
+        ephemeris_cache.get_cache().clear()
+
+    def tearDown(self):
+        ephemeris_cache.get_cache().clear()
+
+    def test_etag(self):
+        with mock.patch.object(algorithms, 'get_planet', return_value=({'name': 'Jupiter'}, None)) as get_planet:
+            response = self.client.get('/my_astrobase/planet/', self.params)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), {'name': 'Jupiter'})
+            self.assertEqual(response['Cache-Control'], f'public, max-age={ephemeris_cache.MAX_AGE}')
+            etag = response['ETag']
+
+            # the same result comes from the cache
+            response = self.client.get('/my_astrobase/planet/', self.params)
+            self.assertEqual((response.status_code, response['ETag']), (200, etag))
+
+            response = self.client.get('/my_astrobase/planet/', self.params, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual((response.status_code, response['ETag']), (304, etag))
+            self.assertEqual(get_planet.call_count, 1)
+
+            # another minute is another result
+            response = self.client.get('/my_astrobase/planet/', dict(self.params, timestamp='2025-09-01T22:01:00Z'),
+                                       HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+            self.assertEqual(get_planet.call_count, 2)
+
+            # 'now' is not kept long by the client
+            response = self.client.get('/my_astrobase/planet/', {'name': 'Jupiter'})
+            self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+
+    def test_new_catalog_version(self):
+        params = dict(self.params, name='Psyche')
+        with mock.patch.object(algorithms, 'get_asteroid', return_value=({'name': 'Psyche'}, None)), \
+                mock.patch.object(mpcorb, 'get_version', return_value='v1'):
+            etag = self.client.get('/my_astrobase/asteroid/', params)['ETag']
+
+        with mock.patch.object(algorithms, 'get_asteroid', return_value=({'name': 'Psyche'}, None)) as get_asteroid, \
+                mock.patch.object(mpcorb, 'get_version', return_value='v2'):
+            response = self.client.get('/my_astrobase/asteroid/', params, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+            get_asteroid.assert_called_once()
+
+
+class KernelRegistryTest(SimpleTestCase):
+    # every worker opens a kernel only once, and counts how often it is reused
+
+    def setUp(self):
+        kernels.clear()
+
+    def tearDown(self):
+        kernels.clear()
+
+    def counters(self, key):
+        return kernels.get_stats()['kernels'].get(key, {'hits': 0, 'misses': 0})
+
+    @mock.patch.object(kernels, 'load')
+    def test_kernel_is_shared(self, load):
+        load.side_effect = lambda path: mock.Mock(name=path)
+        before = self.counters('de421.bsp')
+
+        kernel = kernels.get_kernel('de421.bsp')
+        threads = [threading.Thread(target=kernels.get_kernel, args=('de421.bsp',)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertIs(kernels.get_kernel('de421.bsp'), kernel)
+        load.assert_called_once()
+        self.assertIn('de421.bsp', kernels.get_stats()['loaded'])
+
+        after = self.counters('de421.bsp')
+        self.assertEqual(after['misses'] - before['misses'], 1)
+        self.assertEqual(after['hits'] - before['hits'], 9)
+
+    @mock.patch.object(kernels, 'load')
+    def test_timescale_is_shared(self, load):
+        before = self.counters('timescale')
+        self.assertIs(kernels.get_timescale(), kernels.get_timescale())
+        load.timescale.assert_called_once()
+
+        after = self.counters('timescale')
+        self.assertEqual((after['misses'] - before['misses'], after['hits'] - before['hits']), (1, 1))
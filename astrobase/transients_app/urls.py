@@ -11,6 +11,12 @@ urlpatterns = [
      path('planet/', views.PlanetView.as_view(), name='planet'),
      path('bright_moon/', views.BrightMoonView.as_view(), name='bright_moon'),
 
+     # hit/miss counters of the ephemeris kernels loaded in this worker
+     path('ephemeris/kernels/', views.KernelsView.as_view(), name='ephemeris-kernels'),
+
+     # fit the Chebyshev ephemeris grid for a date range
+     path('ephemeris/precompute/', views.PrecomputeEphemeris.as_view(), name='ephemeris-precompute'),
+
      # get info about an asteroid by name
      path('asteroid/', views.AsteroidView.as_view(), name='asteroid'),
 
@@ -24,6 +30,21 @@ urlpatterns = [
      # add ra,dec to all asteroids in the asteroids table for <timestamp>
      path('update_asteroids_ephemeris/', views.UpdateAsteroidsEphemeris.as_view(), name='update_asteroids'),
 
+     # the positions of many (name, timestamp) pairs in one request
+     path('ephemeris/batch/', views.EphemerisBatch.as_view(), name='ephemeris-batch'),
+
+     # stream the positions of a body from start to stop as ndjson or csv
+     path('ephemeris/track/', views.EphemerisTrack.as_view(), name='ephemeris-track'),
+
+     # compare the vectorized asteroid ephemeris with skyfield
+     path('ephemeris/validate/', views.ValidateAsteroidsEphemeris.as_view(), name='ephemeris-validate'),
+
+     # download a fresh snapshot of the comet elements from the Minor Planet Center
+     path('update_comets/', views.UpdateComets.as_view(), name='update_comets'),
+
      path('starmap/', views.StarMap.as_view(), name='starmap-view'),
+
+     # the status of a starmap that is rendered in the background
+     path('starmap/status/', views.StarMapStatus.as_view(), name='starmap-status'),
 ]
 urlpatterns = format_suffix_patterns(urlpatterns)
\ No newline at end of file
@@ -1,13 +1,18 @@
 
 from rest_framework.response import Response
+from django.http import StreamingHttpResponse
+from django.urls import reverse
 from rest_framework import generics, pagination
 from django_filters import rest_framework as filters
 
 from .serializers import TransientSerializer, MinorPlanetSerializer, AsteroidSerializer
 import datetime
+import json
+import csv
+import numpy as np
 
 from .models import Transient,Asteroid
-from .services import algorithms, starmaps
+from .services import algorithms, kernels, comets, chebyshev, asteroid_ephemeris, ephemeris_cache, render_queue
 
 # example: /my_astrobase/dataproducts?status__in=created,archived
 class AsteroidFilter(filters.FilterSet):
@@ -71,6 +76,30 @@ class MinorPlanetsView(generics.ListAPIView):
         return Response(my_transients)
 
 
+def cached_ephemeris_response(request, body_type, name, timestamp, function):
+    """
+    the result of function(name, timestamp), cached per body type (view), name, timestamp and catalog version.
+    The cache key is also the ETag, a matching If-None-Match gets a 304 without calculating anything.
+    """
+    key = ephemeris_cache.make_key(body_type, name, timestamp)
+    etag = '"' + key.split(':')[1] + '"'
+
+    def compute():
+        # always the full skyfield result, the ephemeris grid only answers the tracks and batches
+        return function(name, timestamp)[0]
+
+    if request.headers.get('If-None-Match') == etag:
+        response = Response(status=304)
+    else:
+        response = Response(ephemeris_cache.get_or_compute(key, compute))
+
+    # without a timestamp the result is for 'now', which should not be kept long by the client
+    max_age = ephemeris_cache.MAX_AGE if 'timestamp' in request.query_params else 60
+    response['ETag'] = etag
+    response['Cache-Control'] = f'public, max-age={max_age}'
+    return response
+
+
 # http://localhost:8000/my_astrobase/comet/?name=C/2020%20F3%20(NEOWISE)&timestamp=2020-07-12T08:55:59Z
 class CometView(generics.ListAPIView):
     model = Transient
@@ -93,12 +122,7 @@ class CometView(generics.ListAPIView):
 
         print(timestamp)
         # call to the business logic that returns a list of moonphase
-        my_comet,_ = algorithms.get_comet(name,timestamp)
-
-        # serializer = MinorPlanetSerializer(instance=my_transients, many=True)
-        # data = {'minor_planets' : serializer.data}
-        # return Response(serializer.data)
-        return Response(my_comet)
+        return cached_ephemeris_response(request, 'comet', name, timestamp, algorithms.get_comet)
 
 # http://localhost:8000/my_astrobase/asteroid/?name=psyche&timestamp=2021-01-12T20:55:59Z
 class AsteroidView(generics.ListAPIView):
@@ -121,9 +145,7 @@ class AsteroidView(generics.ListAPIView):
             timestamp = datetime.datetime.now()
 
          # call to the business logic that returns a list of moonphase
-        my_asteroid,_ = algorithms.get_asteroid(name,timestamp)
-
-        return Response(my_asteroid)
+        return cached_ephemeris_response(request, 'asteroid', name, timestamp, algorithms.get_asteroid)
 
 
 class PlanetView(generics.ListAPIView):
@@ -146,9 +168,7 @@ class PlanetView(generics.ListAPIView):
             timestamp = datetime.datetime.now()
 
          # call to the business logic that returns a list of moonphase
-        my_planet,_ = algorithms.get_planet(name,timestamp)
-
-        return Response(my_planet)
+        return cached_ephemeris_response(request, 'planet', name, timestamp, algorithms.get_planet)
 
 
 class BrightMoonView(generics.ListAPIView):
@@ -171,9 +191,17 @@ class BrightMoonView(generics.ListAPIView):
             timestamp = datetime.datetime.now()
 
          # call to the business logic that returns a list of moonphase
-        my_planet,_ = algorithms.get_bright_moon(name,timestamp)
+        return cached_ephemeris_response(request, 'bright_moon', name, timestamp, algorithms.get_bright_moon)
 
-        return Response(my_planet)
+
+# http://localhost:8000/my_astrobase/ephemeris/kernels/
+class KernelsView(generics.ListAPIView):
+    model = Transient
+    queryset = Transient.objects.all()
+
+    # show which ephemeris kernels are loaded in this worker, and how often they were reused
+    def list(self, request):
+        return Response(kernels.get_stats())
 
 
 class UpdateAsteroids(generics.ListAPIView):
@@ -184,9 +212,43 @@ class UpdateAsteroids(generics.ListAPIView):
     def list(self, request):
 
          # call to the business logic that returns a list of moonphase
-        algorithms.update_asteroid_table()
-        count = Asteroid.objects.all().count()
-        return Response({str(count)+" asteroids updated"})
+        count, rate = algorithms.update_asteroid_table()
+        return Response({str(count)+" asteroids updated ("+str(int(rate))+" rows/s)"})
+
+
+class UpdateComets(generics.ListAPIView):
+    model = Transient
+    queryset = Transient.objects.all()
+
+    # override the list method to be able to plug in my transient business logic
+    def list(self, request):
+
+         # download a fresh snapshot of the comet elements from the Minor Planet Center
+        count = comets.update_comet_snapshot()
+        return Response({str(count)+" comets updated"})
+
+
+# http://localhost:8000/my_astrobase/ephemeris/precompute/?timestamp=2025-09-01T00:00:00Z&days=90
+class PrecomputeEphemeris(generics.ListAPIView):
+    model = Transient
+    queryset = Transient.objects.all()
+
+    # override the list method to be able to plug in my transient business logic
+    def list(self, request):
+        try:
+            s = self.request.query_params['timestamp']
+            start = datetime.datetime.strptime(s, algorithms.DJANGO_TIME_FORMAT)
+        except:
+            start = datetime.datetime.now() - datetime.timedelta(days=7)
+
+        try:
+            days = int(self.request.query_params['days'])
+        except:
+            days = 90
+
+        # fit the Chebyshev ephemeris grid of planets, bright moons and asteroids
+        count = chebyshev.build_grid(start, start + datetime.timedelta(days=days))
+        return Response({str(count)+" bodies precomputed from "+str(start)+" for "+str(days)+" days"})
 
 
 class UpdateAsteroidsEphemeris(generics.ListAPIView):
@@ -208,6 +270,164 @@ class UpdateAsteroidsEphemeris(generics.ListAPIView):
         return Response({str(count)+" asteroids updated"})
 
 
+# http://localhost:8000/my_astrobase/ephemeris/validate/?timestamp=2025-09-01T22:00:00Z&sample=20
+class ValidateAsteroidsEphemeris(generics.ListAPIView):
+    model = Asteroid
+    queryset = Asteroid.objects.all()
+
+    # override the list method to be able to plug in my transient business logic
+    def list(self, request):
+        try:
+            s = self.request.query_params['timestamp']
+            timestamp = datetime.datetime.strptime(s, algorithms.DJANGO_TIME_FORMAT)
+        except:
+            timestamp = datetime.datetime.now()
+
+        try:
+            sample = int(self.request.query_params['sample'])
+        except:
+            sample = 20
+
+        try:
+            tolerance = float(self.request.query_params['tolerance'])
+        except:
+            tolerance = asteroid_ephemeris.TOLERANCE
+
+        # compare the vectorized ephemeris with skyfield for a sample of the MPCORB table
+        result = asteroid_ephemeris.validate(timestamp, sample=sample, tolerance=tolerance)
+        return Response(result)
+
+
+# POST http://localhost:8000/my_astrobase/ephemeris/batch/
+# {"requests": [{"name": "Jupiter", "timestamp": "2025-09-01T22:00:00Z"},
+#               {"name": "Psyche", "timestamp": "2025-09-01T22:00:00Z"}, ...]}
+class EphemerisBatch(generics.GenericAPIView):
+    model = Transient
+    queryset = Transient.objects.all()
+
+    # a batch of calculations is a POST, so it needs a user with the (default) permission to add transients
+    def post(self, request):
+        data = request.data
+        if isinstance(data, dict):
+            data = data.get('requests', [])
+
+        if len(data) > algorithms.MAX_BATCH_PAIRS:
+            return Response({'error': f'{len(data)} requests, the maximum is {algorithms.MAX_BATCH_PAIRS}'},
+                            status=400)
+
+        pairs = []
+        errors = {}
+        for i, item in enumerate(data):
+            try:
+                name = str(item['name'])
+                timestamp = datetime.datetime.strptime(item['timestamp'], algorithms.DJANGO_TIME_FORMAT)
+                pairs.append((name, timestamp))
+            except Exception:
+                errors[i] = {'request': item, 'error': 'expected a name and a timestamp like 2025-09-01T22:00:00Z'}
+
+        # all the pairs are calculated together, grouped per body
+        results = iter(algorithms.get_ephemeris_batch(pairs))
+        response = [errors[i] if i in errors else next(results) for i in range(len(data))]
+        return Response(response)
+
+
+def parse_step(s):
+    # '15m', '2h', '1d' or a number of minutes
+    units = {'m': 'minutes', 'h': 'hours', 'd': 'days'}
+    s = s.strip().lower()
+    if s[-1] in units:
+        return datetime.timedelta(**{units[s[-1]]: float(s[:-1])})
+    return datetime.timedelta(minutes=float(s))
+
+
+class Echo:
+    # a file-like object for csv.writer that just returns the line
+    def write(self, value):
+        return value
+
+
+def _track_values(chunk, missing):
+    # the columns of a chunk of a track as strings, NaN as missing
+    columns = []
+    for column in ('ra_decimal', 'dec_decimal', 'visual_magnitude'):
+        values = chunk[column].astype(str)
+        values[np.isnan(chunk[column])] = missing
+        columns.append(values)
+    return zip(chunk['timestamp'], *columns)
+
+
+def track_as_csv(chunks):
+    writer = csv.writer(Echo())
+    columns = ['name', 'designation', 'body_type', 'timestamp', 'ra_decimal', 'dec_decimal', 'visual_magnitude']
+    yield writer.writerow(columns)
+    for chunk in chunks:
+        # the name, designation and body type are the same for the whole chunk
+        prefix = writer.writerow([chunk['name'], chunk['designation'], chunk['body_type']]).rstrip('\r\n')
+        yield ''.join(f'{prefix},{",".join(values)}\r\n' for values in _track_values(chunk, ''))
+
+
+def track_as_ndjson(chunks):
+    for chunk in chunks:
+        prefix = json.dumps({key: chunk[key] for key in ('name', 'designation', 'body_type')})[:-1]
+        yield ''.join(f'{prefix}, "timestamp": "{timestamp}", "ra_decimal": {ra}, "dec_decimal": {dec}, '
+                      f'"visual_magnitude": {magnitude}}}\n'
+                      for timestamp, ra, dec, magnitude in _track_values(chunk, 'null'))
+
+
+# http://localhost:8000/my_astrobase/ephemeris/track/?name=Psyche&start=2025-09-01T00:00:00Z&stop=2025-12-01T00:00:00Z&step=1h&output=csv
+class EphemerisTrack(generics.ListAPIView):
+    model = Transient
+    queryset = Transient.objects.all()
+
+    # override the list method to be able to plug in my transient business logic
+    def list(self, request):
+        try:
+            name = self.request.query_params['name']
+        except:
+            name = "Psyche"
+
+        try:
+            s = self.request.query_params['start']
+            start = datetime.datetime.strptime(s, algorithms.DJANGO_TIME_FORMAT)
+        except:
+            start = datetime.datetime.now().replace(second=0, microsecond=0)
+
+        try:
+            s = self.request.query_params['stop']
+            stop = datetime.datetime.strptime(s, algorithms.DJANGO_TIME_FORMAT)
+        except:
+            stop = start + datetime.timedelta(days=30)
+
+        try:
+            step = parse_step(self.request.query_params['step'])
+        except:
+            step = datetime.timedelta(days=1)
+
+        # 'format' is taken by the rest framework
+        output = self.request.query_params.get('output', 'ndjson')
+
+        if step.total_seconds() < 60 or stop < start:
+            return Response({'error': 'step must be at least 1 minute, and stop after start'}, status=400)
+
+        points = int((stop - start).total_seconds() // step.total_seconds()) + 1
+        if points > algorithms.MAX_TRACK_POINTS:
+            return Response({'error': f'{points} positions requested, the maximum is {algorithms.MAX_TRACK_POINTS}'},
+                            status=400)
+
+        try:
+            chunks = algorithms.iter_track(name, start, stop, step)
+        except KeyError as e:
+            return Response({'error': str(e.args[0])}, status=404)
+
+        # the positions are calculated in chunks while they are streamed to the client
+        if output == 'csv':
+            response = StreamingHttpResponse(track_as_csv(chunks), content_type='text/csv')
+            response['Content-Disposition'] = 'attachment; filename="track.csv"'
+        else:
+            response = StreamingHttpResponse(track_as_ndjson(chunks), content_type='application/x-ndjson')
+        return response
+
+
 # http://localhost:8000/my_astrobase/starmap/?name=Psyche&timestamp=2021-02-23T22:55:59Z
 
 class StarMap(generics.ListAPIView):
@@ -247,9 +467,10 @@ class StarMap(generics.ListAPIView):
         except:
             magnitude = 8
 
-        # result = "jobs can only be executed by authenticated users"
-        # if self.request.user.is_superuser:
-        url = starmaps.create_starmap(name, timestamp, days_past, days_future, fov, magnitude)
+        # the starmap is rendered in the background, poll the status_url until the status is 'done'
+        job = render_queue.submit_starmap(name, timestamp, days_past, days_future, fov, magnitude)
+        status = render_queue.get_status(job)
+        status_url = request.build_absolute_uri(reverse('transients_app:starmap-status')) + '?job=' + job
 
         # return a response
 
@@ -260,5 +481,23 @@ class StarMap(generics.ListAPIView):
             'days_future': days_future,
             'fov': fov,
             'magnitude': magnitude,
-            'url' : url
-        })
\ No newline at end of file
+            'job': job,
+            'status': status['status'],
+            'status_url': status_url,
+            'url' : status.get('url')
+        })
+
+
+# http://localhost:8000/my_astrobase/starmap/status/?job=da5a9fc7f65208367d5bfa7caa575e2a0f56066f
+
+class StarMapStatus(generics.ListAPIView):
+
+    queryset = Asteroid.objects.all()
+
+    def list(self, request, *args, **kwargs):
+        try:
+            job = self.request.query_params['job']
+        except:
+            return Response({'error': 'job is required'}, status=400)
+
+        return Response(render_queue.get_status(job))
\ No newline at end of file